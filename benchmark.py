@@ -0,0 +1,448 @@
+"""
+Throughput benchmarks against the stand-in server, and of decoding what it sends
+
+Run e.g. `python benchmark.py protocol --requests 5000`
+"""
+import argparse
+import asyncio
+import time
+import typing as T
+
+import numpy as np
+
+from command import AsyncCommandClient
+from command import BUTTONS
+from command import CommandClient
+from memmap import MemoryMap
+from standin import StandInServer
+from traces import Trace
+from traces import load_trace
+from traces import synthetic_trace
+
+
+def get_trace(args: argparse.Namespace) -> Trace:
+    if args.trace:
+        return load_trace(args.trace)
+    print("No --trace given, using a synthetic one")
+    return synthetic_trace(args.requests)
+
+
+def env_actions(trace: Trace) -> T.List[int]:
+    """
+    The recorded buttons as environment actions, the first of ActionRanges that
+    presses each
+    """
+    from reward import ActionRanges
+
+    first_action: T.Dict[str, int] = {}
+    for action in range(31):
+        first_action.setdefault(ActionRanges.get_button(action), action)
+    return [first_action[BUTTONS[button]] for button in trace.actions]
+
+
+def start_server(args: argparse.Namespace, trace: Trace = None) -> StandInServer:
+    """
+    Stand-in on a free port with the latency options from the command line
+    """
+    return StandInServer(
+        port=0, trace=trace, latency=args.latency, jitter=args.jitter, frame_rate=args.frame_rate, seed=0
+    ).start_in_thread()
+
+
+def report(label: str, count: int, elapsed: float, nbytes: int = 0) -> None:
+    line = f"{label:<32} {count / elapsed:>10.1f} req/s {elapsed / count * 1e6:>9.1f} us/req"
+    if nbytes:
+        line += f" {nbytes / elapsed / 1e6:>8.2f} MB/s"
+    print(line)
+
+
+def bench_protocol(args: argparse.Namespace) -> None:
+    """
+    Round trips of the framed protocol for small and WRAM sized replies
+    """
+    server = start_server(args)
+    client = CommandClient("localhost", server.port)
+
+    for label, cmd in (("checksum", b"checksum"), ("dump_wram", b"dump_wram")):
+        for _ in range(min(100, args.requests)):
+            client.request(cmd)  # warm up
+        nbytes = 0
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            nbytes += len(client.request(cmd))
+        report(label, args.requests, time.perf_counter() - start, nbytes)
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        client.dispatch("A")
+    report("button (press + clear)", args.requests, time.perf_counter() - start)
+
+    client._disconnect()
+    server.stop()
+
+
+def bench_step(args: argparse.Namespace) -> None:
+    """
+    Old per-phase round trips (press + clear, twice for directions, then dump_wram)
+    against the compound step command
+    """
+    server = start_server(args)
+    client = CommandClient("localhost", server.port)
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        client.dispatch("U")
+        client.dispatch("U")
+        client.do_data_command(b"dump_wram")
+    report("dispatch x2 + dump_wram", args.requests, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        client.step("U")
+    report("step", args.requests, time.perf_counter() - start)
+
+    client._disconnect()
+    server.stop()
+
+
+def bench_regions(args: argparse.Namespace) -> None:
+    """
+    Bytes and round trip time per read for full dumps against the MemoryMap read plan
+    """
+    server = start_server(args)
+    client = CommandClient("localhost", server.port)
+    plan = MemoryMap.read_plan()
+    print(plan)
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        client.do_data_command(b"dump_wram")
+    report("dump_wram (8192 B/step)", args.requests, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        client.read_ranges(plan)
+    report(f"read_ranges ({plan.nbytes} B/step)", args.requests, time.perf_counter() - start)
+
+    client._disconnect()
+    server.stop()
+
+
+def read_every_field(mmap: MemoryMap) -> None:
+    """
+    Read every field of every entity, which is what actually decodes them now that
+    entities are lazy views over WRAM
+    """
+    for slot in MemoryMap.LAYOUT:
+        entities = getattr(mmap, slot.attr)
+        for entity in entities if slot.count > 1 else [entities]:
+            entity.values()
+
+
+def bench_decode(args: argparse.Namespace) -> None:
+    """
+    Time to decode each entity out of a WRAM snapshot and read all of its fields,
+    and the same for a whole MemoryMap
+    """
+    wram = get_trace(args).snapshots[-1].tobytes()
+    for slot in MemoryMap.LAYOUT:
+        start_addr = slot.addr - MemoryMap.REGION_START_ADDR
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            slot.model_klass.hydrate_from_memory(wram, start_addr).values()
+        report(slot.model_klass.__name__, args.requests, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        read_every_field(MemoryMap.hydrate_from_memory(wram))
+    report("MemoryMap + values()", args.requests, time.perf_counter() - start)
+
+    # what a step reads: the fields behind the reduced observation
+    from spaces import populate_reduced_space_from_mmap
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        populate_reduced_space_from_mmap(MemoryMap.hydrate_from_memory(wram))
+    report("MemoryMap + observation", args.requests, time.perf_counter() - start)
+
+
+def bench_batch(args: argparse.Namespace) -> None:
+    """
+    Decoding every field of every entity for a stack of snapshots, one MemoryMap
+    at a time against MemoryMap.decode_batch
+    """
+    snapshots = get_trace(args).snapshots
+
+    start = time.perf_counter()
+    for snapshot in snapshots:
+        read_every_field(MemoryMap.hydrate_from_memory(snapshot.tobytes()))
+    report("per snapshot (hydrate + values)", len(snapshots), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    columns = MemoryMap.decode_batch(snapshots)
+    # touch every column so lazily strided views are actually read
+    for fields in columns.values():
+        for column in fields.values():
+            column.sum()
+    report("decode_batch", len(snapshots), time.perf_counter() - start)
+
+
+def bench_observation(args: argparse.Namespace) -> None:
+    """
+    Observation encoding per step: the reduced space, and every scalar field as
+    a flat bit vector and as a dict of views
+    """
+    from spaces import observation_encoder
+    from spaces import populate_reduced_space_from_mmap
+    from spaces import populate_space_from_mmap
+
+    trace = get_trace(args)
+    mmaps = [MemoryMap(snapshot.tobytes()) for snapshot in trace.snapshots]
+    encoder = observation_encoder()
+    flat = np.zeros(encoder.size, dtype=np.uint8)
+    for label, encode in (
+        ("reduced", populate_reduced_space_from_mmap),
+        (f"flat ({encoder.size} bits)", lambda mmap: encoder.encode(mmap, out=flat)),
+        ("flat as dict", populate_space_from_mmap),
+    ):
+        start = time.perf_counter()
+        for mmap in mmaps:
+            encode(mmap)
+        report(label, len(mmaps), time.perf_counter() - start)
+
+
+def bench_memo(args: argparse.Namespace) -> None:
+    """
+    BlueEnvironment stepping through a trace with and without memoizing
+    observations and rewards on the WRAM content, and how often the caches hit
+    """
+    import contextlib
+    import io
+    from environment import BlueEnvironment
+
+    trace = get_trace(args)
+    actions = env_actions(trace)
+    for cache_size in (0, 256):
+        server = start_server(args, trace=trace)
+        env = BlueEnvironment(port=server.port, cache_size=cache_size)
+        env.reset()
+        # the triggers print as they fire
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for action in actions:
+                env.step(action)
+            elapsed = time.perf_counter() - start
+        report(f"BlueEnvironment cache_size={cache_size}", len(actions), elapsed)
+        for name, stats in env.cache_stats().items():
+            print(f"  {name:<12} {stats['hits']} hits {stats['misses']} misses {stats['hit_rate']:.1%}")
+        env.close()
+        server.stop()
+
+
+def bench_reset(args: argparse.Namespace) -> None:
+    """
+    Resets per second of BlueEnvironment, carrying on from the current state against
+    loading a savestate from a pool of start states
+    """
+    import contextlib
+    import io
+    from environment import BlueEnvironment
+    from startstates import StartStatePool
+
+    trace = get_trace(args)
+    server = start_server(args, trace=trace)
+
+    # start states a few steps apart along the trace
+    client = CommandClient("localhost", server.port)
+    pool = StartStatePool()
+    for idx in range(4):
+        for action in trace.actions[idx * 10:(idx + 1) * 10]:
+            client.step(BUTTONS[action])
+        pool.capture(client, f"state{idx}", weight=idx + 1)
+    client._disconnect()
+    print(pool)
+
+    for label, start_states in (("reset (read WRAM)", None), ("reset (load_state)", pool)):
+        env = BlueEnvironment(port=server.port, start_states=start_states)
+        starts = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for seed in range(args.requests):
+                _observation, info = env.reset(seed=seed)
+                name = info.get("start_state")
+                starts[name] = starts.get(name, 0) + 1
+            elapsed = time.perf_counter() - start
+        report(label, args.requests, elapsed)
+        if start_states is not None:
+            print("  " + ", ".join(f"{name}: {count}" for name, count in sorted(starts.items())))
+        env.close()
+    server.stop()
+
+
+def bench_settle(args: argparse.Namespace) -> None:
+    """
+    Frames per step and step rate playing back a trace with a fixed settle against
+    settling adaptively on MemoryMap.SETTLE_WATCH, capped at the same number of
+    frames. Steps run at --frame-rate, 60 if not given.
+    """
+    from command import DEFAULT_HOLD_FRAMES
+    from command import DEFAULT_SETTLE_FRAMES
+    from command import FRAME_RATE
+
+    args.frame_rate = args.frame_rate or FRAME_RATE
+    trace = get_trace(args)
+    plan = MemoryMap.read_plan()
+    buttons = [BUTTONS[action] for action in trace.actions][:args.requests]
+
+    for adaptive in (False, True):
+        server = start_server(args, trace=trace)
+        client = CommandClient("localhost", server.port)
+        client.settle_watch(MemoryMap.settle_plan())
+        start = time.perf_counter()
+        for button in buttons:
+            client.step(button, plan=plan, adaptive=adaptive)
+        elapsed = time.perf_counter() - start
+        settle = client.settle.average if adaptive else DEFAULT_SETTLE_FRAMES
+        label = "adaptive" if adaptive else "fixed"
+        report(f"{label} ({DEFAULT_HOLD_FRAMES + settle:.1f} frames/step)", len(buttons), elapsed)
+        client._disconnect()
+        server.stop()
+
+
+def bench_delta(args: argparse.Namespace) -> None:
+    """
+    Bytes per step and step latency for full, read plan and delta replies while
+    playing back a trace
+    """
+    trace = get_trace(args)
+    plan = MemoryMap.read_plan()
+    buttons = [BUTTONS[action] for action in trace.actions]
+
+    for label, kwargs in (("full", {}), ("read plan", {"plan": plan}), ("delta", {"delta": True})):
+        server = start_server(args, trace=trace)
+        client = CommandClient("localhost", server.port)
+        start = time.perf_counter()
+        for button in buttons:
+            client.step(button, **kwargs)
+        elapsed = time.perf_counter() - start
+        report(f"step {label} ({client.bytes_received / len(buttons):.0f} B/step)", len(buttons), elapsed)
+        client._disconnect()
+        server.stop()
+
+
+def bench_async(args: argparse.Namespace) -> None:
+    """
+    Steps spread over several connections: blocking clients taking turns against a
+    single event loop driving all of them, with steps pipelined per connection
+    """
+    server = start_server(args)
+    rounds = max(args.requests // args.envs, args.depth)
+    total = rounds * args.envs
+
+    clients = [CommandClient("localhost", server.port) for _ in range(args.envs)]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for client in clients:
+            client.step("U")
+    report(f"blocking x{args.envs}", total, time.perf_counter() - start)
+    for client in clients:
+        client._disconnect()
+
+    async def drive(client: AsyncCommandClient) -> None:
+        for _ in range(rounds // args.depth):
+            await asyncio.gather(*(client.step("U") for _ in range(args.depth)))
+
+    async def run() -> None:
+        clients = await asyncio.gather(
+            *(AsyncCommandClient.open("localhost", server.port) for _ in range(args.envs))
+        )
+        start = time.perf_counter()
+        await asyncio.gather(*(drive(client) for client in clients))
+        steps = rounds // args.depth * args.depth * args.envs
+        report(f"asyncio x{args.envs} depth {args.depth}", steps, time.perf_counter() - start)
+        for client in clients:
+            await client.close()
+
+    asyncio.run(run())
+    server.stop()
+
+
+def bench_connections(args: argparse.Namespace) -> None:
+    """
+    Aggregate step rate with more and more concurrent connections on one event
+    loop, each replaying the trace. Most telling with --latency set, where the
+    rate should grow with the number of connections until the client saturates.
+    """
+    trace = get_trace(args)
+    server = start_server(args, trace=trace)
+
+    async def drive(client: AsyncCommandClient, rounds: int, offset: int) -> None:
+        for idx in range(rounds):
+            await client.step(BUTTONS[trace.actions[(offset + idx) % len(trace)]], delta=True)
+
+    async def run(count: int) -> None:
+        clients = await asyncio.gather(
+            *(AsyncCommandClient.open("localhost", server.port, timeout=10.0) for _ in range(count))
+        )
+        rounds = max(args.requests // count, 10)
+        start = time.perf_counter()
+        await asyncio.gather(*(drive(client, rounds, idx) for idx, client in enumerate(clients)))
+        report(f"{count} connections", rounds * count, time.perf_counter() - start)
+        for client in clients:
+            await client.close()
+
+    for count in (1, 10, 50, 100, 250, 500):
+        asyncio.run(run(count))
+    server.stop()
+
+
+def bench_vecenv(args: argparse.Namespace) -> None:
+    """
+    BlueVecEnv steps per second from 1 to 32 environments, each on its own
+    connection to the stand-in
+    """
+    from vecenv import BlueVecEnv  # needs stable-baselines3
+
+    server = start_server(args)
+    for num_envs in (1, 2, 4, 8, 16, 32):
+        env = BlueVecEnv(ports=[server.port] * num_envs)
+        env.reset()
+        actions = np.full(num_envs, 11)  # up
+        rounds = max(args.requests // num_envs, 10)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            env.step(actions)
+        report(f"BlueVecEnv x{num_envs}", rounds * num_envs, time.perf_counter() - start)
+        env.close()
+    server.stop()
+
+
+BENCHMARKS: T.Dict[str, T.Callable[[argparse.Namespace], None]] = {
+    "async": bench_async,
+    "batch": bench_batch,
+    "connections": bench_connections,
+    "decode": bench_decode,
+    "delta": bench_delta,
+    "memo": bench_memo,
+    "observation": bench_observation,
+    "protocol": bench_protocol,
+    "regions": bench_regions,
+    "reset": bench_reset,
+    "settle": bench_settle,
+    "step": bench_step,
+    "vecenv": bench_vecenv,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--trace", help="trace recorded with traces.py, synthetic if not given")
+    parser.add_argument("--envs", type=int, default=8, help="number of connections")
+    parser.add_argument("--depth", type=int, default=4, help="requests in flight per connection")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the stand-in adds to every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds per reply, up to this")
+    parser.add_argument("--frame-rate", type=float, default=0.0, help="stand-in frame rate for steps, 0 for instant")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
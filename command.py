@@ -1,28 +1,239 @@
 """
 Command interface / API for GBA emulator
 
-See lua\\socketserver.lua for the server implementation
+See lua\\socketserver.lua for the server implementation and protocol.py for the
+framing used on the wire.
 """
+import asyncio
+import collections
+import re
+import select
 import socket
+import struct
 import time
 import typing as T
 
+import numpy as np
+
+from delta import WramMirror
+from protocol import CommandError
+from protocol import HEADER
+from protocol import MAX_PAYLOAD
+from protocol import MSG_ERROR
+from protocol import MSG_EVENT
+from protocol import MSG_REQUEST
+from protocol import ProtocolError
+from protocol import WatchEvent
+from protocol import next_request_id
+from protocol import pack_frame
+from protocol import parse_event
+from protocol import recv_frame
+from protocol import unpack_header
+from readplan import ReadPlan
+
+
+BUTTONS = ["A", "B", "U", "R", "L", "D", "start", "select"]
+
+# GB runs at roughly 60 frames per second
+FRAME_RATE = 60.0
+DEFAULT_HOLD_FRAMES = 4
+DEFAULT_SETTLE_FRAMES = 12
+# an adaptive step is over once the watch set has held still this many frames
+DEFAULT_STABLE_FRAMES = 3
+
+# adaptive step replies start with the frames settling took
+SETTLED = struct.Struct(">H")
+
+# dump_history replies start with the frame of the newest row and the number of rows
+HISTORY = struct.Struct(">IH")
+
+# watch events kept until someone takes them, the oldest go first beyond this
+MAX_EVENTS = 4096
+
+# savestate slot names, see ST_parseSlot in lua\socketserver.lua
+SLOT_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def format_read_spec(plan: T.Optional[ReadPlan], delta: bool, mirror: WramMirror) -> bytes:
+    """
+    Suffix asking a command that ends in a WRAM read for only the plan, or a delta
+    """
+    if plan is not None and delta:
+        raise ValueError("Pick one of a read plan or delta replies")
+    if plan is not None:
+        return b":R" + plan.packed
+    if delta:
+        return b":K" if mirror.next_is_keyframe() else b":D"
+    return b""
+
+
+def format_slot(slot: str) -> bytes:
+    if not SLOT_PATTERN.fullmatch(slot):
+        raise ValueError(f"Savestate slot names are letters, digits, _ and -, got {slot!r}")
+    return bytes(slot, "utf-8")
+
+
+def format_step(
+    button: str,
+    hold_frames: int,
+    settle_frames: int,
+    plan: T.Optional[ReadPlan],
+    delta: bool,
+    mirror: WramMirror,
+    adaptive: bool = False,
+) -> bytes:
+    """
+    Build a step command, see ST_beginStep in lua\\socketserver.lua
+    """
+    if button not in BUTTONS:
+        raise ValueError(f"Unknown button {button}")
+    settle = f"a{settle_frames}" if adaptive else str(settle_frames)
+    cmd = bytes(f"step:{button}:{hold_frames}:{settle}", "utf-8")
+    return cmd + format_read_spec(plan, delta, mirror)
+
+
+def wram_reply_decoder(
+    plan: T.Optional[ReadPlan],
+    delta: bool,
+    mirror: WramMirror,
+) -> T.Optional[T.Callable[[bytes], bytes]]:
+    """
+    How to turn the reply to a WRAM read into WRAM, None if it already is
+    """
+    if plan is not None:
+        return plan.scatter
+    if delta:
+        return mirror.apply
+    return None
+
+
+class History(T.NamedTuple):
+    """
+    What the history plan read on each of the last frames, oldest first
+    """
+    # frame of the last row, so row i is from frame `frame - len(rows) + 1 + i`
+    frame: int
+    # (frames, plan.nbytes), plan.scatter_batch lays them out as WRAM
+    rows: np.ndarray
+
+    @property
+    def frames(self) -> np.ndarray:
+        return np.arange(self.frame - len(self.rows) + 1, self.frame + 1)
+
+
+def format_history(plan: T.Optional[ReadPlan], frames: int) -> bytes:
+    """
+    Build a history command, see ST_setHistory in lua\\socketserver.lua
+    """
+    if plan is None or frames == 0:
+        return b"history:0:"
+    if not 0 < frames <= 0xFFFF or HISTORY.size + frames * plan.nbytes > MAX_PAYLOAD:
+        raise ValueError(f"{frames} frames of {plan} do not fit in one reply")
+    return bytes(f"history:{frames}:", "utf-8") + plan.packed
+
+
+def history_decoder(plan: ReadPlan) -> T.Callable[[bytes], History]:
+    def decode_history(payload: bytes) -> History:
+        frame, count = HISTORY.unpack_from(payload)
+        if len(payload) != HISTORY.size + count * plan.nbytes:
+            raise ProtocolError(f"History of {count} rows of {plan} has a {len(payload)} byte payload")
+        rows = np.frombuffer(payload, dtype=np.uint8, offset=HISTORY.size).reshape(count, plan.nbytes)
+        return History(frame, rows)
+    return decode_history
+
+
+class SettleStats:
+    """
+    Frames adaptive steps took to settle
+    """
+
+    def __init__(self) -> None:
+        self.last = 0
+        self.frames = 0
+        self.steps = 0
+
+    def record(self, payload: bytes) -> bytes:
+        """
+        Count the frames at the start of an adaptive step reply, and strip them
+        """
+        (self.last,) = SETTLED.unpack_from(payload)
+        self.frames += self.last
+        self.steps += 1
+        return payload[SETTLED.size:]
+
+    @property
+    def average(self) -> float:
+        return self.frames / self.steps if self.steps else 0.0
+
+    def __repr__(self) -> str:
+        return f"SettleStats({self.steps} steps, {self.average:.1f} frames on average)"
+
+
+def step_reply_decoder(
+    plan: T.Optional[ReadPlan],
+    delta: bool,
+    mirror: WramMirror,
+    adaptive: bool,
+    settle: SettleStats,
+) -> T.Optional[T.Callable[[bytes], bytes]]:
+    """
+    wram_reply_decoder, taking the settle frames off adaptive replies first
+    """
+    decode = wram_reply_decoder(plan, delta, mirror)
+    if not adaptive:
+        return decode
+
+    def decode_settled(payload: bytes) -> bytes:
+        payload = settle.record(payload)
+        return decode(payload) if decode is not None else payload
+    return decode_settled
+
 
 class CommandClient:
 
-    def __init__(self, host: str, port: int) -> None:
+    def __init__(self, host: str, port: int, timeout: float = 1.0) -> None:
         self.sleep_duration = 20
         self._host = host
         self._port = port
+        self._timeout = timeout
         self._connected = False
         self._socket: socket.socket = None
+        self._request_id = 0
+        self.bytes_received = 0
+        self.mirror = WramMirror()
+        self.settle = SettleStats()
+        # pushed by the server for watched spans, see watch()
+        self.events: T.Deque[WatchEvent] = collections.deque(maxlen=MAX_EVENTS)
+        self.history_plan: T.Optional[ReadPlan] = None
+        # kept on the server per connection, so set again whenever we reconnect
+        self.frame_locked = False
+        self._settle_watch: T.Optional[bytes] = None
+        self._watch: T.Optional[bytes] = None
         self._connect()
 
     def _connect(self) -> T.Optional[T.NoReturn]:
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self._socket.connect((self._host, self._port))
-        self._socket.settimeout(1.0)  # localhost
+        self._socket.settimeout(self._timeout)  # localhost
         self._connected = True
+        # the server forgets the last snapshot it sent us along with the connection,
+        # and the history it was recording
+        self.mirror.invalidate()
+        self.history_plan = None
+        self._restore_session()
+
+    def _restore_session(self) -> None:
+        """
+        Set up a new connection the way the one it replaces was, since a reconnect
+        after a timeout would otherwise quietly drop it
+        """
+        if self.frame_locked:
+            self.request(b"frame_lock:1")
+        if self._settle_watch is not None:
+            self.request(self._settle_watch)
+        if self._watch is not None:
+            self.request(self._watch)
 
     def _disconnect(self) -> None:
         if self._socket is not None:
@@ -37,27 +248,212 @@ class CommandClient:
         self._disconnect()
         self._connect()
 
+    def request(self, cmd: bytes, timeout: float = None, delta: bool = False) -> bytes:
+        """
+        Send a single framed request and block until its reply arrives, see _request.
+        A failed `delta` request may have lost the keyframe it asked for, so the
+        mirror is resynced on the next read.
+        """
+        try:
+            return self._request(cmd, timeout)
+        except Exception:
+            if delta:
+                self.mirror.invalidate()
+            raise
+
+    def _request(self, cmd: bytes, timeout: float = None) -> bytes:
+        """
+        Send a single framed request and block until its reply arrives
+
+        Replies carrying a different request id are leftovers from requests that
+        timed out earlier and are dropped. A timeout, a dropped connection or a
+        malformed frame part way through a reply leaves the stream misaligned or
+        dead, so on any of them we reconnect before re-raising.
+        """
+        if self._socket is None:
+            self.reset()
+
+        self._request_id = next_request_id(self._request_id)
+        try:
+            self._socket.sendall(pack_frame(MSG_REQUEST, self._request_id, cmd))
+            self._socket.settimeout(timeout or self._timeout)
+            while True:
+                frame = recv_frame(self._socket)
+                if frame.msg_type == MSG_EVENT:
+                    self.events.append(parse_event(frame.payload))
+                    continue
+                if frame.request_id != self._request_id:
+                    print(f"Dropping stale reply to request {frame.request_id}")
+                    continue
+                if frame.msg_type == MSG_ERROR:
+                    raise CommandError(frame.payload.decode("utf-8", errors="replace"))
+                self.bytes_received += len(frame.payload)
+                return frame.payload
+        except (OSError, ProtocolError) as exc:
+            self._reconnect_after(f"waiting for reply to {cmd!r}", exc)
+            raise
+
+    def _reconnect_after(self, what: str, exc: Exception) -> None:
+        print(f"{exc!r} {what}, reconnecting")
+        try:
+            self.reset()
+        except OSError:
+            # nobody listening right now, the next request tries again
+            self._disconnect()
+
+    def read_ranges(self, plan: ReadPlan) -> bytearray:
+        """
+        Read only the spans in the plan, laid back out as a WRAM sized buffer
+        """
+        return plan.scatter(self.request(b"read_ranges:" + plan.packed))
+
+    def dump_wram_delta(self) -> bytearray:
+        """
+        Bring the WRAM mirror up to date with only the blocks that changed since
+        the last read on this connection, and return it.
+
+        The mirror is patched in place on every call, copy it to keep a snapshot.
+        """
+        cmd = b"dump_wram_delta:key" if self.mirror.next_is_keyframe() else b"dump_wram_delta"
+        return self.mirror.apply(self.request(cmd, delta=True))
+
+    def step(
+        self,
+        button: str,
+        hold_frames: int = DEFAULT_HOLD_FRAMES,
+        settle_frames: int = DEFAULT_SETTLE_FRAMES,
+        plan: ReadPlan = None,
+        delta: bool = False,
+        adaptive: bool = False,
+    ) -> bytes:
+        """
+        Press a button, hold it for `hold_frames`, release it, let `settle_frames`
+        more frames run and return WRAM as of the last one.
+
+        All of that happens server side so it only costs a single round trip. With a
+        plan only its spans are sent back, scattered into a WRAM sized buffer. With
+        delta the reply patches and returns the WRAM mirror, as in dump_wram_delta.
+        An adaptive step stops settling as soon as the settle_watch holds still, with
+        `settle_frames` as the cap, and counts the frames it took in `settle`.
+        """
+        cmd = format_step(button, hold_frames, settle_frames, plan, delta, self.mirror, adaptive)
+        decode = step_reply_decoder(plan, delta, self.mirror, adaptive, self.settle)
+        # the reply only comes back once the frames have run
+        payload = self.request(
+            cmd, timeout=self._timeout + (hold_frames + settle_frames) / FRAME_RATE, delta=delta
+        )
+        return decode(payload) if decode is not None else payload
+
+    def settle_watch(self, plan: ReadPlan, stable_frames: int = DEFAULT_STABLE_FRAMES) -> None:
+        """
+        Spans adaptive steps watch, settled once they read the same `stable_frames`
+        frames in a row. See MemoryMap.settle_plan.
+        """
+        cmd = bytes(f"settle_watch:{stable_frames}:", "utf-8") + plan.packed
+        self.request(cmd)
+        self._settle_watch = cmd
+
+    def watch(self, plan: T.Optional[ReadPlan]) -> None:
+        """
+        Have the server push a WatchEvent into `events` whenever a span of the plan
+        changes, replacing whatever was watched before. None stops watching.
+        A reconnect watches the same spans again, but whatever changed while we were
+        not connected goes unreported.
+        """
+        cmd = b"watch:" + (plan.packed if plan is not None else b"")
+        self.request(cmd)
+        self._watch = cmd if plan is not None else None
+
+    def poll_events(self, timeout: float = 0.0) -> T.List[WatchEvent]:
+        """
+        Take every event received so far, waiting up to `timeout` for more to arrive
+
+        Events only get read along with replies, so this also picks up whatever
+        came in since the last one.
+        """
+        try:
+            while self._socket is not None and select.select([self._socket], [], [], timeout)[0]:
+                frame = recv_frame(self._socket)
+                if frame.msg_type == MSG_EVENT:
+                    self.events.append(parse_event(frame.payload))
+                else:
+                    print(f"Dropping stale reply to request {frame.request_id}")
+                timeout = 0.0
+        except (OSError, ProtocolError) as exc:
+            self._reconnect_after("polling for events", exc)
+            raise
+        events = list(self.events)
+        self.events.clear()
+        return events
+
+    def record_history(self, plan: T.Optional[ReadPlan], frames: int) -> None:
+        """
+        Have the server keep what the plan reads on each of the last `frames`
+        frames, for dump_history. None stops recording.
+        """
+        self.request(format_history(plan, frames))
+        self.history_plan = plan if frames else None
+
+    def dump_history(self) -> History:
+        """
+        Every frame recorded since record_history, up to its `frames`, in one reply
+        """
+        if self.history_plan is None:
+            raise ValueError("No history being recorded, see record_history")
+        return history_decoder(self.history_plan)(self.request(b"dump_history"))
+
+    def set_frame_lock(self, enabled: bool) -> None:
+        """
+        Pause emulation between steps, so each runs exactly its hold and settle
+        frames from where the last one ended. Lifted when we disconnect, and taken
+        again if that was a reconnect. Servers whose sockets cannot block in
+        select() refuse it with a CommandError.
+        """
+        self.request(b"frame_lock:1" if enabled else b"frame_lock:0")
+        self.frame_locked = enabled
+
+    def frame_count(self) -> int:
+        """
+        Frames the emulator has run
+        """
+        return int(self.request(b"frame"))
+
+    def save_state(self, slot: str) -> None:
+        """
+        Snapshot the emulator into an in memory savestate slot
+        """
+        self.request(b"save_state:" + format_slot(slot))
+
+    def load_state(self, slot: str, plan: ReadPlan = None, delta: bool = False) -> bytes:
+        """
+        Restore a savestate slot and return WRAM right after, shaped as for step
+        """
+        decode = wram_reply_decoder(plan, delta, self.mirror)
+        payload = self.request(
+            b"load_state:" + format_slot(slot) + format_read_spec(plan, delta, self.mirror), delta=delta
+        )
+        return decode(payload) if decode is not None else payload
+
+    def get_state(self, slot: str) -> bytes:
+        """
+        The savestate in a slot, to keep or put on another emulator
+        """
+        return self.request(b"get_state:" + format_slot(slot))
+
+    def put_state(self, slot: str, state: bytes) -> None:
+        self.request(b"put_state:" + format_slot(slot) + b":" + state)
+
     def do_button_command(self, cmd: bytes) -> None:
         try:
-            self._socket.send(cmd)
-            self._socket.recv(128)
-        except TimeoutError:
-            print("Timed out on socket read in button command")
+            self.request(cmd)
         finally:
-            self._socket.send(b"clear")  # best effort here
-            self._socket.recv(128)
+            self.request(b"clear")  # best effort here
 
     def do_data_command(self, cmd: bytes) -> bytes:
         """
         Issue a command that expects a response
         """
-        self._socket.send(cmd)
-        try:
-            resp = self._socket.recv(16384)  # TODO: maybe this buffer is too large?
-            return resp
-        except TimeoutError:
-            print("Timed out on socket read")
-            return b" " * 8192
+        return self.request(cmd)
 
     def dispatch(self, cmd: str) -> T.Optional[bytes]:
         """
@@ -66,7 +462,7 @@ class CommandClient:
         if self._socket is None:
             self.reset()
 
-        if cmd in ["A", "B", "U", "R", "L", "D", "start", "select"]:
+        if cmd in BUTTONS:
             fmtcmd = bytes(f"B:{cmd}", 'utf-8')
             return self.do_button_command(fmtcmd)
 
@@ -74,6 +470,276 @@ class CommandClient:
         return self.do_data_command(fmtcmd)
 
 
+class AsyncCommandClient:
+    """
+    asyncio flavour of CommandClient with the same commands, all of them coroutines
+
+    Requests are pipelined: any number of them can be in flight on the connection at
+    once and a background task matches replies back to them by request id. One event
+    loop can keep dozens of emulators busy this way without a thread per socket.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 1.0) -> None:
+        self._host = host
+        self._port = port
+        self._timeout = timeout
+        self._connected = False
+        self._reader: asyncio.StreamReader = None
+        self._writer: asyncio.StreamWriter = None
+        self._reader_task: asyncio.Task = None
+        # request id -> (future for the reply, optional decoder run as the reply arrives)
+        self._pending: T.Dict[int, T.Tuple[asyncio.Future, T.Optional[T.Callable[[bytes], T.Any]]]] = dict()
+        self._request_id = 0
+        self.bytes_received = 0
+        self.mirror = WramMirror()
+        self.settle = SettleStats()
+        # pushed by the server for watched spans, see watch()
+        self.events: T.Deque[WatchEvent] = collections.deque(maxlen=MAX_EVENTS)
+        self.history_plan: T.Optional[ReadPlan] = None
+        # kept on the server per connection, so set again whenever we reconnect
+        self.frame_locked = False
+        self._settle_watch: T.Optional[bytes] = None
+        self._watch: T.Optional[bytes] = None
+
+    @classmethod
+    async def open(
+        cls, host: str, port: int, timeout: float = 1.0, sock: T.Optional[socket.socket] = None
+    ) -> "AsyncCommandClient":
+        client = cls(host, port, timeout=timeout)
+        await client.connect(sock)
+        return client
+
+    async def connect(self, sock: T.Optional[socket.socket] = None) -> None:
+        """
+        Open a connection, or with `sock` share one that is already open, e.g. the one
+        of a pool lease. Only a duplicate of `sock` is closed along with this client,
+        so its owner can carry on using it once we are done.
+        """
+        if sock is not None:
+            opening = asyncio.open_connection(sock=sock.dup())
+        else:
+            opening = asyncio.open_connection(self._host, self._port)
+        self._reader, self._writer = await asyncio.wait_for(opening, self._timeout)
+        self._writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader_task = asyncio.create_task(self._read_replies())
+        self._connected = True
+        self.mirror.invalidate()
+        self.history_plan = None
+        await self._restore_session()
+
+    async def _restore_session(self) -> None:
+        """
+        See CommandClient._restore_session
+        """
+        if self.frame_locked:
+            await self.request(b"frame_lock:1")
+        if self._settle_watch is not None:
+            await self.request(self._settle_watch)
+        if self._watch is not None:
+            await self.request(self._watch)
+
+    async def close(self) -> None:
+        self._connected = False
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+            self._writer = None
+        self._fail_pending(ConnectionError("Connection closed"))
+
+    async def reset(self) -> None:
+        """
+        Disconnect and reconnect
+        """
+        await self.close()
+        await self.connect()
+
+    def _fail_pending(self, exc: Exception) -> None:
+        for future, _decode in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self._pending.clear()
+
+    async def _read_replies(self) -> None:
+        try:
+            while True:
+                msg_type, request_id, length = unpack_header(await self._reader.readexactly(HEADER.size))
+                payload = await self._reader.readexactly(length) if length else b""
+                if msg_type == MSG_EVENT:
+                    self.events.append(parse_event(payload))
+                    continue
+                pending = self._pending.pop(request_id, None)
+                if pending is None:
+                    print(f"Dropping stale reply to request {request_id}")
+                    continue
+                future, decode = pending
+                if future.done():
+                    continue
+                if msg_type == MSG_ERROR:
+                    future.set_exception(CommandError(payload.decode("utf-8", errors="replace")))
+                    continue
+                self.bytes_received += len(payload)
+                # decode here rather than in the awaiting coroutine so that delta replies
+                # are applied to the mirror in the order the server sent them
+                try:
+                    future.set_result(decode(payload) if decode is not None else payload)
+                except Exception as exc:
+                    future.set_exception(exc)
+        except (asyncio.IncompleteReadError, ConnectionError, ProtocolError) as exc:
+            print(f"Lost connection to {self._host}:{self._port}: {exc!r}")
+            self._connected = False
+            self._fail_pending(ConnectionError(f"Connection lost: {exc!r}"))
+
+    def _next_request_id(self) -> int:
+        request_id = next_request_id(self._request_id)
+        while request_id in self._pending:
+            request_id = next_request_id(request_id)
+        self._request_id = request_id
+        return request_id
+
+    async def request(
+        self,
+        cmd: bytes,
+        timeout: float = None,
+        decode: T.Callable[[bytes], T.Any] = None,
+        delta: bool = False,
+    ) -> T.Any:
+        """
+        Send a framed request and wait for its reply, other requests may be in flight
+
+        A reply that arrives after we gave up on it is dropped by the reader, so a
+        timeout does not need a reconnect. When a `delta` request fails for any
+        reason its reply may have been lost, so the mirror is resynced with a
+        keyframe.
+        """
+        if not self._connected:
+            await self.reset()
+
+        request_id = self._next_request_id()
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = (future, decode)
+        self._writer.write(pack_frame(MSG_REQUEST, request_id, cmd))
+        await self._writer.drain()
+        try:
+            return await asyncio.wait_for(future, timeout or self._timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(request_id, None)
+            if delta:
+                self.mirror.invalidate()
+            print(f"Timed out waiting for reply to {cmd!r}")
+            raise TimeoutError(f"No reply to {cmd!r} within {timeout or self._timeout}s")
+        except Exception:
+            if delta:
+                self.mirror.invalidate()
+            raise
+
+    async def read_ranges(self, plan: ReadPlan) -> bytearray:
+        return await self.request(b"read_ranges:" + plan.packed, decode=plan.scatter)
+
+    async def dump_wram_delta(self) -> bytearray:
+        cmd = b"dump_wram_delta:key" if self.mirror.next_is_keyframe() else b"dump_wram_delta"
+        return await self.request(cmd, decode=self.mirror.apply, delta=True)
+
+    async def step(
+        self,
+        button: str,
+        hold_frames: int = DEFAULT_HOLD_FRAMES,
+        settle_frames: int = DEFAULT_SETTLE_FRAMES,
+        plan: ReadPlan = None,
+        delta: bool = False,
+        adaptive: bool = False,
+    ) -> bytes:
+        """
+        See CommandClient.step. Several steps can be pipelined on one connection,
+        the server runs them back to back.
+        """
+        cmd = format_step(button, hold_frames, settle_frames, plan, delta, self.mirror, adaptive)
+        return await self.request(
+            cmd,
+            timeout=self._timeout + (hold_frames + settle_frames) / FRAME_RATE,
+            decode=step_reply_decoder(plan, delta, self.mirror, adaptive, self.settle),
+            delta=delta,
+        )
+
+    async def settle_watch(self, plan: ReadPlan, stable_frames: int = DEFAULT_STABLE_FRAMES) -> None:
+        cmd = bytes(f"settle_watch:{stable_frames}:", "utf-8") + plan.packed
+        await self.request(cmd)
+        self._settle_watch = cmd
+
+    async def watch(self, plan: T.Optional[ReadPlan]) -> None:
+        """
+        See CommandClient.watch. Events land in `events` as they arrive.
+        """
+        cmd = b"watch:" + (plan.packed if plan is not None else b"")
+        await self.request(cmd)
+        self._watch = cmd if plan is not None else None
+
+    def poll_events(self) -> T.List[WatchEvent]:
+        """
+        Take every event received so far
+        """
+        events = list(self.events)
+        self.events.clear()
+        return events
+
+    async def record_history(self, plan: T.Optional[ReadPlan], frames: int) -> None:
+        """
+        See CommandClient.record_history
+        """
+        await self.request(format_history(plan, frames))
+        self.history_plan = plan if frames else None
+
+    async def dump_history(self) -> History:
+        if self.history_plan is None:
+            raise ValueError("No history being recorded, see record_history")
+        return await self.request(b"dump_history", decode=history_decoder(self.history_plan))
+
+    async def set_frame_lock(self, enabled: bool) -> None:
+        await self.request(b"frame_lock:1" if enabled else b"frame_lock:0")
+        self.frame_locked = enabled
+
+    async def frame_count(self) -> int:
+        return int(await self.request(b"frame"))
+
+    async def save_state(self, slot: str) -> None:
+        await self.request(b"save_state:" + format_slot(slot))
+
+    async def load_state(self, slot: str, plan: ReadPlan = None, delta: bool = False) -> bytes:
+        """
+        See CommandClient.load_state
+        """
+        return await self.request(
+            b"load_state:" + format_slot(slot) + format_read_spec(plan, delta, self.mirror),
+            decode=wram_reply_decoder(plan, delta, self.mirror),
+            delta=delta,
+        )
+
+    async def get_state(self, slot: str) -> bytes:
+        return await self.request(b"get_state:" + format_slot(slot))
+
+    async def put_state(self, slot: str, state: bytes) -> None:
+        await self.request(b"put_state:" + format_slot(slot) + b":" + state)
+
+    async def do_button_command(self, cmd: bytes) -> None:
+        try:
+            await self.request(cmd)
+        finally:
+            await self.request(b"clear")  # best effort here
+
+    async def do_data_command(self, cmd: bytes) -> bytes:
+        return await self.request(cmd)
+
+    async def dispatch(self, cmd: str) -> T.Optional[bytes]:
+        if cmd in BUTTONS:
+            return await self.do_button_command(bytes(f"B:{cmd}", "utf-8"))
+        return await self.do_data_command(bytes(cmd, "utf-8"))
+
+
 if __name__ == "__main__":
     # run in REPL mode
     client = CommandClient('localhost', 10018)
@@ -85,6 +751,8 @@ if __name__ == "__main__":
         except KeyboardInterrupt:
             print("Exiting REPL")
             break
+        except CommandError as exc:
+            print(f"Command failed: {exc}")
         except socket.error:
             client.reset()  # if this fails just exit REPL
         finally:
@@ -0,0 +1,121 @@
+"""
+Delta encoding of WRAM between consecutive reads
+
+Most of WRAM does not change from one step to the next, so instead of resending all
+8 KB the server remembers the last snapshot it sent on a connection and only sends
+the 64 byte blocks that changed since:
+
+    flags (uint8) | bitmap of changed blocks (16 bytes, MSB first) | changed blocks
+
+or, for a keyframe (first read on a connection, or when asked for one):
+
+    flags (uint8, FLAG_KEYFRAME set) | all 8192 bytes
+
+The client keeps a mirror of WRAM that it patches in place.
+"""
+import typing as T
+
+import numpy as np
+
+from protocol import ProtocolError
+
+
+WRAM_SIZE = 8192
+BLOCK_SIZE = 64
+NUM_BLOCKS = WRAM_SIZE // BLOCK_SIZE
+BITMAP_SIZE = NUM_BLOCKS // 8
+
+FLAG_KEYFRAME = 0x01
+
+
+def encode_delta(previous: T.Optional[bytes], current: bytes, keyframe: bool = False) -> bytes:
+    """
+    Reference encoder, mirrors ST_deltaWram in lua\\socketserver.lua
+    """
+    if keyframe or previous is None:
+        return bytes([FLAG_KEYFRAME]) + bytes(current)
+    prev_blocks = np.frombuffer(previous, dtype=np.uint8).reshape(NUM_BLOCKS, BLOCK_SIZE)
+    curr_blocks = np.frombuffer(current, dtype=np.uint8).reshape(NUM_BLOCKS, BLOCK_SIZE)
+    changed = (prev_blocks != curr_blocks).any(axis=1)
+    return bytes([0]) + np.packbits(changed).tobytes() + curr_blocks[changed].tobytes()
+
+
+class WramMirror:
+    """
+    Client side copy of WRAM kept up to date from delta replies
+
+    `buffer` is patched in place, so anything that needs to keep the contents of a
+    particular step around has to copy it.
+    """
+
+    def __init__(self, keyframe_interval: int = 256) -> None:
+        self.buffer = bytearray(WRAM_SIZE)
+        self.keyframe_interval = keyframe_interval
+        self.synced = False
+        self.since_keyframe = 0
+        self._keyframe_requested = False
+
+        # running totals so callers can see what delta mode buys them
+        self.updates = 0
+        self.bytes_received = 0
+
+    def invalidate(self) -> None:
+        """
+        Contents can no longer be trusted (reconnect, bad reply), next read needs a keyframe
+        """
+        self.synced = False
+        self._keyframe_requested = False
+
+    @property
+    def wants_keyframe(self) -> bool:
+        # periodic keyframes guard against a mirror silently drifting
+        return not self.synced or self.since_keyframe >= self.keyframe_interval
+
+    def next_is_keyframe(self) -> bool:
+        """
+        Whether the next read should ask for a keyframe
+
+        Replies arrive in the order requests were sent, so reads pipelined behind an
+        outstanding keyframe request can be plain deltas.
+        """
+        if self._keyframe_requested or not self.wants_keyframe:
+            return False
+        self._keyframe_requested = True
+        return True
+
+    def apply(self, payload: bytes) -> bytearray:
+        """
+        Patch the mirror with a delta reply and return it
+        """
+        self.updates += 1
+        self.bytes_received += len(payload)
+        if not payload:
+            self.invalidate()
+            raise ProtocolError("Empty delta reply")
+
+        if payload[0] & FLAG_KEYFRAME:
+            if len(payload) != 1 + WRAM_SIZE:
+                self.invalidate()
+                raise ProtocolError(f"Keyframe of {len(payload) - 1} bytes, expected {WRAM_SIZE}")
+            self.buffer[:] = payload[1:]
+            self.synced = True
+            self.since_keyframe = 0
+            self._keyframe_requested = False
+            return self.buffer
+
+        if not self.synced:
+            # whatever keyframe we asked for is not coming, ask again on the next read
+            self.invalidate()
+            raise ProtocolError("Received a delta without a keyframe to apply it to")
+        changed = np.flatnonzero(np.unpackbits(np.frombuffer(payload, dtype=np.uint8, count=BITMAP_SIZE, offset=1)))
+        if len(payload) != 1 + BITMAP_SIZE + len(changed) * BLOCK_SIZE:
+            self.invalidate()
+            raise ProtocolError(f"Delta of {len(payload)} bytes does not match {len(changed)} changed blocks")
+
+        offset = 1 + BITMAP_SIZE
+        for block in changed.tolist():
+            start = block * BLOCK_SIZE
+            self.buffer[start:start + BLOCK_SIZE] = payload[offset:offset + BLOCK_SIZE]
+            offset += BLOCK_SIZE
+        self.since_keyframe += 1
+        return self.buffer
@@ -8,13 +8,22 @@ import numpy as np
 from gymnasium import spaces
 
 from command import CommandClient
+from command import DEFAULT_HOLD_FRAMES
+from command import DEFAULT_SETTLE_FRAMES
+from command import SettleStats
+from framestack import ObservationBuffer
+from memo import MemoCache
+from profiling import StepProfiler
 from memmap import MemoryMap
+from pool import BASE_PORT
+from pool import EmulatorPool
 from reward import ActionRanges
 from reward import RewardManager
 from spaces import create_spaces_from_mmap
 from spaces import populate_space_from_mmap
 from spaces import create_reduced_space_from_mmap
 from spaces import populate_reduced_space_from_mmap
+from startstates import StartStatePool
 
 if T.TYPE_CHECKING:
     from gymnasium.core import ActType
@@ -30,14 +39,78 @@ class BlueEnvironment(gym.Env):
 
     metadata = {"render_modes": ["ansi"], "render_fps": 1}
 
-    def __init__(self, render_mode: str = "ansi", size = 5) -> None:
+    def __init__(
+        self,
+        render_mode: str = "ansi",
+        size = 5,
+        hold_frames: int = DEFAULT_HOLD_FRAMES,
+        settle_frames: int = DEFAULT_SETTLE_FRAMES,
+        port: int = BASE_PORT,
+        pool: T.Optional[EmulatorPool] = None,
+        frame_stack: int = 1,
+        cache_size: int = 0,
+        profile: bool = False,
+        profile_info: bool = False,
+        start_states: T.Optional[StartStatePool] = None,
+        frame_lock: bool = False,
+        adaptive_settle: bool = False,
+        watch_events: bool = False,
+    ) -> None:
+        """
+        With a pool the environment leases whichever emulator is free, otherwise it
+        connects straight to `port`. Observations stack the last `frame_stack`
+        frames and are views that stay intact through the next step. Observations
+        and pure rewards of the last `cache_size` distinct states are memoized,
+        off (0) by default as it only pays off when states repeat a lot.
+
+        With `profile` every phase of a step is timed, see `profiler`, and a
+        summary is printed when the episode ends. `profile_info` also puts the
+        nanoseconds per phase of each step in its info under "timings".
+
+        With `start_states` every reset loads one of them, drawn by weight, and
+        starts the rewards over. Without, a reset carries on from wherever the game
+        is.
+
+        With `frame_lock` the emulator is paused between steps, so a step is exactly
+        its hold and settle frames wherever the time goes in between.
+
+        With `adaptive_settle` a step stops settling once MemoryMap.SETTLE_WATCH has
+        held still, taking `settle_frames` at most. The frames it took go in the
+        info under "settle_frames", and the running average is in `settle_stats`.
+
+        With `watch_events` the emulator pushes a WatchEvent whenever one of
+        MemoryMap.EVENT_WATCH changes, and the events of a step go in its info under
+        "events", with the frame each change happened on.
+        """
         self.size = size
-        self._client = CommandClient('localhost', 10018)
+        self.hold_frames = hold_frames
+        self.settle_frames = settle_frames
+        self._lease = None
+        if pool is not None:
+            self._lease = pool.acquire()
+            self._client = self._lease.client
+        else:
+            self._client = CommandClient('localhost', port)
         if not self._client._connected:
             raise ValueError("Game does not seem to be running")
-        self.mmap = self.read_game_state()
-
-        self.observation_space = create_reduced_space_from_mmap(self.mmap)
+        self.frame_lock = frame_lock
+        if frame_lock:
+            self._client.set_frame_lock(True)
+        self.adaptive_settle = adaptive_settle
+        if adaptive_settle:
+            self._client.settle_watch(MemoryMap.settle_plan())
+        self.watch_plan = MemoryMap.event_plan() if watch_events else None
+        if watch_events:
+            self._client.watch(self.watch_plan)
+        self.start_states = start_states
+        if start_states:
+            start_states.install(self._client)
+        self.read_plan = MemoryMap.read_plan()
+        self.mmap = MemoryMap()
+        self.read_game_state()
+
+        self._observations = ObservationBuffer(create_reduced_space_from_mmap(self.mmap), frames=frame_stack)
+        self.observation_space = self._observations.space
 
         # action space is a single dimension discrete vector
         # this is because we do not want to toggle options at the same time
@@ -51,33 +124,113 @@ class BlueEnvironment(gym.Env):
         # 7: Start
         self.action_space = spaces.Discrete(31)
 
-        self.reward_manager = RewardManager()
+        self.profile_info = profile_info
+        self.profiler = StepProfiler() if profile or profile_info else None
+        self.observation_cache = MemoCache(cache_size) if cache_size else None
+        self.reward_manager = RewardManager(
+            cache=MemoCache(4 * cache_size) if cache_size else None, profiler=self.profiler
+        )
+
+    @property
+    def settle_stats(self) -> SettleStats:
+        return self._client.settle
+
+    def cache_stats(self) -> T.Dict[str, T.Dict[str, float]]:
+        """
+        Hits and misses of the observation and reward caches
+        """
+        caches = {"observation": self.observation_cache, "reward": self.reward_manager.cache}
+        return {name: cache.stats() for name, cache in caches.items() if cache is not None}
 
     def read_game_state(self) -> MemoryMap:
-        return MemoryMap.hydrate_from_memory(self._client.do_data_command(b"dump_wram"))
+        return self.mmap.update_from_memory(self._client.read_ranges(self.read_plan))
+
+    def dump_profile(self) -> None:
+        """
+        Print the step timings of the episode so far and start over
+        """
+        if self.profiler is not None and self.profiler.steps:
+            print(self.profiler.summary())
+            self.profiler.reset()
 
     def reset(self, **kwargs) -> T.Tuple["ObsType", T.Dict[str, T.Any]]:
         super().reset(**kwargs)
-        self.mmap = self.read_game_state()
-        observation = populate_reduced_space_from_mmap(self.mmap)
-        return (observation, {})
+        self.dump_profile()
+        info = {}
+        if self.start_states:
+            name = self.start_states.sample(self.np_random)
+            self.mmap.update_from_memory(
+                self._client.load_state(self.start_states.slot(name), plan=self.read_plan)
+            )
+            self.reward_manager.reset()
+            info["start_state"] = name
+            if self.watch_plan is not None:
+                # watch from the loaded state on, the jump there is not a change
+                self._client.watch(self.watch_plan)
+                self._client.poll_events()
+        else:
+            self.read_game_state()
+        self._observations.advance()
+        populate_reduced_space_from_mmap(
+            self.mmap, out=self._observations.slots(), cache=self.observation_cache
+        )
+        self._observations.fill()
+        return (self._observations.view(), info)
 
     def step(self, action: "ActType") -> T.Tuple["ObsType", "SupportsFloat", bool, bool, dict[str, T.Any]]:
         """
         Issue action and read state
         """
-        # issue action
-        button = ActionRanges.get_button(action)
-        if button in "ULDR":
-            # just issue it twice dammit
-            self._client.dispatch(button)
-        self._client.dispatch(button)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
 
-        self.mmap = self.read_game_state()
-        observation = populate_reduced_space_from_mmap(self.mmap)
+        # press, hold, release, settle and read back WRAM in a single round trip
+        button = ActionRanges.get_button(action)
+        memory = self._client.step(
+            button, self.hold_frames, self.settle_frames, plan=self.read_plan, adaptive=self.adaptive_settle
+        )
+        if profiler is not None:
+            profiler.lap("roundtrip")
+
+        self.mmap.update_from_memory(memory)
+        if profiler is not None:
+            profiler.lap("hydrate")
+        self._observations.advance()
+        populate_reduced_space_from_mmap(
+            self.mmap, out=self._observations.slots(), cache=self.observation_cache
+        )
+        observation = self._observations.view()
+        if profiler is not None:
+            profiler.lap("populate")
         reward = self.reward_manager.calculate_reward(self.mmap, action)
         terminated = False
         truncated = False
         info = dict()
+        if self.adaptive_settle:
+            info["settle_frames"] = self._client.settle.last
+        if self.watch_plan is not None:
+            info["events"] = self._client.poll_events()
+        if profiler is not None:
+            profiler.lap("reward")
+            timings = profiler.finish()
+            if self.profile_info:
+                info["timings"] = dict(timings)
 
         return (observation, reward, terminated, truncated, info)
+
+    def close(self) -> None:
+        """
+        Hand the emulator back to the pool, or just hang up
+        """
+        self.dump_profile()
+        if self.frame_lock:
+            # a leased connection stays open, so the emulator would stay paused
+            self._client.set_frame_lock(False)
+        if self.watch_plan is not None:
+            self._client.watch(None)
+        if self._lease is not None:
+            self._lease.release()
+            self._lease = None
+        else:
+            self._client._disconnect()
@@ -0,0 +1,110 @@
+"""
+Preallocated observation buffers, optionally stacking the last K frames
+
+Each observation key gets a ring of 2K frames. A step writes the newest frame into
+the next slot and the observation is a view of the K slots ending there, flattened
+to (K * size,) so it stays a plain 1D Box that stable-baselines3 flattens and copies
+into its rollout buffer like any other. Once the ring is full the last K - 1 frames
+are copied back to the front, so a window never wraps around and is always a view,
+and since the slot written next is never inside the window before it, the previous
+observation stays intact for one more step while PPO still holds on to it.
+
+With a leading env axis all envs share the ring position, which is what a
+vectorized env stepping in lockstep wants.
+"""
+import typing as T
+
+import numpy as np
+from gymnasium import spaces
+
+
+class FrameStack:
+    """
+    The last `frames` frames of one observation key
+    """
+
+    def __init__(
+        self, shape: T.Tuple[int, ...], dtype: T.Any, frames: int = 1, num_envs: T.Optional[int] = None
+    ) -> None:
+        if frames < 1:
+            raise ValueError(f"Need at least one frame to stack, got {frames}")
+        self.frames = frames
+        self.frame_shape = tuple(shape)
+        self.frame_size = int(np.prod(shape))
+        self._envs = () if num_envs is None else (num_envs,)
+        self._buffer = np.zeros((*self._envs, 2 * frames, self.frame_size), dtype=dtype)
+        # slot of the newest frame, so the window is [head - frames + 1, head]
+        self._head = frames - 1
+
+    @property
+    def shape(self) -> T.Tuple[int, ...]:
+        return (*self._envs, self.frames * self.frame_size)
+
+    def advance(self) -> None:
+        """
+        Move on to the next slot, to be filled with `slot` before reading `view`
+        """
+        if self._head + 1 == self._buffer.shape[-2]:
+            keep = self.frames - 1
+            self._buffer[..., :keep, :] = self._buffer[..., self._head - keep + 1:self._head + 1, :]
+            self._head = keep
+        else:
+            self._head += 1
+
+    def slot(self, idx: T.Optional[int] = None) -> np.ndarray:
+        """
+        The newest frame, of one env if there is an env axis, shaped like a frame
+        """
+        if idx is None:
+            return self._buffer[..., self._head, :].reshape(*self._envs, *self.frame_shape)
+        return self._buffer[idx, self._head].reshape(self.frame_shape)
+
+    def fill(self, idx: T.Optional[int] = None) -> None:
+        """
+        Repeat the newest frame over the whole window, as after a reset
+        """
+        window = self._buffer[..., self._head - self.frames + 1:self._head + 1, :]
+        if idx is None:
+            window[...] = window[..., -1:, :]
+        else:
+            window[idx] = window[idx, -1:]
+
+    def view(self) -> np.ndarray:
+        window = self._buffer[..., self._head - self.frames + 1:self._head + 1, :]
+        return window.reshape(self.shape)
+
+
+class ObservationBuffer:
+    """
+    A FrameStack per key of a Dict observation space of Boxes
+    """
+
+    def __init__(self, space: spaces.Dict, frames: int = 1, num_envs: T.Optional[int] = None) -> None:
+        self.frames = frames
+        self.stacks = {
+            key: FrameStack(box.shape, box.dtype, frames=frames, num_envs=num_envs)
+            for key, box in space.spaces.items()
+        }
+        self.space = spaces.Dict({
+            key: spaces.Box(
+                np.tile(box.low.ravel(), frames), np.tile(box.high.ravel(), frames), dtype=box.dtype
+            )
+            for key, box in space.spaces.items()
+        })
+
+    def advance(self) -> None:
+        for stack in self.stacks.values():
+            stack.advance()
+
+    def slots(self, idx: T.Optional[int] = None) -> T.Dict[str, np.ndarray]:
+        """
+        Arrays to write the newest frame into, shaped like the unstacked space
+        """
+        return {key: stack.slot(idx) for key, stack in self.stacks.items()}
+
+    def fill(self, idx: T.Optional[int] = None) -> None:
+        for stack in self.stacks.values():
+            stack.fill(idx)
+
+    def view(self) -> T.Dict[str, np.ndarray]:
+        return {key: stack.view() for key, stack in self.stacks.items()}
@@ -5,14 +5,78 @@
 lastkeys = nil
 server = nil
 ST_sockets = {}
+ST_buffers = {}
+ST_steps = {}
+ST_snapshots = {}
+ST_watches = {}
+ST_watchpoints = {}
+ST_histories = {}
+-- savestates by slot name, belong to the emulator so every connection sees them
+ST_states = {}
+-- id of the connection that asked for emulation to only run frames while a step
+-- is queued, see ST_holdFrames. Dropped along with that connection.
+ST_frameLock = nil
 nextID = 1
+untilKeyReset = -1
+
+-- every message is framed as type (uint8) | request id (uint16) | length (uint32) | payload
+-- see protocol.py for the client side
+HEADER_FMT = ">BI2I4"
+HEADER_LEN = 7
+MSG_REQUEST = 1
+MSG_REPLY = 2
+MSG_ERROR = 3
+MSG_EVENT = 4
+
+-- events are pushed with request id 0: frame (uint32) | address (uint16) | length (uint16)
+-- followed by the old and the new bytes
+EVENT_FMT = ">I4I2I2"
+-- dump_history replies with frame of the newest row (uint32) | rows (uint16), then the rows
+HISTORY_FMT = ">I4I2"
+HISTORY_HEADER_LEN = 6
+MAX_PAYLOAD = 1 << 20
+
+-- returned by a handler whose reply is sent later from a frame callback
+DEFERRED = {}
+
+WRAM_BASE = 49152
+WRAM_SIZE = 8192
+
+-- delta replies split WRAM into blocks and only send the ones that changed
+-- see delta.py for the client side
+DELTA_BLOCK = 64
+DELTA_BLOCKS = WRAM_SIZE // DELTA_BLOCK
+FLAG_KEYFRAME = 1
 
 local KEY_NAMES = { "A", "B", "s", "S", "<", ">", "^", "v", "R", "L" }
 
+local BUTTON_KEYS = {
+	U = C.GBA_KEY.UP,
+	R = C.GBA_KEY.RIGHT,
+	L = C.GBA_KEY.LEFT,
+	D = C.GBA_KEY.DOWN,
+	A = C.GBA_KEY.A,
+	B = C.GBA_KEY.B,
+	start = C.GBA_KEY.START,
+	select = C.GBA_KEY.SELECT,
+}
+
 function ST_stop(id)
 	local sock = ST_sockets[id]
 	ST_sockets[id] = nil
-	sock:close()
+	ST_buffers[id] = nil
+	ST_snapshots[id] = nil
+	ST_watches[id] = nil
+	ST_watchpoints[id] = nil
+	ST_histories[id] = nil
+	if ST_frameLock == id then
+		ST_frameLock = nil
+	end
+	if ST_steps[id] then
+		emu:clearKey(ST_steps[id][1].key)
+		ST_steps[id] = nil
+	end
+	if sock then sock:close() end
 end
 
 function ST_format(id, msg, isError)
@@ -50,77 +114,536 @@ function readRam(mem_name)
     console:error("Could not find %s", mem_name)
 end
 
+-- errors from send() that only mean it would have blocked, mGBA's wrapper and
+-- LuaSocket name them differently
+SEND_RETRY_ERRORS = { again = true, timeout = true }
+
+function ST_sendFrame(id, msgType, requestId, payload)
+	local sock = ST_sockets[id]
+	if not sock then return end
+	local data = string.pack(HEADER_FMT, msgType, requestId, #payload) .. payload
+	local sent = 0
+	while sent < #data do
+		-- send() gives the bytes it took of what it was handed, so hand it only the
+		-- rest rather than passing a start index and reading back a byte index
+		local count, err = sock:send(data:sub(sent + 1))
+		if count then
+			sent = sent + count
+		elseif not SEND_RETRY_ERRORS[err] then
+			ST_error(id, err)
+			return
+		end
+		-- otherwise the socket buffer is full until the client reads, try again
+	end
+end
+
+-- spans are packed as big-endian (address uint16, length uint16) pairs
+-- see readplan.py for how the client builds them
+function ST_parseSpans(packed)
+	if #packed % 4 ~= 0 then
+		error("malformed span list of length " .. #packed)
+	end
+	local spans = {}
+	local offset = 1
+	while offset <= #packed do
+		local addr, length
+		addr, length, offset = string.unpack(">I2I2", packed, offset)
+		spans[#spans + 1] = { addr, length }
+	end
+	return spans
+end
+
+function ST_readSpans(spans)
+	local parts = {}
+	for i, span in ipairs(spans) do
+		parts[i] = emu:readRange(span[1], span[2])
+	end
+	return table.concat(parts)
+end
+
+-- flags | bitmap of changed blocks | changed blocks, against the last snapshot sent
+-- on this connection. The first read on a connection is always a keyframe.
+function ST_deltaWram(id, keyframe)
+	local current = emu:readRange(WRAM_BASE, WRAM_SIZE)
+	local previous = ST_snapshots[id]
+	ST_snapshots[id] = current
+	if keyframe or previous == nil then
+		return string.char(FLAG_KEYFRAME) .. current
+	end
+	local bitmap = {}
+	local blocks = {}
+	for byteIdx = 0, DELTA_BLOCKS // 8 - 1 do
+		local bits = 0
+		for bit = 0, 7 do
+			local first = (byteIdx * 8 + bit) * DELTA_BLOCK + 1
+			local block = current:sub(first, first + DELTA_BLOCK - 1)
+			if block ~= previous:sub(first, first + DELTA_BLOCK - 1) then
+				bits = bits | (0x80 >> bit)
+				blocks[#blocks + 1] = block
+			end
+		end
+		bitmap[byteIdx + 1] = string.char(bits)
+	end
+	return string.char(0) .. table.concat(bitmap) .. table.concat(blocks)
+end
+
+-- how a command that ends in a WRAM read should shape its reply
+--   nil             all of WRAM
+--   R<packed spans> only the given spans
+--   D               delta against the last snapshot sent on this connection
+--   K               delta keyframe
+function ST_parseReadSpec(spec)
+	if spec == nil then
+		return nil
+	end
+	local kind = spec:sub(1, 1)
+	if kind == "R" then
+		return { spans = ST_parseSpans(spec:sub(2)) }
+	elseif kind == "D" and #spec == 1 then
+		return { delta = true }
+	elseif kind == "K" and #spec == 1 then
+		return { delta = true, keyframe = true }
+	end
+	error("malformed read spec " .. spec)
+end
+
+function ST_readWram(id, readSpec)
+	if readSpec == nil then
+		return emu:readRange(WRAM_BASE, WRAM_SIZE)
+	elseif readSpec.spans then
+		return ST_readSpans(readSpec.spans)
+	end
+	return ST_deltaWram(id, readSpec.keyframe)
+end
+
+-- settle_watch:<stable frames>:<packed spans>
+-- what adaptive steps on this connection watch to tell when the game has settled:
+-- once the spans read the same for <stable frames> frames in a row
+function ST_setWatch(id, args)
+	local stable, packed = args:match("^(%d+):(.+)$")
+	if not stable then
+		error("malformed settle_watch arguments")
+	end
+	ST_watches[id] = { spans = ST_parseSpans(packed), stable = math.max(tonumber(stable), 1) }
+	return "OK"
+end
+
+-- step:<button>:<hold frames>:<settle frames>[:<read spec>]
+-- press the button, hold it for some frames, release it, wait some more frames and
+-- only then reply with WRAM, shaped by the optional read spec. Saves the client a
+-- round trip per phase. Steps pipelined on one connection queue up and run back
+-- to back.
+-- Settle frames written as a<frames> make an adaptive step: settling stops as soon
+-- as the watch set of the connection holds still, or after that many frames at
+-- most, and the reply starts with the number of frames it took as a uint16.
+function ST_beginStep(id, requestId, args)
+	local button, hold, adaptive, settle, rest = args:match("^([^:]+):(%d+):(a?)(%d+)(.*)$")
+	if not button then
+		error("malformed step arguments " .. args)
+	end
+	local readSpec = nil
+	if #rest > 0 then
+		if rest:sub(1, 1) ~= ":" then
+			error("malformed step arguments " .. args)
+		end
+		readSpec = ST_parseReadSpec(rest:sub(2))
+	end
+	local key = BUTTON_KEYS[button]
+	if key == nil then
+		error("unknown button " .. button)
+	end
+	if adaptive == "a" and ST_watches[id] == nil then
+		error("adaptive step without a settle_watch")
+	end
+	local queue = ST_steps[id]
+	if queue == nil then
+		queue = {}
+		ST_steps[id] = queue
+	end
+	queue[#queue + 1] = {
+		requestId = requestId,
+		key = key,
+		hold = math.max(tonumber(hold), 1),
+		settle = tonumber(settle),
+		readSpec = readSpec,
+		adaptive = adaptive == "a",
+		settled = 0,
+		stableRun = 0,
+		watched = nil,
+	}
+	if #queue == 1 then
+		emu:addKey(key)
+	end
+end
+
+-- whether the watch set has read the same for long enough, called once per frame
+function ST_watchSettled(id, step)
+	local watch = ST_watches[id]
+	local current = ST_readSpans(watch.spans)
+	if current == step.watched then
+		step.stableRun = step.stableRun + 1
+	else
+		step.stableRun = 0
+		step.watched = current
+	end
+	return step.stableRun >= watch.stable
+end
+
+function ST_advanceSteps()
+	for id, queue in pairs(ST_steps) do
+		local step = queue[1]
+		if step.hold > 0 then
+			step.hold = step.hold - 1
+			if step.hold == 0 then
+				emu:clearKey(step.key)
+			end
+		elseif step.settle > 0 then
+			step.settle = step.settle - 1
+			step.settled = step.settled + 1
+			if step.adaptive and ST_watchSettled(id, step) then
+				step.settle = 0
+			end
+		end
+		if step.hold == 0 and step.settle == 0 then
+			table.remove(queue, 1)
+			if #queue > 0 then
+				emu:addKey(queue[1].key)
+			else
+				ST_steps[id] = nil
+			end
+			local reply = ST_readWram(id, step.readSpec)
+			if step.adaptive then
+				reply = string.pack(">I2", step.settled) .. reply
+			end
+			-- a failed send stops the socket, which also drops the rest of its queue
+			ST_sendFrame(id, MSG_REPLY, step.requestId, reply)
+		end
+	end
+end
+
+-- save_state:<slot>                  snapshot the emulator into an in memory slot
+-- load_state:<slot>[:<read spec>]     restore a slot and reply with WRAM, as for step
+-- get_state:<slot>                    the savestate in a slot, to keep or copy elsewhere
+-- put_state:<slot>:<savestate>        fill a slot with a savestate taken elsewhere
+-- Loading a state is a couple of milliseconds, which makes it the way to reset an
+-- episode. See startstates.py for the client side.
+function ST_parseSlot(args)
+	local slot, rest = args:match("^([%w_%-]+)(.*)$")
+	if not slot then
+		error("malformed savestate slot " .. args)
+	end
+	return slot, rest
+end
+
+function ST_getState(slot)
+	local state = ST_states[slot]
+	if state == nil then
+		error("no savestate in slot " .. slot)
+	end
+	return state
+end
+
+function ST_saveState(args)
+	local slot, rest = ST_parseSlot(args)
+	if #rest > 0 then
+		error("malformed savestate slot " .. args)
+	end
+	ST_states[slot] = emu:saveStateBuffer()
+	return "OK"
+end
+
+function ST_putState(args)
+	local slot, rest = ST_parseSlot(args)
+	if rest:sub(1, 1) ~= ":" or #rest < 2 then
+		error("put_state needs a savestate after the slot")
+	end
+	ST_states[slot] = rest:sub(2)
+	return "OK"
+end
+
+function ST_loadState(id, args)
+	local slot, rest = ST_parseSlot(args)
+	local readSpec = nil
+	if #rest > 0 then
+		if rest:sub(1, 1) ~= ":" then
+			error("malformed savestate slot " .. args)
+		end
+		readSpec = ST_parseReadSpec(rest:sub(2))
+	end
+	if ST_steps[id] then
+		error("cannot load a savestate with steps in flight")
+	end
+	if not emu:loadStateBuffer(ST_getState(slot)) then
+		error("failed to load savestate " .. slot)
+	end
+	-- nothing is held down at the start of an episode
+	emu:setKeys(0)
+	return ST_readWram(id, readSpec)
+end
+
+-- watch:<packed spans>
+-- push an event to this connection whenever one of the spans changes, so rare
+-- changes are seen on the frame they happen without reading anything. Replaces what
+-- the connection watched before, no spans at all stops watching.
+function ST_setWatchpoints(id, packed)
+	local points = {}
+	for i, span in ipairs(ST_parseSpans(packed)) do
+		points[i] = { addr = span[1], length = span[2], last = emu:readRange(span[1], span[2]) }
+	end
+	if #points > 0 then
+		ST_watchpoints[id] = points
+	else
+		ST_watchpoints[id] = nil
+	end
+	return "OK"
+end
+
+-- frame callback ahead of ST_advanceSteps, so the events of the last frame of a
+-- step go out before its reply
+function ST_checkWatchpoints()
+	local frame = nil
+	for id, points in pairs(ST_watchpoints) do
+		for _, point in ipairs(points) do
+			local current = emu:readRange(point.addr, point.length)
+			if current ~= point.last then
+				frame = frame or emu:currentFrame()
+				local event = string.pack(EVENT_FMT, frame, point.addr, point.length) .. point.last .. current
+				point.last = current
+				ST_sendFrame(id, MSG_EVENT, 0, event)
+			end
+		end
+	end
+end
+
+-- history:<frames>:<packed spans>
+-- keep what the spans read on each of the last <frames> frames, so whatever happened
+-- in between two reads (a battle starting and ending within a hold) can be looked
+-- at after the fact with dump_history. Replaces the history of this connection,
+-- zero frames or no spans stops recording.
+function ST_setHistory(id, args)
+	local frames, packed = args:match("^(%d+):(.*)$")
+	if not frames then
+		error("malformed history arguments")
+	end
+	frames = tonumber(frames)
+	local spans = ST_parseSpans(packed)
+	if frames == 0 or #spans == 0 then
+		ST_histories[id] = nil
+		return "OK"
+	end
+	local width = 0
+	for _, span in ipairs(spans) do
+		width = width + span[2]
+	end
+	if frames > 0xFFFF or HISTORY_HEADER_LEN + frames * width > MAX_PAYLOAD then
+		error(frames .. " frames of " .. width .. " bytes do not fit in one reply")
+	end
+	ST_histories[id] = { spans = spans, frames = frames, rows = {}, head = 0, count = 0, frame = 0 }
+	return "OK"
+end
+
+-- frame callback ahead of ST_advanceSteps, so the last frame of a step is in the
+-- history by the time its reply goes out
+function ST_recordHistory()
+	for _, history in pairs(ST_histories) do
+		history.head = history.head % history.frames + 1
+		history.rows[history.head] = ST_readSpans(history.spans)
+		history.count = math.min(history.count + 1, history.frames)
+		history.frame = emu:currentFrame()
+	end
+end
+
+-- the recorded rows oldest first, leaving them in place
+function ST_dumpHistory(id)
+	local history = ST_histories[id]
+	if history == nil then
+		error("no history recorded on this connection")
+	end
+	local parts = { string.pack(HISTORY_FMT, history.frame, history.count) }
+	for i = 0, history.count - 1 do
+		parts[#parts + 1] = history.rows[(history.head - history.count + i) % history.frames + 1]
+	end
+	return table.concat(parts)
+end
+
+-- frame_lock:1 pauses emulation between steps, so every step starts on the frame
+-- after the previous one ended and runs exactly its hold plus settle frames, however
+-- long the client takes in between. Set the frontend to fast forward unbounded and
+-- the emulator runs flat out while a step is in flight. frame_lock:0, or closing
+-- the connection, lets it run freely again.
+function ST_setFrameLock(id, arg)
+	if arg == "1" then
+		if not ST_canWait(ST_sockets[id]) then
+			error("frame_lock needs select() on the socket, which this mGBA build does not expose")
+		end
+		ST_frameLock = id
+	elseif arg == "0" then
+		ST_frameLock = nil
+	else
+		error("frame_lock takes 0 or 1, got " .. arg)
+	end
+	return "OK"
+end
+
+-- frame callback that blocks until some connection queues a step. Requests that
+-- reply straight away are served meanwhile, against a state that holds still. Gives
+-- up once there is nobody left to send a step.
+-- Rather than spinning on poll(), which would keep a core busy for every paused
+-- emulator, each round sleeps in select() on the socket of whoever holds the lock,
+-- as that is where the next step comes from. Other connections and new ones are
+-- only looked at between rounds, so they wait up to HOLD_WAIT_MS for a reply.
+-- The public socket API has no blocking wait, so this reaches for select() on the
+-- wrapped socket, and frame_lock:1 is refused where that is missing rather than
+-- holding frames in a busy loop.
+HOLD_WAIT_MS = 5
+
+function ST_canWait(sock)
+	-- poll() in mGBA's socket wrapper is a select(0) on the underlying socket
+	return sock ~= nil and sock._s ~= nil and sock._s.select ~= nil
+end
+
+function ST_waitForData(sock, ms)
+	if not ST_canWait(sock) then
+		error("Cannot wait on a socket without select()")
+	end
+	sock._s:select(ms)
+end
+
+function ST_holdFrames()
+	while ST_frameLock ~= nil and next(ST_steps) == nil and next(ST_sockets) ~= nil do
+		ST_waitForData(ST_sockets[ST_frameLock], HOLD_WAIT_MS)
+		server:poll()
+		for id, sock in pairs(ST_sockets) do
+			sock:poll()
+		end
+	end
+end
+
+function ST_handle(id, requestId, p)
+	if p:sub(1, 2) == "B:" then
+		buttons = p:sub(3)
+		untilKeyReset = 2
+		if buttons:find("U") then
+			emu:addKey(C.GBA_KEY.UP)
+		elseif buttons:find("R") then
+			emu:addKey(C.GBA_KEY.RIGHT)
+		elseif buttons:find("L") then
+			emu:addKey(C.GBA_KEY.LEFT)
+		elseif buttons:find("D") then
+			emu:addKey(C.GBA_KEY.DOWN)
+		elseif buttons:find("A") then
+			emu:addKey(C.GBA_KEY.A)
+		elseif buttons:find("B") then
+			emu:addKey(C.GBA_KEY.B)
+		elseif buttons == "start" then
+			emu:addKey(C.GBA_KEY.START)
+		elseif buttons == "select" then
+			emu:addKey(C.GBA_KEY.SELECT)
+		else
+			console:log("Warning: don't recognize input")
+			return "NOT OK"
+		end
+		return "OK"
+	elseif p:sub(1, 5) == "step:" then
+		ST_beginStep(id, requestId, p:sub(6))
+		return DEFERRED
+	elseif p:sub(1, 12) == "read_ranges:" then
+		return ST_readSpans(ST_parseSpans(p:sub(13)))
+	elseif p:sub(1, 6) == "watch:" then
+		return ST_setWatchpoints(id, p:sub(7))
+	elseif p:sub(1, 8) == "history:" then
+		return ST_setHistory(id, p:sub(9))
+	elseif p == "dump_history" then
+		return ST_dumpHistory(id)
+	elseif p:sub(1, 13) == "settle_watch:" then
+		return ST_setWatch(id, p:sub(14))
+	elseif p:sub(1, 11) == "frame_lock:" then
+		return ST_setFrameLock(id, p:sub(12))
+	elseif p == "frame" then
+		return tostring(emu:currentFrame())
+	elseif p:sub(1, 11) == "save_state:" then
+		return ST_saveState(p:sub(12))
+	elseif p:sub(1, 11) == "load_state:" then
+		return ST_loadState(id, p:sub(12))
+	elseif p:sub(1, 10) == "get_state:" then
+		return ST_getState(ST_parseSlot(p:sub(11)))
+	elseif p:sub(1, 10) == "put_state:" then
+		return ST_putState(p:sub(11))
+	elseif p == "checksum" then
+		return emu:checksum()
+	elseif p == "screenshot" then
+		emu:screenshot("current.png")
+		return "OK"
+	elseif p == "dump_wram" then
+		-- NOTE: reading wram normally seems to be broken :(
+		return emu:readRange(WRAM_BASE, WRAM_SIZE)
+	elseif p == "dump_wram_delta" then
+		return ST_deltaWram(id, false)
+	elseif p == "dump_wram_delta:key" then
+		return ST_deltaWram(id, true)
+	elseif p == "dump_hram" then
+		return readRam("hram")
+	elseif p == "dump_sram" then
+		return readRam("sram")
+	elseif p == "dump_vram" then
+		return readRam("vram")
+	elseif p == "fasttext" then
+		emu:write8(54101, 0)
+		return "OK"
+	elseif p == "memtest" then
+		return emu:readRange(53248, 4096)
+	elseif p == "test" then
+		console:log("test")
+		return "OK"
+	else
+		emu:setKeys(0)
+		return "OK"
+	end
+end
+
+function ST_dispatch(id, requestId, payload)
+	local ok, result = pcall(ST_handle, id, requestId, payload)
+	if not ok then
+		console:error(ST_format(id, tostring(result), true))
+		ST_sendFrame(id, MSG_ERROR, requestId, tostring(result))
+	elseif result == DEFERRED then
+		return
+	elseif result == nil then
+		ST_sendFrame(id, MSG_ERROR, requestId, "no reply for " .. payload)
+	else
+		ST_sendFrame(id, MSG_REPLY, requestId, result)
+	end
+end
+
 function ST_received(id)
 	local sock = ST_sockets[id]
 	if not sock then return end
 	while true do
 		local p, err = sock:receive(1024)
-		if p then
-			if p:sub(1, 2) == "B:" then
-				buttons = p:sub(3)
-				if buttons:find("U") then
-					emu:addKey(C.GBA_KEY.UP)
-					sock:send("OK")
-                elseif buttons:find("R") then
-					emu:addKey(C.GBA_KEY.RIGHT)
-					sock:send("OK")
-                elseif buttons:find("L") then
-					emu:addKey(C.GBA_KEY.LEFT)
-					sock:send("OK")
-                elseif buttons:find("D") then
-					emu:addKey(C.GBA_KEY.DOWN)
-					sock:send("OK")
-                elseif buttons:find("A") then
-					emu:addKey(C.GBA_KEY.A)
-					sock:send("OK")
-                elseif buttons:find("B") then
-					emu:addKey(C.GBA_KEY.B)
-					sock:send("OK")
-                elseif buttons == "start" then
-					emu:addKey(C.GBA_KEY.START)
-					sock:send("OK")
-                elseif buttons == "select" then
-					emu:addKey(C.GBA_KEY.SELECT)
-					sock:send("OK")
-                else
-                    console:log("Warning: don't recognize input")
-					sock:send("NOT OK")
-				end
-				untilKeyReset = 2
-            elseif p == "checksum" then
-                sock:send(emu:checksum())
-			elseif p == "screenshot" then
-				emu:screenshot("current.png")
-				sock:send("OK")
-            elseif p == "dump_wram" then
-				-- NOTE: reading wram normally seems to be broken :(
-				result = emu:readRange(49152, 8192)
-                sock:send(result)
-            elseif p == "dump_hram" then
-                result = readRam("hram")
-                sock:send(result)
-            elseif p == "dump_sram" then
-                result = readRam("sram")
-                sock:send(result)
-            elseif p == "dump_vram" then
-                result = readRam("vram")
-                sock:send(result)
-			elseif p == "fasttext" then
-				emu:write8(54101, 0)
-				sock:send('OK')
-			elseif p == "memtest" then
-				result = emu:readRange(53248, 4096)
-				sock:send(result)
-            elseif p == "test" then
-                console:log("test")
-            else
-                emu:setKeys(0)
-				sock:send("OK")
-            end
+		if not p then
+			break
+		end
+		ST_buffers[id] = ST_buffers[id] .. p
+	end
+
+	-- a single receive can hold several requests, or only part of one
+	local buffer = ST_buffers[id]
+	local offset = 1
+	while #buffer - offset + 1 >= HEADER_LEN do
+		local msgType, requestId, length = string.unpack(HEADER_FMT, buffer, offset)
+		if #buffer - offset + 1 < HEADER_LEN + length then
+			break
+		end
+		local payload = buffer:sub(offset + HEADER_LEN, offset + HEADER_LEN + length - 1)
+		offset = offset + HEADER_LEN + length
+		if msgType == MSG_REQUEST then
+			ST_dispatch(id, requestId, payload)
 		else
-			return
+			console:error(ST_format(id, "unexpected message type " .. msgType, true))
 		end
+		if not ST_sockets[id] then return end
 	end
+	ST_buffers[id] = buffer:sub(offset)
 end
 
 function ST_scankeys()
@@ -151,6 +674,7 @@ function ST_accept()
 	local id = nextID
 	nextID = id + 1
 	ST_sockets[id] = sock
+	ST_buffers[id] = ""
 	sock:add("received", function() ST_received(id) end)
 	sock:add("error", function() ST_error(id) end)
 	console:log(ST_format(id, "Connected"))
@@ -169,8 +693,13 @@ function setSpeed()
 	emu:write8()
 end
 
+callbacks:add("frame", ST_checkWatchpoints)
+callbacks:add("frame", ST_recordHistory)
+callbacks:add("frame", ST_advanceSteps)
 callbacks:add("frame", resetKeys)
 callbacks:add("frame", setSpeed)
+-- blocks, so after everything else that happens on a frame
+callbacks:add("frame", ST_holdFrames)
 
 local port = 10018
 server = nil
@@ -1,77 +1,421 @@
+import hashlib
 import typing as T
 
+import numpy as np
+
 from models import *
+from readplan import ReadPlan
+from readplan import compile_read_plan
+
+
+class EntitySlot(T.NamedTuple):
+    """
+    Where an entity lives in WRAM
+
+    Slots with a count greater than one are lists of entities laid out every
+    `stride` bytes starting at `addr`.
+    """
+
+    attr: str
+    model_klass: T.Type["Entity"]
+    addr: int
+    count: int = 1
+    stride: int = 0
+
+    def addresses(self) -> T.List[int]:
+        return [self.addr + self.stride * idx for idx in range(self.count)]
+
+
+class MemoryDiff:
+    """
+    Fields that differ between two WRAM reads
+
+    Fields are identified by the MemoryMap attribute of their entity, the index of
+    the entity for lists (0 for singletons) and the field label.
+    """
+
+    __slots__ = ("fields", "nbytes", "_by_attr")
+
+    def __init__(self, fields: T.Iterable[T.Tuple[str, int, str]], nbytes: int) -> None:
+        self.fields = frozenset(fields)
+        self.nbytes = nbytes
+        self._by_attr: T.Dict[str, T.Set[str]] = {}
+        for attr, _idx, label in self.fields:
+            self._by_attr.setdefault(attr, set()).add(label)
+
+    @property
+    def entities(self) -> T.Set[str]:
+        return set(self._by_attr)
+
+    def labels(self, attr: str, idx: T.Optional[int] = None) -> T.Set[str]:
+        """
+        Changed fields of an entity, of any entity in the list if no index is given
+        """
+        if idx is None:
+            return set(self._by_attr.get(attr, ()))
+        return {label for field_attr, field_idx, label in self.fields if field_attr == attr and field_idx == idx}
+
+    def touched(self, attr: str, label: T.Optional[str] = None) -> bool:
+        """
+        Whether an entity (any of them, for lists) or one of its fields changed
+        """
+        labels = self._by_attr.get(attr)
+        if labels is None:
+            return False
+        return label is None or label in labels
+
+    def __bool__(self) -> bool:
+        return bool(self.fields)
+
+    def __repr__(self) -> str:
+        return f"MemoryDiff({len(self.fields)} fields in {sorted(self._by_attr)}, {self.nbytes} bytes)"
 
 
 class MemoryMap:
     """
     Manually assign slots
 
-    Top-level object is not a pydantic model so I can retain my sanity
+    Top-level object is a plain class so I can retain my sanity
     """
 
     REGION_START_ADDR = 0xC000
+    REGION_SIZE = 0x2000
+
+    # filled in per instance from LAYOUT
+    sprites: T.List[Sprite]
+    tile: Tile
+    menu: Menu
+    battle: Battle
+    pokemart: PokemonMart
+    name_rater: NameRater
+    battle2: Battle2
+    battle3: Battle3
+    battle_pokemon: BattlePokemon
+    battle4: Battle4
+    battle_status: BattleStatus
+    game_corner: GameCorner
+    player: Player
+    pokedex: PokedexCompletion
+    inventory: Inventory
+    badges: Badges
+    location: Location
+    events: EventFlags
+    tileset_header: TilesetHeader
+    pokemon: T.List[Pokemon]
+
+    LAYOUT: T.List[EntitySlot] = [
+        # Singletons
+        EntitySlot("tile", Tile, 0xC3A0),
+        EntitySlot("menu", Menu, 0xCC24),
+        EntitySlot("battle", Battle, 0xCCD5),
+        EntitySlot("pokemart", PokemonMart, 0xCF7B),
+        EntitySlot("name_rater", NameRater, 0xCF92),
+        EntitySlot("battle2", Battle2, 0xCCDC),
+        EntitySlot("battle3", Battle3, 0xCFCC),
+        EntitySlot("battle_pokemon", BattlePokemon, 0xD009),
+        EntitySlot("battle4", Battle4, 0xD05A),
+        EntitySlot("battle_status", BattleStatus, 0xD062),
+        EntitySlot("game_corner", GameCorner, 0xD13D),
+        EntitySlot("player", Player, 0xD158),
+        EntitySlot("pokedex", PokedexCompletion, 0xD2F7),
+        EntitySlot("inventory", Inventory, 0xD31D),
+        EntitySlot("badges", Badges, 0xD356),
+        EntitySlot("location", Location, 0xD35E),
+        EntitySlot("events", EventFlags, 0xD5A6),
+        EntitySlot("tileset_header", TilesetHeader, 0xD52B),
+        # Lists
+        EntitySlot("sprites", Sprite, 0xC100, count=16, stride=0x0010),
+        EntitySlot("pokemon", Pokemon, 0xD16B, count=6, stride=0x002C),
+    ]
+
+    # merging spans up to this many bytes apart costs ~20% more bytes but turns
+    # over a hundred tiny reads into about twenty
+    READ_PLAN_GAP = 16
+    _READ_PLAN: T.Optional[ReadPlan] = None
+    _FIELD_TABLE: T.Optional[T.Tuple[T.List[T.Tuple[str, int, str]], np.ndarray]] = None
+    _PLAN_MASK: T.Optional[np.ndarray] = None
+    # cheap fields that keep changing while the game is still reacting to a button:
+    # the player walking, a menu cursor moving, text being printed
+    SETTLE_WATCH: T.List[T.Tuple[str, int, str]] = [
+        ("location", 0, "y_position"),
+        ("location", 0, "x_position"),
+        ("sprites", 0, "walk_animation_counter"),
+        ("menu", 0, "y_position"),
+        ("menu", 0, "x_position"),
+        ("menu", 0, "selected_item"),
+        ("tile", 0, "onscreen_tiles"),
+    ]
+    # rarely changing fields whose changes the server can push as they happen
+    EVENT_WATCH: T.List[T.Tuple[str, int, str]] = [
+        ("location", 0, "map_number"),
+        ("player", 0, "pokemon_in_party"),
+    ]
+    _KEY_OFFSETS: T.Dict[T.Optional[T.Tuple[T.Tuple[str, str], ...]], np.ndarray] = {}
+    _KEY_SPANS: T.Dict[T.Optional[T.Tuple[T.Tuple[str, str], ...]], T.List[slice]] = {}
+
+    def __init__(self, memory: T.Optional[bytes] = None) -> None:
+        """
+        Every entity is created once here as a view into a buffer the map owns, so
+        rehydrating is a copy into that buffer and nothing else
+        """
+        self._memory = bytearray(self.REGION_SIZE)
+        self._previous = bytearray(self.REGION_SIZE)
+        self._changes: T.Optional[MemoryDiff] = None
+        self._content_keys: T.Dict[T.Optional[T.Tuple[T.Tuple[str, str], ...]], bytes] = {}
+        # (entity, span of its text fields) for the few entities that cache text
+        self._text_entities: T.List[T.Tuple[Entity, slice]] = []
+        for slot in self.LAYOUT:
+            texts = slot.model_klass.address_map().decoder().texts
+            entities = []
+            for addr in slot.addresses():
+                offset = addr - self.REGION_START_ADDR
+                entity = slot.model_klass(self._memory, offset)
+                if texts:
+                    span = slice(offset + min(start for _, start, _ in texts), offset + max(end for _, _, end in texts))
+                    self._text_entities.append((entity, span))
+                entities.append(entity)
+            setattr(self, slot.attr, entities[0] if slot.count == 1 else entities)
+        if memory is not None:
+            self.update_from_memory(memory)
+
+    @property
+    def memory(self) -> memoryview:
+        """
+        WRAM the entities currently look at, read only
+        """
+        return memoryview(self._memory).toreadonly()
+
+    @classmethod
+    def field_ranges(cls) -> T.Iterator[T.Tuple[int, int]]:
+        """
+        Absolute (start, end) address of every field of every entity we decode
+        """
+        for slot in cls.LAYOUT:
+            for addr in slot.addresses():
+                for field in slot.model_klass.address_map()._FIELDS:
+                    yield (addr + field.addr, addr + field.addr + field.len)
 
-    sprites: T.List[Sprite] = list()
-    tile: Tile = None
-    menu: Menu = None
-    battle: Battle = None
-    pokemart: PokemonMart = None
-    name_rater: NameRater = None
-    battle2: Battle2 = None
-    battle3: Battle3 = None
-    battle_pokemon: BattlePokemon = None
-    battle4: Battle4 = None
-    battle_status: BattleStatus = None
-    game_corner: GameCorner = None
-    player: Player = None
-    pokedex: PokedexCompletion = None
-    inventory: Inventory = None
-    badges: Badges = None
-    location: Location = None
-    events: EventFlags = None
-    pokemon: T.List[Pokemon] = list()
+    @classmethod
+    def read_plan(cls) -> ReadPlan:
+        """
+        Minimal set of WRAM spans covering everything hydrate_from_memory reads
+        """
+        if cls._READ_PLAN is None:
+            cls._READ_PLAN = compile_read_plan(
+                cls.field_ranges(),
+                base_addr=cls.REGION_START_ADDR,
+                gap=cls.READ_PLAN_GAP,
+            )
+        return cls._READ_PLAN
+
+    @classmethod
+    def settle_plan(cls, fields: T.Optional[T.Iterable[T.Tuple[str, int, str]]] = None) -> ReadPlan:
+        """
+        Spans covering the (attr, index, label) fields that adaptive steps watch,
+        SETTLE_WATCH unless given
+        """
+        return cls.fields_plan(cls.SETTLE_WATCH if fields is None else fields, gap=cls.READ_PLAN_GAP)
+
+    @classmethod
+    def event_plan(cls, fields: T.Optional[T.Iterable[T.Tuple[str, int, str]]] = None) -> ReadPlan:
+        """
+        Spans of exactly the fields to put watchpoints on, EVENT_WATCH unless given.
+        Nothing in between is merged in, so every event is a change to one of them.
+        """
+        return cls.fields_plan(cls.EVENT_WATCH if fields is None else fields, gap=0)
+
+    @classmethod
+    def fields_plan(cls, fields: T.Iterable[T.Tuple[str, int, str]], gap: int) -> ReadPlan:
+        wanted = set(fields)
+        keys, bounds = cls.field_table()
+        starts, ends = bounds.reshape(2, -1)
+        ranges = [
+            (int(starts[idx]) + cls.REGION_START_ADDR, int(ends[idx]) + cls.REGION_START_ADDR)
+            for idx, key in enumerate(keys)
+            if key in wanted
+        ]
+        if len(ranges) != len(wanted):
+            raise ValueError(f"Unknown fields to watch: {wanted - set(keys)}")
+        return compile_read_plan(ranges, base_addr=cls.REGION_START_ADDR, gap=gap)
 
     @classmethod
-    def apply_offset(cls, memory: bytes, model_klass: T.Type["Entity"], start_addr: int) -> "Entity":
-        return model_klass.hydrate_from_memory(memory, start_addr - cls.REGION_START_ADDR)
+    def field_table(cls) -> T.Tuple[T.List[T.Tuple[str, int, str]], np.ndarray]:
+        """
+        Every decoded field as (attr, index, label), and the offsets into the region
+        of all their starts followed by all their ends
+        """
+        if cls._FIELD_TABLE is None:
+            keys, starts, ends = [], [], []
+            for slot in cls.LAYOUT:
+                for idx, addr in enumerate(slot.addresses()):
+                    for field in slot.model_klass.address_map()._FIELDS:
+                        keys.append((slot.attr, idx, field.label))
+                        starts.append(addr + field.addr - cls.REGION_START_ADDR)
+                        ends.append(addr + field.addr + field.len - cls.REGION_START_ADDR)
+            cls._FIELD_TABLE = (keys, np.array(starts + ends, dtype=np.intp))
+        return cls._FIELD_TABLE
+
+    @classmethod
+    def diff(cls, prev: T.Union["MemoryMap", bytes], next: T.Union["MemoryMap", bytes]) -> MemoryDiff:
+        """
+        Which fields changed between two maps or WRAM reads
+
+        Bytes are compared in one vectorized pass and only those in the read plan
+        count, which covers every field. A field changed if any changed byte falls
+        inside it, found for all fields at once by searching the sorted changed
+        offsets for the field boundaries.
+        """
+        if isinstance(prev, MemoryMap):
+            prev = prev._memory
+        if isinstance(next, MemoryMap):
+            next = next._memory
+        changed = np.not_equal(np.frombuffer(prev, dtype=np.uint8), np.frombuffer(next, dtype=np.uint8))
+        changed &= cls._plan_mask()
+        positions = np.flatnonzero(changed)
+        if not len(positions):
+            return MemoryDiff((), 0)
+
+        keys, bounds = cls.field_table()
+        # number of changed bytes before each field's start and end
+        before = np.searchsorted(positions, bounds).reshape(2, -1)
+        hits = np.flatnonzero(before[0] != before[1])
+        return MemoryDiff([keys[idx] for idx in hits.tolist()], len(positions))
+
+    @classmethod
+    def _plan_mask(cls) -> np.ndarray:
+        if cls._PLAN_MASK is None:
+            mask = np.zeros(cls.REGION_SIZE, dtype=bool)
+            mask[cls.read_plan().offsets] = True
+            cls._PLAN_MASK = mask
+        return cls._PLAN_MASK
+
+    @classmethod
+    def batch_records(cls, snapshots: np.ndarray) -> T.Dict[str, np.ndarray]:
+        """
+        Structured views of every entity across a stack of WRAM snapshots
+
+        `snapshots` is (N, 8192) uint8. Singletons come back as (N,) records and
+        lists as (N, count), all of them strided views of the snapshots, so nothing
+        is copied.
+        """
+        snapshots = np.ascontiguousarray(snapshots, dtype=np.uint8)
+        if snapshots.ndim != 2:
+            raise ValueError(f"Expected (N, size) snapshots, got shape {snapshots.shape}")
+        row = snapshots.strides[0]
+        output = {}
+        for slot in cls.LAYOUT:
+            shape, strides = (len(snapshots),), (row,)
+            if slot.count > 1:
+                shape, strides = (len(snapshots), slot.count), (row, slot.stride)
+            output[slot.attr] = np.ndarray(
+                shape,
+                dtype=slot.model_klass.address_map().dtype(),
+                buffer=snapshots,
+                offset=slot.addr - cls.REGION_START_ADDR,
+                strides=strides,
+            )
+        return output
+
+    @classmethod
+    def decode_batch(cls, snapshots: np.ndarray) -> T.Dict[str, T.Dict[str, np.ndarray]]:
+        """
+        Columns per field per entity for a stack of WRAM snapshots, e.g.
+        `decode_batch(trace.snapshots)["location"]["map_number"]` is (N,) and
+        `decode_batch(trace.snapshots)["sprites"]["x_position"]` is (N, 16)
+        """
+        return {
+            slot.attr: slot.model_klass.address_map().columns(records)
+            for slot, records in zip(cls.LAYOUT, cls.batch_records(snapshots).values())
+        }
 
     @classmethod
     def hydrate_from_memory(cls, memory: bytes) -> "MemoryMap":
-        mmap = cls()
-
-        # Build Singletons
-        cls.tile = Tile.hydrate_from_memory(memory, 0xC3A0 - cls.REGION_START_ADDR)
-        cls.menu = Menu.hydrate_from_memory(memory, 0xCC24 - cls.REGION_START_ADDR)
-        cls.battle = Battle.hydrate_from_memory(memory, 0xCCD5 - cls.REGION_START_ADDR)
-        cls.pokemart = PokemonMart.hydrate_from_memory(memory, 0xCF7B - cls.REGION_START_ADDR)
-        cls.name_rater = NameRater.hydrate_from_memory(memory, 0xCF92 - cls.REGION_START_ADDR)
-        cls.battle2 = Battle2.hydrate_from_memory(memory, 0xCCDC - cls.REGION_START_ADDR)
-        cls.battle3 = Battle3.hydrate_from_memory(memory, 0xCFCC - cls.REGION_START_ADDR)
-        cls.battle_pokemon = BattlePokemon.hydrate_from_memory(memory, 0xD009 - cls.REGION_START_ADDR)
-        cls.battle4 = Battle4.hydrate_from_memory(memory, 0xD05A - cls.REGION_START_ADDR)
-        cls.battle_status = BattleStatus.hydrate_from_memory(memory, 0xD062 - cls.REGION_START_ADDR)
-        cls.game_corner = GameCorner.hydrate_from_memory(memory, 0xD13D - cls.REGION_START_ADDR)
-        cls.player = Player.hydrate_from_memory(memory, 0xD158 - cls.REGION_START_ADDR)
-        cls.pokedex = PokedexCompletion.hydrate_from_memory(memory, 0xD2F7 - cls.REGION_START_ADDR)
-        cls.inventory = Inventory.hydrate_from_memory(memory, 0xD31D - cls.REGION_START_ADDR)
-        cls.badges = Badges.hydrate_from_memory(memory, 0xD356 - cls.REGION_START_ADDR)
-        cls.location = Location.hydrate_from_memory(memory, 0xD35E - cls.REGION_START_ADDR)
-        cls.events = EventFlags.hydrate_from_memory(memory, 0xD5A6 - cls.REGION_START_ADDR)
-        cls.tileset_header = TilesetHeader.hydrate_from_memory(memory, 0xD52B - cls.REGION_START_ADDR)
-
-        # Build Sprites
-        sprite_base_addr = 0xC100
-        sprite_incr_addr = 0x0010
-        for sprite_idx in range(16):
-            addr = sprite_base_addr + sprite_incr_addr * sprite_idx
-            mmap.sprites.append(Sprite.hydrate_from_memory(memory, addr - cls.REGION_START_ADDR))
-
-        # Build Pokemon
-        pokemon_base_addr = 0xD16B
-        pokemon_incr_addr = 0x002C
-        for pokemon_idx in range(6):
-            addr = pokemon_base_addr + pokemon_incr_addr * pokemon_idx
-            mmap.pokemon.append(Pokemon.hydrate_from_memory(memory, addr - cls.REGION_START_ADDR))
-
-        return mmap
+        """
+        New map over a copy of `memory`, prefer update_from_memory on a map that is
+        kept around when doing this every step
+        """
+        return cls(memory)
+
+    def update_from_memory(self, memory: bytes) -> "MemoryMap":
+        """
+        Rehydrate in place from a new WRAM read
+
+        Entities already handed out see the new values, use snapshot() to hold on
+        to the current state.
+        """
+        if len(memory) != self.REGION_SIZE:
+            raise ValueError(f"Expected {self.REGION_SIZE} bytes of WRAM, got {len(memory)}")
+        self._previous[:] = self._memory
+        self._memory[:] = memory
+        self._changes = None
+        self._content_keys.clear()
+        # decoded text stays good as long as its bytes did not change
+        for entity, span in self._text_entities:
+            if self._memory[span] != self._previous[span]:
+                entity.invalidate()
+        return self
+
+    @property
+    def changes(self) -> MemoryDiff:
+        """
+        What the last update_from_memory changed, worked out on first access
+        """
+        if self._changes is None:
+            self._changes = self.diff(self._previous, self._memory)
+        return self._changes
+
+    @classmethod
+    def key_offsets(cls, fields: T.Optional[T.Tuple[T.Tuple[str, str], ...]] = None) -> np.ndarray:
+        """
+        Offsets into the region of the bytes of the given (entity, field) pairs, of
+        every index for lists, or of the whole read plan
+        """
+        if fields not in cls._KEY_OFFSETS:
+            if fields is None:
+                offsets = cls.read_plan().offsets
+            else:
+                keys, bounds = cls.field_table()
+                wanted = set(fields)
+                starts, ends = bounds.reshape(2, -1)
+                offsets = np.concatenate([
+                    np.arange(starts[idx], ends[idx])
+                    for idx, (attr, _, label) in enumerate(keys)
+                    if (attr, label) in wanted
+                ])
+            cls._KEY_OFFSETS[fields] = offsets
+        return cls._KEY_OFFSETS[fields]
+
+    @classmethod
+    def key_spans(cls, fields: T.Optional[T.Tuple[T.Tuple[str, str], ...]] = None) -> T.List[slice]:
+        """
+        key_offsets merged into contiguous runs, so keys hash slices of the region
+        without gathering its bytes first
+        """
+        if fields not in cls._KEY_SPANS:
+            offsets = cls.key_offsets(fields)
+            breaks = np.flatnonzero(np.diff(offsets) != 1) + 1
+            cls._KEY_SPANS[fields] = [
+                slice(int(run[0]), int(run[-1]) + 1) for run in np.split(offsets, breaks) if len(run)
+            ]
+        return cls._KEY_SPANS[fields]
+
+    def content_key(self, fields: T.Optional[T.Tuple[T.Tuple[str, str], ...]] = None) -> bytes:
+        """
+        A 16 byte digest of the given (entity, field) pairs, or of everything the
+        entities decode, for memoizing whatever is a pure function of them. Worked
+        out once per update.
+        """
+        key = self._content_keys.get(fields)
+        if key is None:
+            view = memoryview(self._memory)
+            digest = hashlib.blake2b(digest_size=16)
+            for span in self.key_spans(fields):
+                digest.update(view[span])
+            key = self._content_keys[fields] = digest.digest()
+        return key
+
+    def snapshot(self) -> "MemoryMap":
+        """
+        Independent copy that later updates do not touch
+        """
+        return type(self)(self._memory)
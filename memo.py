@@ -0,0 +1,64 @@
+"""
+Memoizing what is a pure function of the decoded WRAM
+
+The agent spends long stretches in menus and against walls where nothing it
+decodes changes, so the same observations and rewards get worked out again and
+again. Results are kept in a small LRU cache keyed on `MemoryMap.content_key`,
+a 128 bit digest of just the fields a result depends on, so timers and the like
+ticking elsewhere in WRAM do not defeat it and keys stay small. Lookups still
+cost about as much as the work they save on a typical trace, so environments
+leave caching off unless asked, see `python benchmark.py memo`.
+"""
+from collections import OrderedDict
+import typing as T
+
+
+class MemoCache:
+    """
+    Least recently used cache that counts its hits and misses
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        if maxsize < 1:
+            raise ValueError(f"Cache needs room for at least one entry, got {maxsize}")
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[T.Hashable, T.Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: T.Hashable) -> T.Optional[T.Any]:
+        """
+        Cached value for `key`, None on a miss
+        """
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: T.Hashable, value: T.Any) -> None:
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> T.Dict[str, float]:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate, "size": len(self)}
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return f"MemoCache({len(self)} of {self.maxsize}, {self.hits} hits, {self.misses} misses, {self.hit_rate:.1%})"
@@ -1,10 +1,11 @@
 """
 Parse Pokemon State Objects from RAM
 """
+import codecs
 import struct
 import typing as T
-from pydantic import BaseModel
-from pydantic import PrivateAttr
+
+import numpy as np
 
 
 TEXT_LOOKUP = {
@@ -113,8 +114,27 @@ TEXT_LOOKUP = {
 TEXT_LOOKUP.update({int.from_bytes(x): y for x, y in TEXT_LOOKUP.items()})
 
 
+# Decoding runs in C through a charmap codec with one character per byte. Codes
+# whose text is not exactly one character (POKé, A1, ...) decode to a placeholder
+# from the private use area first and are expanded afterwards.
+_TEXT_EXPANSIONS = {}
+_TEXT_CHARS = []
+for _code in range(256):
+    _text = TEXT_LOOKUP.get(_code, " ")
+    if len(_text) != 1:
+        _TEXT_EXPANSIONS[chr(0xE000 + _code)] = _text
+        _text = chr(0xE000 + _code)
+    _TEXT_CHARS.append(_text)
+TEXT_TABLE = "".join(_TEXT_CHARS)
+del _code, _text
+
+
 def as_text(bytearr: bytes) -> str:
-    return ''.join([TEXT_LOOKUP.get(x, " ") for x in bytearr])
+    text = codecs.charmap_decode(bytearr, "strict", TEXT_TABLE)[0]
+    for placeholder, expansion in _TEXT_EXPANSIONS.items():
+        if placeholder in text:
+            text = text.replace(placeholder, expansion)
+    return text
 
 
 class MemoryRegion:
@@ -169,61 +189,175 @@ class MemoryRegion:
         return self._type == "text"
 
 
-class Entity(BaseModel):
+class EntityField:
     """
-    This is an object that is represented in remote system memory.
+    Descriptor decoding one field out of the memory an entity looks at, on access
+    """
+
+    __slots__ = ("label", "_start", "_end", "_kind", "_unpack")
+
+    def __init__(self, field: MemoryRegion) -> None:
+        self.label = field.label
+        self._start = field.addr
+        self._end = field.addr + field.len
+        self._kind = "buffer" if field._type == "buffer" else "text" if field.is_text else "scalar"
+        self._unpack = struct.Struct(f">{field._type}").unpack_from if self._kind == "scalar" else None
 
-    Inheriting objects should specify data fields and how they can be populated
-    through reading memory fields.
+    def __get__(self, entity: T.Optional["Entity"], owner: T.Type["Entity"]) -> T.Any:
+        if entity is None:
+            return self
+        if self._unpack is not None:
+            return self._unpack(entity._buffer, entity._offset + self._start)[0]
+        value = entity._buffer[entity._offset + self._start:entity._offset + self._end]
+        if self._kind == "text":
+            # text is the priciest field to decode, so only do it once per hydrate
+            if entity._text is None:
+                entity._text = {}
+            text = entity._text.get(self.label)
+            if text is None:
+                text = entity._text[self.label] = as_text(value)
+            return text
+        return bytes(value)
 
-    This object is capable of computing deltas so we don't need to instantiate
-    anew each time.
+    def __repr__(self) -> str:
+        return f"EntityField({self.label}, {self._start:#x}:{self._end:#x}, {self._kind})"
+
+
+class Entity:
     """
+    This is an object that is represented in remote system memory.
+
+    Inheriting objects specify the AddressMap describing their fields. An entity is
+    only a view of the memory it was hydrated from: it keeps a memoryview and the
+    offset of the entity in it, and fields are decoded when they are read. Whoever
+    owns the memory must not change it while entities look at it.
+    """
+
+    __slots__ = ("_buffer", "_offset", "_text")
+
+    _MAP: T.Optional[T.Type["AddressMap"]] = None
 
-    _MAP: "AddressMap" = PrivateAttr(None)
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if "_MAP" in cls.__dict__ and cls._MAP is not None:
+            # later fields with the same label win, as they always have
+            for field in cls._MAP._FIELDS:
+                setattr(cls, field.label, EntityField(field))
+
+    def __init__(self, buffer: T.Optional[bytes] = None, offset: int = 0) -> None:
+        if buffer is None:
+            # all fields zero
+            buffer = bytes(self._MAP.decoder().size if self._MAP is not None else 0)
+        self._buffer = memoryview(buffer)
+        self._offset = offset
+        self._text: T.Optional[T.Dict[str, str]] = None
 
     @classmethod
     def hydrate_from_memory(cls, memory: bytes, start_addr: int) -> "Entity":
         """
         Hydrate the entity given some memory values
         """
-
-        # isolate the actual chunk of memory we want
-        entity = cls()
-        if not cls._MAP:
+        if cls._MAP is None:
             print(f"Hydrating {cls.__name__} from default since no memory map was provided")
-            return entity
-        read_range = (start_addr, start_addr + max([reg.addr + reg.len for reg in entity._MAP._FIELDS]))
-        entity.update_from_buffer(memory[read_range[0]:read_range[1]])
-        return entity
+            return cls()
+        return cls(memory, start_addr)
+
+    @classmethod
+    def address_map(cls) -> T.Type["AddressMap"]:
+        """
+        AddressMap the entity was generated from
+        """
+        return cls._MAP
 
     @classmethod
     def hydrate_from_buffer(cls, buffer: bytes) -> "Entity":
         """
         Hydrate the entity given the buffer of values directly corresponding to data
         """
-        entity = cls()
-        entity.update_from_buffer(buffer)
-        return entity
-
-    def update_from_buffer(self, buffer: bytes) -> None:
-        # TODO: block reads when possible?!
-        # this probably isn't significantly slower I would think, but unsure
-        for field in self._MAP._FIELDS:
-            value = struct.unpack(
-                f">{field._type if field.is_struct_type else 'c' * field.len}",
-                buffer[field.addr:field.addr + field.len]
-            )
-
-            # TODO: slooooowwwww
-            if field._type == "buffer":
-                value = b''.join(value)
-            elif field.is_text:
-                value = as_text(value)
+        return cls(buffer)
+
+    def update_from_buffer(self, buffer: bytes, offset: int = 0) -> None:
+        """
+        Point the entity at other memory, nothing is decoded until fields are read
+        """
+        self._buffer = memoryview(buffer)
+        self._offset = offset
+        self._text = None
+
+    def invalidate(self) -> None:
+        """
+        The memory changed underneath, forget cached text
+        """
+        self._text = None
+
+    def values(self) -> T.Dict[str, T.Any]:
+        """
+        Every field decoded at once
+        """
+        return self._MAP.decoder().decode(self._buffer, self._offset)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{label}={value!r}" for label, value in self.values().items())
+        return f"{type(self).__name__}({fields})"
+
+
+class FieldDecoder:
+    """
+    Fields of an AddressMap compiled into as few struct calls as possible
+
+    Scalar fields are unpacked by one struct.Struct per layer, where a layer is a
+    set of fields that do not overlap, with pad bytes over the gaps between them.
+    Most maps need a single layer; overlapping fields (a word and its bytes, say)
+    spill into extra ones. Buffer and text fields are sliced out separately.
+    """
+
+    def __init__(self, fields: T.List[MemoryRegion]) -> None:
+        # a label that appears twice gets the value of the last one, like setting
+        # attributes field by field did
+        by_label = {field.label: field for field in fields}
+        scalars = sorted((field for field in by_label.values() if field.is_struct_type), key=lambda field: field.addr)
+
+        layers: T.List[T.List[MemoryRegion]] = []
+        for field in scalars:
+            for layer in layers:
+                if layer[-1].addr + layer[-1].len <= field.addr:
+                    layer.append(field)
+                    break
             else:
-                value = value[0]
+                layers.append([field])
+
+        self.layers: T.List[T.Tuple[struct.Struct, T.Tuple[str, ...]]] = []
+        for layer in layers:
+            fmt, end = ">", 0
+            for field in layer:
+                if field.addr > end:
+                    fmt += f"{field.addr - end}x"
+                fmt += field._type
+                end = field.addr + field.len
+            self.layers.append((struct.Struct(fmt), tuple(field.label for field in layer)))
+
+        self.buffers = [
+            (field.label, field.addr, field.addr + field.len) for field in by_label.values() if field._type == "buffer"
+        ]
+        self.texts = [(field.label, field.addr, field.addr + field.len) for field in by_label.values() if field.is_text]
+        self.size = max((field.addr + field.len for field in fields), default=0)
+
+    def decode(self, buffer: bytes, offset: int = 0) -> T.Dict[str, T.Any]:
+        """
+        Values of every field of the entity starting `offset` bytes into `buffer`
+        """
+        values: T.Dict[str, T.Any] = {}
+        for unpacker, labels in self.layers:
+            values.update(zip(labels, unpacker.unpack_from(buffer, offset)))
+        for label, start, end in self.buffers:
+            values[label] = bytes(buffer[offset + start:offset + end])
+        for label, start, end in self.texts:
+            values[label] = as_text(buffer[offset + start:offset + end])
+        return values
 
-            setattr(self, field.label, value)
+    def __repr__(self) -> str:
+        formats = ", ".join(unpacker.format for unpacker, _labels in self.layers)
+        return f"FieldDecoder([{formats}], {len(self.buffers)} buffers, {len(self.texts)} texts)"
 
 
 class AddressMap:
@@ -236,7 +370,61 @@ class AddressMap:
     _FIELDS: T.List[MemoryRegion] = []
     SINGLETON = True
 
-    # TODO: might be better to use struct.unpack
+    @classmethod
+    def decoder(cls) -> FieldDecoder:
+        """
+        Decoder for the fields, compiled on first use
+        """
+        decoder = cls.__dict__.get("_DECODER")
+        if decoder is None:
+            decoder = FieldDecoder(cls._FIELDS)
+            cls._DECODER = decoder
+        return decoder
+
+    @classmethod
+    def dtype(cls) -> np.dtype:
+        """
+        NumPy structured dtype laid out like the entity in memory
+
+        Scalar fields keep their struct type, big endian, buffer and text fields
+        are arrays of raw bytes. Fields may overlap, a label that appears twice
+        gets the last one.
+        """
+        dtype = cls.__dict__.get("_DTYPE")
+        if dtype is None:
+            by_label = {field.label: field for field in cls._FIELDS}
+            dtype = np.dtype({
+                "names": list(by_label),
+                "formats": [
+                    np.dtype(f">{field._type}") if field.is_struct_type else np.dtype((np.uint8, (field.len,)))
+                    for field in by_label.values()
+                ],
+                "offsets": [field.addr for field in by_label.values()],
+                "itemsize": cls.decoder().size,
+            })
+            cls._DTYPE = dtype
+        return dtype
+
+    @classmethod
+    def columns(cls, records: np.ndarray) -> T.Dict[str, np.ndarray]:
+        """
+        Split records of `dtype()` into one array per field
+
+        Fields are views into the records except three byte buffers (money,
+        experience and the like), which come out as big endian integers.
+        Text stays as character codes, `as_text` decodes a row.
+        """
+        output = {}
+        for label in records.dtype.names:
+            column = records[label]
+            if column.ndim > records.ndim and column.shape[-1] == 3:
+                column = (
+                    column[..., 0].astype(np.uint32) << 16
+                    | column[..., 1].astype(np.uint32) << 8
+                    | column[..., 2]
+                )
+            output[label] = column
+        return output
 
     @classmethod
     def write_class(cls) -> str:
@@ -250,13 +438,14 @@ class {kls_name}(Entity):
     {cls.__doc__}
     \"\"\"
 
-    _MAP = PrivateAttr(default_factory={cls.__name__})
+    __slots__ = ()
+    _MAP = {cls.__name__}
 
 """
+        # annotations only, Entity installs a descriptor per field
         for field in cls._FIELDS:
             type_ = bytes if field._type == "buffer" else str if field.is_text else int
-            default = 0 if type_ == int else None
-            output += f"    {field.label}: {type_.__name__} = {default}\n"
+            output += f"    {field.label}: {type_.__name__}\n"
 
         output += "\n"
         return output
@@ -9,27 +9,28 @@ class Sprite(Entity):
     None
     """
 
-    _MAP = PrivateAttr(default_factory=SpriteMap)
-
-    picture_id: int = 0
-    movement_status: int = 0
-    image_idx: int = 0
-    y_screen_delta: int = 0
-    y_screen_pos: int = 0
-    x_screen_delta: int = 0
-    x_screen_pos: int = 0
-    intra_animation_frame_counter: int = 0
-    animation_frame_counter: int = 0
-    facing_direction: int = 0
-    walk_animation_counter: int = 0
-    y_displacement: int = 0
-    x_displacement: int = 0
-    y_position: int = 0
-    x_position: int = 0
-    movement_byte: int = 0
-    in_grass: int = 0
-    delay_until_next_movement: int = 0
-    sprite_image_base_offset: int = 0
+    __slots__ = ()
+    _MAP = SpriteMap
+
+    picture_id: int
+    movement_status: int
+    image_idx: int
+    y_screen_delta: int
+    y_screen_pos: int
+    x_screen_delta: int
+    x_screen_pos: int
+    intra_animation_frame_counter: int
+    animation_frame_counter: int
+    facing_direction: int
+    walk_animation_counter: int
+    y_displacement: int
+    x_displacement: int
+    y_position: int
+    x_position: int
+    movement_byte: int
+    in_grass: int
+    delay_until_next_movement: int
+    sprite_image_base_offset: int
 
 
 class Tile(Entity):
@@ -37,13 +38,14 @@ class Tile(Entity):
     None
     """
 
-    _MAP = PrivateAttr(default_factory=TileMap)
+    __slots__ = ()
+    _MAP = TileMap
 
-    onscreen_tiles: bytes = None
-    onscreen_text: str = None
-    copy_buffer: bytes = None
-    copy_text: str = None
-    total_buffer: bytes = None
+    onscreen_tiles: bytes
+    onscreen_text: str
+    copy_buffer: bytes
+    copy_text: str
+    total_buffer: bytes
 
 
 class Menu(Entity):
@@ -51,22 +53,23 @@ class Menu(Entity):
     None
     """
 
-    _MAP = PrivateAttr(default_factory=MenuMap)
+    __slots__ = ()
+    _MAP = MenuMap
 
-    y_position: int = 0
-    x_position: int = 0
-    selected_item: int = 0
-    hidden_tile: int = 0
-    last_menu_tile_id: int = 0
-    bitmask_key_port: int = 0
-    id_prev_selected_item: int = 0
-    last_cursor_position_party_bills_pc: int = 0
-    last_cursor_position_item_screen: int = 0
-    last_cursor_position_start_battle_menu: int = 0
-    index_pokemon_active: int = 0
-    pointer_cursor_tile: int = 0
-    id_displayed_menu_item: int = 0
-    item_highlighted_select: int = 0
+    y_position: int
+    x_position: int
+    selected_item: int
+    hidden_tile: int
+    last_menu_tile_id: int
+    bitmask_key_port: int
+    id_prev_selected_item: int
+    last_cursor_position_party_bills_pc: int
+    last_cursor_position_item_screen: int
+    last_cursor_position_start_battle_menu: int
+    index_pokemon_active: int
+    pointer_cursor_tile: int
+    id_displayed_menu_item: int
+    item_highlighted_select: int
 
 
 class Battle(Entity):
@@ -76,35 +79,36 @@ class Battle(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=BattleMap)
-
-    number_of_turns: int = 0
-    player_sub_hp: int = 0
-    enemy_sub_hp: int = 0
-    move_menu_type: int = 0
-    player_selected_move: int = 0
-    enemy_selected_move: int = 0
-    payday_money: bytes = None
-    opponent_escape_factor: int = 0
-    opponent_bait_factor: int = 0
-    disobedient: int = 0
-    enemy_disabled_move: int = 0
-    player_disabled_move: int = 0
-    low_health: int = 0
-    bide_damage: int = 0
-    pokemon_atk_mod: int = 0
-    pokemon_def_mod: int = 0
-    pokemon_spd_mod: int = 0
-    pokemon_spc_mod: int = 0
-    pokemon_acc_mod: int = 0
-    pokemon_eva_mod: int = 0
-    engaged_trainer_class: int = 0
-    enemy_atk_mod: int = 0
-    enemy_def_mod: int = 0
-    enemy_spd_mod: int = 0
-    enemy_spc_mod: int = 0
-    enemy_acc_mod: int = 0
-    enemy_eva_mod: int = 0
+    __slots__ = ()
+    _MAP = BattleMap
+
+    number_of_turns: int
+    player_sub_hp: int
+    enemy_sub_hp: int
+    move_menu_type: int
+    player_selected_move: int
+    enemy_selected_move: int
+    payday_money: bytes
+    opponent_escape_factor: int
+    opponent_bait_factor: int
+    disobedient: int
+    enemy_disabled_move: int
+    player_disabled_move: int
+    low_health: int
+    bide_damage: int
+    pokemon_atk_mod: int
+    pokemon_def_mod: int
+    pokemon_spd_mod: int
+    pokemon_spc_mod: int
+    pokemon_acc_mod: int
+    pokemon_eva_mod: int
+    engaged_trainer_class: int
+    enemy_atk_mod: int
+    enemy_def_mod: int
+    enemy_spd_mod: int
+    enemy_spc_mod: int
+    enemy_acc_mod: int
+    enemy_eva_mod: int
 
 
 class PokemonMart(Entity):
@@ -114,19 +118,20 @@ class PokemonMart(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=PokemonMartMap)
+    __slots__ = ()
+    _MAP = PokemonMartMap
 
-    total_items: int = 0
-    item_1: int = 0
-    item_2: int = 0
-    item_3: int = 0
-    item_4: int = 0
-    item_5: int = 0
-    item_6: int = 0
-    item_7: int = 0
-    item_8: int = 0
-    item_9: int = 0
-    item_10: int = 0
+    total_items: int
+    item_1: int
+    item_2: int
+    item_3: int
+    item_4: int
+    item_5: int
+    item_6: int
+    item_7: int
+    item_8: int
+    item_9: int
+    item_10: int
 
 
 class NameRater(Entity):
@@ -136,9 +141,10 @@ class NameRater(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=NameRaterMap)
+    __slots__ = ()
+    _MAP = NameRaterMap
 
-    target_pokemon: int = 0
+    target_pokemon: int
 
 
 class Battle2(Entity):
@@ -150,11 +156,12 @@ class Battle2(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=BattleMap2)
+    __slots__ = ()
+    _MAP = BattleMap2
 
-    your_move_used: int = 0
-    your_move_effect: int = 0
-    your_move_type: int = 0
+    your_move_used: int
+    your_move_effect: int
+    your_move_type: int
 
 
 class Battle3(Entity):
@@ -166,49 +173,50 @@ class Battle3(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=BattleMap3)
-
-    enemy_move_id: int = 0
-    enemy_move_effect: int = 0
-    enemy_move_power: int = 0
-    enemy_move_type: int = 0
-    enemy_move_accuracy: int = 0
-    enemy_move_max_pp: int = 0
-    player_move_id: int = 0
-    player_move_effect: int = 0
-    player_move_power: int = 0
-    player_move_type: int = 0
-    player_move_accuracy: int = 0
-    player_move_max_pp: int = 0
-    enemy_pokemon_id: int = 0
-    player_pokemon_id: int = 0
-    enemy_name: str = None
-    enemy_pokemon_id2: int = 0
-    enemy_hp: int = 0
-    enemy_level: int = 0
-    enemy_status: int = 0
-    enemy_type_1: int = 0
-    enemy_type_2: int = 0
-    enemy_catch_rate: int = 0
-    enemy_move_1: int = 0
-    enemy_move_2: int = 0
-    enemy_move_3: int = 0
-    enemy_move_4: int = 0
-    enemy_atk_def_dvs: int = 0
-    enemy_spd_spc_dvs: int = 0
-    enemy_level2: int = 0
-    enemy_max_hp: int = 0
-    enemy_atk: int = 0
-    enemy_def: int = 0
-    enemy_spd: int = 0
-    enemy_spc: int = 0
-    enemy_pp_1: int = 0
-    enemy_pp_2: int = 0
-    enemy_pp_3: int = 0
-    enemy_pp_4: int = 0
-    enemy_base_stats: bytes = None
-    enemy_catch_rate: int = 0
-    enemy_base_experience: int = 0
+    __slots__ = ()
+    _MAP = BattleMap3
+
+    enemy_move_id: int
+    enemy_move_effect: int
+    enemy_move_power: int
+    enemy_move_type: int
+    enemy_move_accuracy: int
+    enemy_move_max_pp: int
+    player_move_id: int
+    player_move_effect: int
+    player_move_power: int
+    player_move_type: int
+    player_move_accuracy: int
+    player_move_max_pp: int
+    enemy_pokemon_id: int
+    player_pokemon_id: int
+    enemy_name: str
+    enemy_pokemon_id2: int
+    enemy_hp: int
+    enemy_level: int
+    enemy_status: int
+    enemy_type_1: int
+    enemy_type_2: int
+    enemy_catch_rate: int
+    enemy_move_1: int
+    enemy_move_2: int
+    enemy_move_3: int
+    enemy_move_4: int
+    enemy_atk_def_dvs: int
+    enemy_spd_spc_dvs: int
+    enemy_level2: int
+    enemy_max_hp: int
+    enemy_atk: int
+    enemy_def: int
+    enemy_spd: int
+    enemy_spc: int
+    enemy_pp_1: int
+    enemy_pp_2: int
+    enemy_pp_3: int
+    enemy_pp_4: int
+    enemy_base_stats: bytes
+    enemy_catch_rate: int
+    enemy_base_experience: int
 
 
 class BattlePokemon(Entity):
@@ -218,30 +226,31 @@ class BattlePokemon(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=BattlePokemonMap)
-
-    name: int = 0
-    number: int = 0
-    current_hp: int = 0
-    status: int = 0
-    type_1: int = 0
-    type_2: int = 0
-    move_1: int = 0
-    move_2: int = 0
-    move_3: int = 0
-    move_4: int = 0
-    atk_def_dvs: int = 0
-    spd_spc_dvs: int = 0
-    level: int = 0
-    max_hp: int = 0
-    atk_: int = 0
-    def_: int = 0
-    spd_: int = 0
-    spc_: int = 0
-    pp_1: int = 0
-    pp_2: int = 0
-    pp_3: int = 0
-    pp_4: int = 0
+    __slots__ = ()
+    _MAP = BattlePokemonMap
+
+    name: int
+    number: int
+    current_hp: int
+    status: int
+    type_1: int
+    type_2: int
+    move_1: int
+    move_2: int
+    move_3: int
+    move_4: int
+    atk_def_dvs: int
+    spd_spc_dvs: int
+    level: int
+    max_hp: int
+    atk_: int
+    def_: int
+    spd_: int
+    spc_: int
+    pp_1: int
+    pp_2: int
+    pp_3: int
+    pp_4: int
 
 
 class Battle4(Entity):
@@ -253,10 +262,11 @@ class Battle4(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=BattleMap4)
+    __slots__ = ()
+    _MAP = BattleMap4
 
-    battle_type: int = 0
-    critical_strike: int = 0
+    battle_type: int
+    critical_strike: int
 
 
 class BattleStatus(Entity):
@@ -266,20 +276,21 @@ class BattleStatus(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=BattleStatusMap)
+    __slots__ = ()
+    _MAP = BattleStatusMap
 
-    battle_status: bytes = None
-    stat_to_double_cpu: int = 0
-    stat_to_halve_cpu: int = 0
-    battle_status_cpu: bytes = None
-    player_multi_hit_move_counter: int = 0
-    player_confusion_counter: int = 0
-    player_toxic_counter: int = 0
-    player_disable_counter: int = 0
-    enemy_multi_hit_move_counter: int = 0
-    enemy_confusion_counter: int = 0
-    enemy_toxic_counter: int = 0
-    enemy_disable_counter: int = 0
+    battle_status: bytes
+    stat_to_double_cpu: int
+    stat_to_halve_cpu: int
+    battle_status_cpu: bytes
+    player_multi_hit_move_counter: int
+    player_confusion_counter: int
+    player_toxic_counter: int
+    player_disable_counter: int
+    enemy_multi_hit_move_counter: int
+    enemy_confusion_counter: int
+    enemy_toxic_counter: int
+    enemy_disable_counter: int
 
 
 class GameCorner(Entity):
@@ -289,11 +300,12 @@ class GameCorner(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=GameCornerMap)
+    __slots__ = ()
+    _MAP = GameCornerMap
 
-    prize_1: int = 0
-    prize_2: int = 0
-    prize_3: int = 0
+    prize_1: int
+    prize_2: int
+    prize_3: int
 
 
 class Player(Entity):
@@ -303,17 +315,18 @@ class Player(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=PlayerMap)
+    __slots__ = ()
+    _MAP = PlayerMap
 
-    name: str = None
-    pokemon_in_party: int = 0
-    pokemon_1: int = 0
-    pokemon_2: int = 0
-    pokemon_3: int = 0
-    pokemon_4: int = 0
-    pokemon_5: int = 0
-    pokemon_6: int = 0
-    end_of_list_huh: int = 0
+    name: str
+    pokemon_in_party: int
+    pokemon_1: int
+    pokemon_2: int
+    pokemon_3: int
+    pokemon_4: int
+    pokemon_5: int
+    pokemon_6: int
+    end_of_list_huh: int
 
 
 class Pokemon(Entity):
@@ -328,38 +341,39 @@ class Pokemon(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=PokemonMap)
-
-    pokemon: int = 0
-    current_hp: int = 0
-    int_level: int = 0
-    status: int = 0
-    type_1: int = 0
-    type_2: int = 0
-    catch_rate: int = 0
-    move_1: int = 0
-    move_2: int = 0
-    move_3: int = 0
-    move_4: int = 0
-    trainer_id: int = 0
-    experience: bytes = None
-    hp_ev: int = 0
-    atk_ev: int = 0
-    def_ev: int = 0
-    spd_ev: int = 0
-    spc_ev: int = 0
-    atk_def_iv: int = 0
-    spd_spc_iv: int = 0
-    pp_move_1: int = 0
-    pp_move_2: int = 0
-    pp_move_3: int = 0
-    pp_move_4: int = 0
-    level: int = 0
-    max_hp: int = 0
-    atk_: int = 0
-    def_: int = 0
-    spd_: int = 0
-    spc_: int = 0
+    __slots__ = ()
+    _MAP = PokemonMap
+
+    pokemon: int
+    current_hp: int
+    int_level: int
+    status: int
+    type_1: int
+    type_2: int
+    catch_rate: int
+    move_1: int
+    move_2: int
+    move_3: int
+    move_4: int
+    trainer_id: int
+    experience: bytes
+    hp_ev: int
+    atk_ev: int
+    def_ev: int
+    spd_ev: int
+    spc_ev: int
+    atk_def_iv: int
+    spd_spc_iv: int
+    pp_move_1: int
+    pp_move_2: int
+    pp_move_3: int
+    pp_move_4: int
+    level: int
+    max_hp: int
+    atk_: int
+    def_: int
+    spd_: int
+    spc_: int
 
 
 class PokedexCompletion(Entity):
@@ -369,46 +383,47 @@ class PokedexCompletion(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=PokedexCompletionMap)
-
-    caught_1_8: int = 0
-    caught_9_16: int = 0
-    caught_17_24: int = 0
-    caught_25_32: int = 0
-    caught_33_40: int = 0
-    caught_41_48: int = 0
-    caught_49_56: int = 0
-    caught_57_64: int = 0
-    caught_65_72: int = 0
-    caught_73_80: int = 0
-    caught_81_88: int = 0
-    caught_89_96: int = 0
-    caught_97_104: int = 0
-    caught_105_112: int = 0
-    caught_113_120: int = 0
-    caught_121_128: int = 0
-    caught_129_136: int = 0
-    caught_137_144: int = 0
-    caught_145_152: int = 0
-    seen_1_8: int = 0
-    seen_9_16: int = 0
-    seen_17_24: int = 0
-    seen_25_32: int = 0
-    seen_33_40: int = 0
-    seen_41_48: int = 0
-    seen_49_56: int = 0
-    seen_57_64: int = 0
-    seen_65_72: int = 0
-    seen_73_80: int = 0
-    seen_81_88: int = 0
-    seen_89_96: int = 0
-    seen_97_104: int = 0
-    seen_105_112: int = 0
-    seen_113_120: int = 0
-    seen_121_128: int = 0
-    seen_129_136: int = 0
-    seen_137_144: int = 0
-    seen_145_152: int = 0
+    __slots__ = ()
+    _MAP = PokedexCompletionMap
+
+    caught_1_8: int
+    caught_9_16: int
+    caught_17_24: int
+    caught_25_32: int
+    caught_33_40: int
+    caught_41_48: int
+    caught_49_56: int
+    caught_57_64: int
+    caught_65_72: int
+    caught_73_80: int
+    caught_81_88: int
+    caught_89_96: int
+    caught_97_104: int
+    caught_105_112: int
+    caught_113_120: int
+    caught_121_128: int
+    caught_129_136: int
+    caught_137_144: int
+    caught_145_152: int
+    seen_1_8: int
+    seen_9_16: int
+    seen_17_24: int
+    seen_25_32: int
+    seen_33_40: int
+    seen_41_48: int
+    seen_49_56: int
+    seen_57_64: int
+    seen_65_72: int
+    seen_73_80: int
+    seen_81_88: int
+    seen_89_96: int
+    seen_97_104: int
+    seen_105_112: int
+    seen_113_120: int
+    seen_121_128: int
+    seen_129_136: int
+    seen_137_144: int
+    seen_145_152: int
 
 
 class Inventory(Entity):
@@ -418,50 +433,51 @@ class Inventory(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=InventoryMap)
-
-    total_items: int = 0
-    id_item_1: int = 0
-    qty_item_1: int = 0
-    id_item_2: int = 0
-    qty_item_2: int = 0
-    id_item_3: int = 0
-    qty_item_3: int = 0
-    id_item_4: int = 0
-    qty_item_4: int = 0
-    id_item_5: int = 0
-    qty_item_5: int = 0
-    id_item_6: int = 0
-    qty_item_6: int = 0
-    id_item_7: int = 0
-    qty_item_7: int = 0
-    id_item_8: int = 0
-    qty_item_8: int = 0
-    id_item_9: int = 0
-    qty_item_9: int = 0
-    id_item_10: int = 0
-    qty_item_10: int = 0
-    id_item_11: int = 0
-    qty_item_11: int = 0
-    id_item_12: int = 0
-    qty_item_12: int = 0
-    id_item_13: int = 0
-    qty_item_13: int = 0
-    id_item_14: int = 0
-    qty_item_14: int = 0
-    id_item_15: int = 0
-    qty_item_15: int = 0
-    id_item_16: int = 0
-    qty_item_16: int = 0
-    id_item_17: int = 0
-    qty_item_17: int = 0
-    id_item_18: int = 0
-    qty_item_18: int = 0
-    id_item_19: int = 0
-    qty_item_19: int = 0
-    id_item_20: int = 0
-    qty_item_20: int = 0
-    money: bytes = None
+    __slots__ = ()
+    _MAP = InventoryMap
+
+    total_items: int
+    id_item_1: int
+    qty_item_1: int
+    id_item_2: int
+    qty_item_2: int
+    id_item_3: int
+    qty_item_3: int
+    id_item_4: int
+    qty_item_4: int
+    id_item_5: int
+    qty_item_5: int
+    id_item_6: int
+    qty_item_6: int
+    id_item_7: int
+    qty_item_7: int
+    id_item_8: int
+    qty_item_8: int
+    id_item_9: int
+    qty_item_9: int
+    id_item_10: int
+    qty_item_10: int
+    id_item_11: int
+    qty_item_11: int
+    id_item_12: int
+    qty_item_12: int
+    id_item_13: int
+    qty_item_13: int
+    id_item_14: int
+    qty_item_14: int
+    id_item_15: int
+    qty_item_15: int
+    id_item_16: int
+    qty_item_16: int
+    id_item_17: int
+    qty_item_17: int
+    id_item_18: int
+    qty_item_18: int
+    id_item_19: int
+    qty_item_19: int
+    id_item_20: int
+    qty_item_20: int
+    money: bytes
 
 
 class Badges(Entity):
@@ -471,9 +487,10 @@ class Badges(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=BadgesMap)
+    __slots__ = ()
+    _MAP = BadgesMap
 
-    badges: int = 0
+    badges: int
 
 
 class Location(Entity):
@@ -485,15 +502,16 @@ class Location(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=LocationMap)
+    __slots__ = ()
+    _MAP = LocationMap
 
-    map_number: int = 0
-    event_displacement: int = 0
-    y_position: int = 0
-    x_position: int = 0
-    y_position2: int = 0
-    x_position2: int = 0
-    last_map_exit: int = 0
+    map_number: int
+    event_displacement: int
+    y_position: int
+    x_position: int
+    y_position2: int
+    x_position2: int
+    last_map_exit: int
 
 
 class EventFlags(Entity):
@@ -503,28 +521,29 @@ class EventFlags(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=EventFlagsMap)
-
-    disappearing_sprites: bytes = None
-    starters_back: int = 0
-    have_town_map: int = 0
-    have_oaks_parcel: int = 0
-    ss_anne_here: int = 0
-    fossilized_pokemon: int = 0
-    lapras_acquired: int = 0
-    fought_giovanni: int = 0
-    fought_brock: int = 0
-    fought_misty: int = 0
-    fought_surge: int = 0
-    fought_erika: int = 0
-    fought_articuno: int = 0
-    fought_koga: int = 0
-    fought_blaine: int = 0
-    fought_sabrina: int = 0
-    fought_zapdos: int = 0
-    fought_snorlax_vermillion: int = 0
-    fought_snorlax_celadon: int = 0
-    fought_moltres: int = 0
+    __slots__ = ()
+    _MAP = EventFlagsMap
+
+    disappearing_sprites: bytes
+    starters_back: int
+    have_town_map: int
+    have_oaks_parcel: int
+    ss_anne_here: int
+    fossilized_pokemon: int
+    lapras_acquired: int
+    fought_giovanni: int
+    fought_brock: int
+    fought_misty: int
+    fought_surge: int
+    fought_erika: int
+    fought_articuno: int
+    fought_koga: int
+    fought_blaine: int
+    fought_sabrina: int
+    fought_zapdos: int
+    fought_snorlax_vermillion: int
+    fought_snorlax_celadon: int
+    fought_moltres: int
 
 
 class TilesetHeader(Entity):
@@ -534,12 +553,13 @@ class TilesetHeader(Entity):
     
     """
 
-    _MAP = PrivateAttr(default_factory=TilesetHeaderMap)
+    __slots__ = ()
+    _MAP = TilesetHeaderMap
 
-    tileset_bank: int = 0
-    pointer_to_blocks: int = 0
-    pointer_to_gfx: int = 0
-    pointer_to_collision_data: int = 0
-    talking_over_tiles: bytes = None
-    grass_tile: int = 0
+    tileset_bank: int
+    pointer_to_blocks: int
+    pointer_to_gfx: int
+    pointer_to_collision_data: int
+    talking_over_tiles: bytes
+    grass_tile: int
 
@@ -7,21 +7,11 @@ game world, we'll give it more high-level instructions instead of just "UDLR".
 To this end, we construct a stateful representation of the game world.
 """
 import numpy as np
-import struct
 import typing as T
 
 from command import CommandClient
 from memmap import MemoryMap
-
-
-# NOTE: if executing this, values may change slightly between rounds.
-# This is because the standard python Hash function does not seem to
-# do well against the hex values in our game. This means that only
-# the relative hashes of the tiles can be used to compare differences.
-# TODO: this is actually a pretty good way, it seems, of determining
-# objects that are similar to each other. Doing some sort of learning
-# on that could be interesting...?
-TILE_HASH_BUMP: T.Dict[int, int] = dict()
+from tilevocab import shared_vocabulary
 
 
 # Initialize hash bump with zeros
@@ -30,49 +20,16 @@ SPRITE_HASH_BUMP: T.Dict[int, int] = dict({0: 0})
 
 
 def populate_occupancy_from_copy_buffer(mem: MemoryMap) -> np.array:
-    occ_list = []
-
-    # Terrain tiles are mapped between 256 and 511
+    # Terrain is laid out in 2 x 2 blocks of tiles, 10 x 9 of them on screen.
+    # Each block is an upper and a lower pair of tiles, every pair gets its id from
+    # the shared tile vocabulary and the two ids together get a block id.
+    # Terrain blocks are mapped between 256 and 511
     width = 10
     depth = 9
-    # j = 0..9
-    # i = 0..8
-    for j in range(depth):
-        # j = 1
-        for i in range(width):
-            # i = 2
-            start1 = 2 * i + 2 * j * 2 * width
-            end1 = 2 * i + 2 * j * 2 * width + 2
-            start2 = 2 * i + (2 * j + 1) * 2 * width
-            end2 = 2 * i + (2 * j + 1) * 2 * width + 2
-            print(start1,end1)
-            print(start2,end2)
-            tile = struct.unpack(
-                ">I",
-                mem.tile.onscreen_tiles[start1:end1]
-                # 24:26
-                + mem.tile.onscreen_tiles[start2:end2]
-                # 34:36
-            )[0]
-
-            if tile in TILE_HASH_BUMP:
-                hashed = TILE_HASH_BUMP[tile]
-            else:
-                hashed = tile % 256
-                while True:
-                    if hashed not in TILE_HASH_BUMP.values():
-                        TILE_HASH_BUMP[tile] = hashed
-                        break
-                    hashed += 1
-                    if hashed == tile % 256:  # we made it a circle
-                        print("Tile Hash Bump Full...")
-                        break
-    
-            occ_list.append(hashed + 256)
-
-    occ = np.array(occ_list)
-    occ = occ.reshape([depth, width])
-    occ = occ[:, 0:10]
+    pairs = np.frombuffer(mem.tile.onscreen_tiles, dtype=">u2").reshape(depth, 2, width)
+    pair_ids = shared_vocabulary("tiles").encode(pairs).astype(np.uint16)
+    blocks = pair_ids[:, 0] << 8 | pair_ids[:, 1]
+    occ = shared_vocabulary("blocks").encode(blocks).astype(np.int64) + 256
 
     # Place sprites on the map
     # Sprites are mapped between 0 and 255
@@ -130,11 +87,14 @@ class Navigator:
         # 9 x 10, where 9 is the vertical and 10 is the horizontal. The upper
         # two bytes are concatenated with the lower two bytes to get the final
         # four byte segment representing the tile.
-        mem = MemoryMap.hydrate_from_memory(self._client.dispatch("dump_wram"))
-        self._occupancy = populate_occupancy_from_copy_buffer(mem)
+        self._mem = MemoryMap.hydrate_from_memory(self._client.dispatch("dump_wram"))
+        self._occupancy = populate_occupancy_from_copy_buffer(self._mem)
 
     def update_occupancy(self) -> None:
-        mem = MemoryMap.hydrate_from_memory(self._client.dispatch("dump_wram"))
+        mem = self._mem.update_from_memory(self._client.dispatch("dump_wram"))
+        if not mem.changes.touched("tile", "onscreen_tiles") and not mem.changes.touched("sprites"):
+            # nothing on screen moved, the grid we have is still right
+            return
         if self._is_text(mem):
             # do not update occupancy if text is on the screen
             return
@@ -0,0 +1,243 @@
+"""
+Pool of emulator connections
+
+lua\\socketserver.lua binds 10018 and moves up by 100 while the port is taken, so
+running several emulators on one host leaves them on 10018, 10118, 10218 and so on.
+The pool finds them, checks they answer, and leases each one to at most one
+environment at a time. Instances that stop answering are retried with backoff.
+
+Leases are exclusive within one process. Separate processes need separate port
+lists, since they cannot see each other's leases.
+"""
+import threading
+import time
+import typing as T
+
+from command import CommandClient
+from protocol import CommandError
+from protocol import ProtocolError
+
+
+BASE_PORT = 10018
+PORT_STRIDE = 100
+
+# errors that mean the instance is gone, as opposed to bugs on our side
+CONNECTION_ERRORS = (OSError, ProtocolError, CommandError)
+
+
+def port_ladder(count: int, base: int = BASE_PORT, stride: int = PORT_STRIDE) -> T.List[int]:
+    """
+    Ports the Lua server tries, in order
+    """
+    return [base + stride * idx for idx in range(count)]
+
+
+class EmulatorInstance:
+    """
+    Bookkeeping for a single emulator
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.client: T.Optional[CommandClient] = None
+        self.leased = False
+        self.failures = 0
+        self.retry_at = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self.client is not None
+
+    def __repr__(self) -> str:
+        state = "leased" if self.leased else "alive" if self.alive else f"dead ({self.failures} failures)"
+        return f"EmulatorInstance({self.host}:{self.port}, {state})"
+
+
+class Lease:
+    """
+    Exclusive use of one emulator until released
+
+    Works as a context manager. Call `fail()` instead of `release()` when the
+    connection misbehaved, so the pool reconnects before handing it out again.
+    """
+
+    def __init__(self, pool: "EmulatorPool", instance: EmulatorInstance) -> None:
+        self._pool = pool
+        self._instance = instance
+        self.released = False
+
+    @property
+    def host(self) -> str:
+        return self._instance.host
+
+    @property
+    def port(self) -> int:
+        return self._instance.port
+
+    @property
+    def client(self) -> CommandClient:
+        if self.released:
+            raise RuntimeError(f"Lease on port {self.port} was already released")
+        return self._instance.client
+
+    def release(self) -> None:
+        self._pool._release(self, failed=False)
+
+    def fail(self) -> None:
+        self._pool._release(self, failed=True)
+
+    def __enter__(self) -> "Lease":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._pool._release(self, failed=exc_type is not None and issubclass(exc_type, CONNECTION_ERRORS))
+
+
+class EmulatorPool:
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        ports: T.Optional[T.Iterable[int]] = None,
+        max_instances: int = 16,
+        timeout: float = 1.0,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+    ) -> None:
+        """
+        Either pass the ports explicitly, or the pool scans the first `max_instances`
+        rungs of the port ladder.
+        """
+        self._host = host
+        self._timeout = timeout
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        ports = list(ports) if ports is not None else port_ladder(max_instances)
+        self._instances = [EmulatorInstance(host, port) for port in ports]
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self.discover()
+
+    @property
+    def instances(self) -> T.List[EmulatorInstance]:
+        return list(self._instances)
+
+    def discover(self) -> T.List[int]:
+        """
+        Try to connect to every instance that is not connected yet, ignoring backoff.
+        Returns the ports that are alive afterwards.
+        """
+        with self._lock:
+            # held like a lease while connecting, so nobody else touches them meanwhile
+            candidates = [instance for instance in self._instances if not instance.alive and not instance.leased]
+            for instance in candidates:
+                instance.leased = True
+        for instance in candidates:
+            self._try_connect(instance)
+        with self._lock:
+            for instance in candidates:
+                instance.leased = False
+            self._available.notify_all()
+            return [instance.port for instance in self._instances if instance.alive]
+
+    def _try_connect(self, instance: EmulatorInstance) -> bool:
+        try:
+            client = CommandClient(instance.host, instance.port, timeout=self._timeout)
+        except OSError:
+            self._mark_dead(instance)
+            return False
+        instance.client = client
+        if not self._health_check(instance):
+            return False
+        instance.failures = 0
+        return True
+
+    def _health_check(self, instance: EmulatorInstance) -> bool:
+        try:
+            instance.client.request(b"checksum")
+            return True
+        except CONNECTION_ERRORS:
+            self._mark_dead(instance)
+            return False
+
+    def _mark_dead(self, instance: EmulatorInstance) -> None:
+        if instance.client is not None:
+            instance.client._disconnect()
+            instance.client = None
+        instance.failures += 1
+        backoff = min(self._backoff_max, self._backoff_base * 2 ** (instance.failures - 1))
+        instance.retry_at = time.monotonic() + backoff
+
+    def _reserve(self) -> T.Tuple[T.Optional[EmulatorInstance], bool]:
+        """
+        Pick an instance to lease and whether it needs connecting first, called with
+        the lock held. The instance is marked leased right away, so the network round
+        trips to check it can happen without the lock.
+        """
+        # prefer instances that are already up, only then pay for reconnect attempts
+        for instance in self._instances:
+            if not instance.leased and instance.alive:
+                instance.leased = True
+                return instance, False
+        now = time.monotonic()
+        for instance in self._instances:
+            if not instance.leased and not instance.alive and instance.retry_at <= now:
+                instance.leased = True
+                return instance, True
+        return None, False
+
+    def acquire(self, timeout: T.Optional[float] = None) -> Lease:
+        """
+        Lease a healthy emulator, waiting up to `timeout` seconds for one to free up
+        or come back (forever if None)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                instance, connect = self._reserve()
+                if instance is None:
+                    # wake up for releases, or when the next dead instance is due a retry
+                    waits = [
+                        instance.retry_at - time.monotonic() for instance in self._instances if not instance.alive
+                    ]
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError(f"No emulator available out of {self._instances}")
+                        waits.append(remaining)
+                    self._available.wait(max(0.01, min(waits)) if waits else None)
+                    continue
+            # a slow or dead emulator only holds up this caller, not every other lease
+            healthy = self._try_connect(instance) if connect else self._health_check(instance)
+            if healthy:
+                return Lease(self, instance)
+            with self._lock:
+                instance.leased = False
+                self._available.notify()
+
+    def _release(self, lease: Lease, failed: bool) -> None:
+        with self._lock:
+            if lease.released:
+                return
+            lease.released = True
+            instance = lease._instance
+            instance.leased = False
+            if failed:
+                self._mark_dead(instance)
+            self._available.notify()
+
+    def close(self) -> None:
+        with self._lock:
+            for instance in self._instances:
+                if instance.client is not None:
+                    instance.client._disconnect()
+                    instance.client = None
+
+
+if __name__ == "__main__":
+    pool = EmulatorPool()
+    for instance in pool.instances:
+        if instance.alive:
+            print(instance)
+    pool.close()
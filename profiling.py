@@ -0,0 +1,102 @@
+"""
+Where the time of a step goes
+
+StepProfiler keeps the last `window` timings of every phase in preallocated
+int64 rings, taken with perf_counter_ns. A step is bracketed by start() and
+finish(), with lap(phase) after each phase charging it the time since the
+previous mark, which keeps the cost per phase to one clock read and a dict store.
+"""
+import time
+import typing as T
+
+import numpy as np
+
+
+PERCENTILES = (50, 95, 99)
+
+
+class StepProfiler:
+    """
+    Rolling per phase timings over the last `window` steps
+    """
+
+    def __init__(self, window: int = 1000) -> None:
+        self.window = window
+        self.steps = 0
+        # nanoseconds per phase of the step in progress, or the last one after finish()
+        self.last: T.Dict[str, int] = {}
+        self._rings: T.Dict[str, np.ndarray] = {}
+        self._counts: T.Dict[str, int] = {}
+        self._start = 0
+        self._mark = 0
+
+    def start(self) -> None:
+        self.last = {}
+        self._start = self._mark = time.perf_counter_ns()
+
+    def lap(self, phase: str) -> None:
+        """
+        Charge `phase` with the time since start or the previous lap
+        """
+        now = time.perf_counter_ns()
+        self.last[phase] = self.last.get(phase, 0) + now - self._mark
+        self._mark = now
+
+    def add(self, phase: str, elapsed_ns: int) -> None:
+        """
+        Charge `phase` with time measured elsewhere, e.g. inside another phase
+        """
+        self.last[phase] = self.last.get(phase, 0) + elapsed_ns
+
+    def finish(self) -> T.Dict[str, int]:
+        self.last["total"] = time.perf_counter_ns() - self._start
+        for phase, elapsed in self.last.items():
+            ring = self._rings.get(phase)
+            if ring is None:
+                ring = self._rings[phase] = np.zeros(self.window, dtype=np.int64)
+                self._counts[phase] = 0
+            # every phase has its own position, as some only show up on some steps
+            ring[self._counts[phase] % self.window] = elapsed
+            self._counts[phase] += 1
+        self.steps += 1
+        return self.last
+
+    @property
+    def phases(self) -> T.List[str]:
+        return list(self._rings)
+
+    def samples(self, phase: str) -> np.ndarray:
+        """
+        Timings of `phase` in nanoseconds over the window, in no particular order
+        """
+        return self._rings[phase][:min(self._counts[phase], self.window)]
+
+    def percentiles(self, phase: str) -> T.Dict[int, float]:
+        """
+        p50 / p95 / p99 of `phase` over the window, in microseconds
+        """
+        values = np.percentile(self.samples(phase), PERCENTILES) / 1e3
+        return dict(zip(PERCENTILES, values.tolist()))
+
+    def histogram(self, phase: str, bins: int = 20) -> T.Tuple[np.ndarray, np.ndarray]:
+        """
+        Counts and bin edges in microseconds of `phase` over the window
+        """
+        return np.histogram(self.samples(phase) / 1e3, bins=bins)
+
+    def summary(self) -> str:
+        if not self.steps:
+            return "No steps profiled"
+        lines = [f"{'phase':<32} {'p50 us':>10} {'p95 us':>10} {'p99 us':>10}"]
+        for phase in self.phases:
+            p50, p95, p99 = self.percentiles(phase).values()
+            lines.append(f"{phase:<32} {p50:>10.1f} {p95:>10.1f} {p99:>10.1f}")
+        total = self.percentiles("total")[50]
+        lines.append(f"{self.steps} steps, {1e6 / total:.1f} steps/s at the median")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        self.steps = 0
+        self.last = {}
+        self._rings.clear()
+        self._counts.clear()
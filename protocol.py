@@ -0,0 +1,141 @@
+"""
+Framed wire protocol spoken between the Python clients and lua\\socketserver.lua
+
+Every message on the socket is a fixed size header followed by a payload:
+
+    type (uint8) | request id (uint16) | payload length (uint32) | payload
+
+All header fields are big-endian. Replies echo the request id of the request they
+answer, so a stale reply left over from a request that timed out can be told apart
+from the one we are actually waiting on.
+
+The server also pushes events nobody asked for, with request id 0: a watched WRAM
+span changed. Their payload is
+
+    frame (uint32) | address (uint16) | length (uint16) | old bytes | new bytes
+"""
+import socket
+import struct
+import typing as T
+
+
+HEADER = struct.Struct(">BHI")
+
+# sanity limit so a corrupted header doesn't make us try to allocate gigabytes
+MAX_PAYLOAD = 1 << 20
+
+MSG_REQUEST = 0x01
+MSG_REPLY = 0x02
+MSG_ERROR = 0x03
+MSG_EVENT = 0x04
+MESSAGE_TYPES = (MSG_REQUEST, MSG_REPLY, MSG_ERROR, MSG_EVENT)
+
+EVENT = struct.Struct(">IHH")
+
+# request ids wrap around, zero is reserved for messages that do not answer a request
+MAX_REQUEST_ID = 0xFFFF
+
+
+class ProtocolError(Exception):
+    """
+    The byte stream does not look like a sequence of frames
+    """
+
+
+class CommandError(Exception):
+    """
+    The server understood the request but could not execute it
+    """
+
+
+class Frame(T.NamedTuple):
+    msg_type: int
+    request_id: int
+    payload: bytes
+
+
+class WatchEvent(T.NamedTuple):
+    frame: int
+    addr: int
+    old: bytes
+    new: bytes
+
+
+def parse_event(payload: bytes) -> WatchEvent:
+    if len(payload) < EVENT.size:
+        raise ProtocolError(f"Event of {len(payload)} bytes is shorter than its header")
+    frame, addr, length = EVENT.unpack_from(payload)
+    if len(payload) != EVENT.size + 2 * length:
+        raise ProtocolError(f"Event for {length} bytes at {addr:#06x} has a {len(payload)} byte payload")
+    old = payload[EVENT.size:EVENT.size + length]
+    return WatchEvent(frame, addr, old, payload[EVENT.size + length:])
+
+
+def pack_event(frame: int, addr: int, old: bytes, new: bytes) -> bytes:
+    return EVENT.pack(frame, addr, len(old)) + old + new
+
+
+def next_request_id(request_id: int) -> int:
+    """
+    Increment a request id, skipping the reserved zero value on wraparound
+    """
+    return request_id % MAX_REQUEST_ID + 1
+
+
+def pack_frame(msg_type: int, request_id: int, payload: bytes) -> bytes:
+    return HEADER.pack(msg_type, request_id, len(payload)) + payload
+
+
+def unpack_header(header: bytes) -> T.Tuple[int, int, int]:
+    msg_type, request_id, length = HEADER.unpack(header)
+    if msg_type not in MESSAGE_TYPES:
+        raise ProtocolError(f"Unknown message type {msg_type:#x}")
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload length {length} exceeds limit of {MAX_PAYLOAD}")
+    return msg_type, request_id, length
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    """
+    Keep reading until exactly `size` bytes have arrived
+
+    A single recv only returns whatever happens to be in the kernel buffer, which for
+    an 8 KB WRAM dump is frequently less than the whole thing.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            raise ConnectionError("Socket closed by remote in the middle of a frame")
+        received += count
+    return bytes(buffer)
+
+
+def recv_frame(sock: socket.socket) -> Frame:
+    msg_type, request_id, length = unpack_header(recv_exact(sock, HEADER.size))
+    payload = recv_exact(sock, length) if length else b""
+    return Frame(msg_type, request_id, payload)
+
+
+class FrameDecoder:
+    """
+    Incremental decoder for callers that receive data in arbitrary chunks
+    (asyncio protocols, the stand-in server)
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> T.List[Frame]:
+        self._buffer += data
+        frames = []
+        while len(self._buffer) >= HEADER.size:
+            msg_type, request_id, length = unpack_header(self._buffer[:HEADER.size])
+            end = HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            frames.append(Frame(msg_type, request_id, bytes(self._buffer[HEADER.size:end])))
+            del self._buffer[:end]
+        return frames
@@ -0,0 +1,99 @@
+"""
+Compile the set of WRAM regions we actually decode into a minimal list of reads
+
+MemoryMap only looks at a couple dozen small regions of the 8 KB of WRAM. Rather
+than pull the whole thing every step we merge the fields of every entity into as
+few contiguous spans as possible and ask the server for just those.
+"""
+import struct
+import typing as T
+
+import numpy as np
+
+
+# spans go over the wire as big-endian (address uint16, length uint16) pairs
+SPAN = struct.Struct(">HH")
+
+
+class Span(T.NamedTuple):
+    addr: int
+    length: int
+
+    @property
+    def end(self) -> int:
+        return self.addr + self.length
+
+
+def merge_ranges(ranges: T.Iterable[T.Tuple[int, int]], gap: int = 0) -> T.List[Span]:
+    """
+    Merge (start, end) ranges that overlap or touch
+
+    Ranges separated by no more than `gap` bytes are merged too, which trades a few
+    wasted bytes for fewer reads on the server.
+    """
+    spans: T.List[Span] = []
+    for start, end in sorted(ranges):
+        if spans and start <= spans[-1].end + gap:
+            last = spans[-1]
+            spans[-1] = Span(last.addr, max(last.end, end) - last.addr)
+        else:
+            spans.append(Span(start, end - start))
+    return spans
+
+
+class ReadPlan:
+    """
+    A fixed list of spans to read, and how to lay the reply back out as WRAM
+    """
+
+    def __init__(self, spans: T.List[Span], base_addr: int, size: int = 8192) -> None:
+        self.spans = spans
+        self.base_addr = base_addr
+        self.size = size
+        self.nbytes = sum(span.length for span in spans)
+        self.packed = b"".join(SPAN.pack(*span) for span in spans)
+
+        # precompute where each span lands in the reply and in the sparse buffer
+        self._slices: T.List[T.Tuple[slice, slice]] = []
+        offset = 0
+        for span in spans:
+            start = span.addr - base_addr
+            self._slices.append((slice(start, start + span.length), slice(offset, offset + span.length)))
+            offset += span.length
+
+        # offset into the region of every byte the plan covers
+        self.offsets = np.concatenate(
+            [np.arange(span.addr - base_addr, span.end - base_addr) for span in spans]
+        ) if spans else np.zeros(0, dtype=np.intp)
+
+    def __repr__(self) -> str:
+        return f"ReadPlan({len(self.spans)} spans, {self.nbytes} of {self.size} bytes)"
+
+    def scatter(self, payload: bytes, buffer: bytearray = None) -> bytearray:
+        """
+        Copy the concatenated span contents into a WRAM sized buffer at their
+        original offsets. Bytes outside the plan are left untouched (zero for a
+        fresh buffer), so entities can hydrate from it exactly as from a full dump.
+        """
+        if len(payload) != self.nbytes:
+            raise ValueError(f"Expected {self.nbytes} bytes for {self}, got {len(payload)}")
+        if buffer is None:
+            buffer = bytearray(self.size)
+        for dest, src in self._slices:
+            buffer[dest] = payload[src]
+        return buffer
+
+    def scatter_batch(self, rows: np.ndarray) -> np.ndarray:
+        """
+        scatter for a stack of (N, nbytes) replies, giving (N, size) WRAM ready for
+        MemoryMap.decode_batch
+        """
+        if rows.shape[-1] != self.nbytes:
+            raise ValueError(f"Expected rows of {self.nbytes} bytes for {self}, got {rows.shape[-1]}")
+        out = np.zeros((len(rows), self.size), dtype=np.uint8)
+        out[:, self.offsets] = rows
+        return out
+
+
+def compile_read_plan(ranges: T.Iterable[T.Tuple[int, int]], base_addr: int, gap: int = 0) -> ReadPlan:
+    return ReadPlan(merge_ranges(ranges, gap=gap), base_addr)
@@ -4,8 +4,12 @@ Calculate rewards from game state
 from collections import Counter
 from collections import defaultdict
 import re
+import time
 import typing as T
+from memmap import MemoryDiff
 from memmap import MemoryMap
+from memo import MemoCache
+from profiling import StepProfiler
 
 
 class ActionRanges:
@@ -38,8 +42,20 @@ class RewardTrigger:
 
     ONE_TIME = False
 
+    # (entity, field) pairs the result depends on besides its own state, e.g.
+    # (("location", "map_number"),). Triggers that declare them are skipped while
+    # none of them changed and the last evaluation came out as 0.0, which for the
+    # triggers that do declare them means the result cannot have changed.
+    DEPENDS_ON: T.Optional[T.Tuple[T.Tuple[str, str], ...]] = None
+
+    # (entity, field) pairs of the previous and next map that are all the trigger
+    # looks at besides the button pressed, for triggers that keep no state of their
+    # own. Their results are memoized on those bytes when evaluated with a cache.
+    READS: T.Optional[T.Tuple[T.Tuple[str, str], ...]] = None
+
     def __init__(self) -> None:
         self._mem = None
+        self._last_result: T.Optional[float] = None
         self.initialize()
 
     def initialize(self) -> None:
@@ -47,15 +63,46 @@ class RewardTrigger:
         Child classes can override if desired
         """
 
-    def evaluate_with_mmap(self, next_mem: MemoryMap, *args, **kwargs) -> float:
+    def evaluate_with_mmap(
+        self,
+        next_mem: MemoryMap,
+        action: int,
+        *args,
+        changes: T.Optional[MemoryDiff] = None,
+        cache: T.Optional[MemoCache] = None,
+        **kwargs,
+    ) -> float:
         # always fail on first evaluation
         if self._mem is None:
             self._mem = next_mem
             return 0.0
-        result = self.evaluate(next_mem, *args, **kwargs)
+        if self.can_skip(changes):
+            self._mem = next_mem
+            return 0.0
+        key = None
+        if cache is not None and self.READS is not None:
+            key = (
+                type(self),
+                self._mem.content_key(self.READS),
+                next_mem.content_key(self.READS),
+                ActionRanges.get_button(action),
+            )
+            result = cache.get(key)
+            if result is not None:
+                self._mem = next_mem
+                return result
+        result = self.evaluate(next_mem, action, *args, **kwargs)
+        if key is not None:
+            cache.put(key, result)
         self._mem = next_mem
+        self._last_result = result
         return result
 
+    def can_skip(self, changes: T.Optional[MemoryDiff]) -> bool:
+        if changes is None or self.DEPENDS_ON is None or self._last_result != 0.0:
+            return False
+        return not any(changes.touched(attr, label) for attr, label in self.DEPENDS_ON)
+
     def evaluate(self, next_mem: MemoryMap, *args, **kwargs) -> float:
         raise NotImplementedError("Inheriting classes must define")
 
@@ -140,6 +187,8 @@ class NewRegion(RewardTrigger):
     If the agent has arrived to a new map location, give a larger reward.
     """
 
+    DEPENDS_ON = (("location", "map_number"),)
+
     def initialize(self) -> None:
         self._visited_maps = set()
 
@@ -157,6 +206,8 @@ class EffectlessButton(RewardTrigger):
     on the screen or there previously was no text on the screen.
     """
 
+    READS = (("tile", "onscreen_text"),)
+
     def evaluate(self, next_mem: MemoryMap, action: int, *args, **kwargs) -> float:
         prev_text = tuple(self._mem.tile.onscreen_text.split())
         next_text = tuple(next_mem.tile.onscreen_text.split())
@@ -174,6 +225,8 @@ class DialogInteraction(RewardTrigger):
     Penalties on issuing not A or not B during text box
     """
 
+    READS = (("tile", "onscreen_text"),)
+
     def evaluate(self, next_mem: MemoryMap, action: int, *args, **kwargs) -> float:
         """
         If there's real dialog on the screen and the action was not an acknowledgement,
@@ -201,6 +254,8 @@ class Moving(RewardTrigger):
     Penalties for idle
     """
 
+    READS = (("location", "x_position"), ("location", "y_position"))
+
     def evaluate(self, next_mem: MemoryMap, action: int, *args, **kwargs) -> float:
         prev_pos_y = self._mem.location.y_position
         prev_pos_x = self._mem.location.x_position
@@ -219,6 +274,8 @@ class CaughtPokemon(RewardTrigger):
     Large reward for catching a new Popkemon
     """
 
+    DEPENDS_ON = (("player", "pokemon_in_party"),)
+
     def initialize(self) -> None:
         self._pokemon_count = 0
 
@@ -233,6 +290,7 @@ class CaughtPokemon(RewardTrigger):
 class StarterPokemon(RewardTrigger):
 
     ONE_TIME = True
+    DEPENDS_ON = (("player", "pokemon_in_party"),)
 
     def evaluate(self, next_mem: MemoryMap, action: int, *args, **kwargs) -> float:
         if next_mem.player.pokemon_in_party == 1:
@@ -248,10 +306,16 @@ class RewardManager:
     Lots of rewards will trigger on some differential in state.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, cache: T.Optional[MemoCache] = None, profiler: T.Optional[StepProfiler] = None) -> None:
         """
         Initialize rewards management here
+
+        Results of pure triggers are memoized in `cache` when given, which can be
+        shared between managers. With a profiler every trigger is timed as a
+        `reward.<Trigger>` phase of the step in progress.
         """
+        self.cache = cache
+        self.profiler = profiler
 
         self._triggers_kls = [
             Dialogue,
@@ -263,16 +327,37 @@ class RewardManager:
             DialogInteraction,
             StarterPokemon,
         ]
-        self._triggers: T.List[RewardTrigger] = [kls() for kls in self._triggers_kls]
+        self._triggers: T.List[RewardTrigger] = []
+
+        # triggers hold on to the map of the previous step, and callers update
+        # theirs in place, so triggers get one of two copies of our own in turn
+        self._maps = [MemoryMap(), MemoryMap()]
+        self._current = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Start over with fresh triggers, as for a new episode
+        """
+        self._triggers = [kls() for kls in self._triggers_kls]
 
     def calculate_reward(self, mem: MemoryMap, action: int) -> float:
         """
         Compute the reward function
         """
+        changes = MemoryMap.diff(self._maps[self._current], mem)
+        self._current ^= 1
+        mem = self._maps[self._current].update_from_memory(mem.memory)
+
         score = -1.0  # don't spend too long now...
         to_remove = []
         for trigger in self._triggers:
-            evaluated = trigger.evaluate_with_mmap(mem, action)
+            if self.profiler is not None:
+                start = time.perf_counter_ns()
+                evaluated = trigger.evaluate_with_mmap(mem, action, changes=changes, cache=self.cache)
+                self.profiler.add(f"reward.{type(trigger).__name__}", time.perf_counter_ns() - start)
+            else:
+                evaluated = trigger.evaluate_with_mmap(mem, action, changes=changes, cache=self.cache)
             score += evaluated
             if evaluated and trigger.ONE_TIME:
                 to_remove.append(trigger)
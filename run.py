@@ -1,15 +1,30 @@
+import argparse
 import time
 import gymnasium as gym
 from environment import BlueEnvironment
 from stable_baselines3 import PPO
 from stable_baselines3.common.env_util import make_vec_env
+from vecenv import BlueVecEnv
 
-env = BlueEnvironment()
+parser = argparse.ArgumentParser()
+parser.add_argument("--envs", type=int, default=1, help="number of emulators, found on the port ladder")
+args = parser.parse_args()
+
+if args.envs > 1:
+    env = BlueVecEnv(num_envs=args.envs)
+else:
+    env = BlueEnvironment()
 
 model = PPO("MultiInputPolicy", env, verbose=1, learning_rate=0.0005)
 model.learn(total_timesteps=100000, progress_bar=True)
 model.save("ppo_blue")
 
+if args.envs > 1:
+    obs = env.reset()
+    while True:
+        action, _states = model.predict(obs)
+        obs, rewards, _, _ = env.step(action)
+
 obs, _ = env.reset()
 while True:
     action, _states = model.predict(obs)
@@ -2,17 +2,25 @@
 Build gym spaces from a Pokemon memory map
 """
 import numpy as np
-import struct
 import typing as T
-from bitstring import BitArray
 
 from gymnasium import spaces
 from command import CommandClient
 from memmap import MemoryMap
-from memparser import Entity
+from memo import MemoCache
+from tilevocab import shared_vocabulary
 
 
-HASH_BUMP = {}
+# everything the reduced space looks at
+REDUCED_SPACE_FIELDS = (
+    ("tile", "onscreen_tiles"),
+    ("location", "map_number"),
+    ("location", "x_position"),
+    ("location", "y_position"),
+)
+
+# the screen is 20 x 18 one byte tiles, read as 180 big-endian pairs of tiles
+OCCUPANCY_SIZE = 180
 
 
 def create_reduced_space_from_mmap(mem: MemoryMap) -> spaces.Dict:
@@ -23,11 +31,9 @@ def create_reduced_space_from_mmap(mem: MemoryMap) -> spaces.Dict:
     """
     output = spaces.Dict()
 
-    # Generate an occupancy grid of 10 x 10
-    # NOTE: I think we run out of memory if we make the vec too large
-    # We'll use a hash bump
-    #output["occupancy"] = spaces.MultiDiscrete([256] * 100)
-    
+    # Occupancy grid of the whole screen, one vocabulary id per pair of tiles
+    output["occupancy"] = spaces.Box(0, shared_vocabulary().size - 1, shape=(OCCUPANCY_SIZE,), dtype=np.uint8)
+
     # Map our current location as a 3D box
     output["map"] = spaces.Box(np.array([0, 0, 0]), np.array([255, 255, 255]))
 
@@ -35,87 +41,109 @@ def create_reduced_space_from_mmap(mem: MemoryMap) -> spaces.Dict:
     return output
 
 
-def populate_reduced_space_from_mmap(mem: MemoryMap) -> T.Dict[str, T.Any]:
-    output = dict()
+def populate_reduced_space_from_mmap(
+    mem: MemoryMap,
+    out: T.Optional[T.Dict[str, np.ndarray]] = None,
+    cache: T.Optional[MemoCache] = None,
+) -> T.Dict[str, T.Any]:
+    """
+    Observation for the reduced space, written into the arrays of `out` when given
+
+    With a cache, maps that agree on REDUCED_SPACE_FIELDS get the same observation
+    without encoding it again. Without `out` the cached arrays themselves come back, so
+    leave them be.
+    """
+    key = mem.content_key(REDUCED_SPACE_FIELDS) if cache is not None else None
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        occupancy, location = cached
+    else:
+        occupancy = shared_vocabulary().encode(np.frombuffer(mem.tile.onscreen_tiles, dtype=">u2"))
+        location = (mem.location.map_number, mem.location.x_position, mem.location.y_position)
+        if cache is not None:
+            cache.put(key, (occupancy, location))
+    if out is None:
+        return {"occupancy": occupancy, "map": location}
 
     # Populate occupancy grid from tiles
-    output["occupancy"] = []
-    for idx in range(180):
-        tile = struct.unpack(">H", mem.tile.onscreen_tiles[2 * idx:2 * idx+2])[0]
-        hashed = hash(tile) % 256
-        while True:
-            if hashed not in HASH_BUMP.values():
-                HASH_BUMP[tile] = hashed
-                break
-            hashed += 1
-
-            if hashed == hash(tile) % 256:  # we made it a circle
-                print("Hash Bump Full...")
-                break
-        output["occupancy"].append(hashed)
+    out["occupancy"][:] = occupancy
 
     # Fill out our map location
-    output["map"] = (mem.location.map_number, mem.location.x_position, mem.location.y_position)
-    return output
+    out["map"][:] = location
+    return out
 
 
-def create_spaces_from_mmap(memory_map: MemoryMap) -> spaces.Dict:
-    output = spaces.Dict()
-    # TODO: doing discovery implicitly is jank
-    for attrname in dir(memory_map):
-        if isinstance(getattr(memory_map, attrname), Entity):
-            for label, subspace in build_spaces(getattr(memory_map, attrname)):
-                # TODO: wow this is so shitty
-                output[f"{attrname}_{label}"] = subspace
-    return output
+class ObservationEncoder:
+    """
+    Every scalar field of every entity as one flat bit vector
+
+    List entities (sprites, party pokemon) repeat their layout once per element,
+    keyed `<attr>_<index>_<label>`. The layout is worked out once from the
+    AddressMaps: the bytes of all fields are
+    gathered out of WRAM in one go and unpacked into bits, most significant first,
+    so a step is a gather and an unpackbits. `as_dict` gives per field views into
+    the flat vector, matching `dict_space`.
+    """
 
+    def __init__(self) -> None:
+        offsets: T.List[int] = []
+        # (key, first bit, number of bits)
+        self.fields: T.List[T.Tuple[str, int, int]] = []
+        for slot in MemoryMap.LAYOUT:
+            # a label that appears twice means the last field, as everywhere else
+            by_label = {field.label: field for field in slot.model_klass.address_map()._FIELDS}
+            for idx in range(slot.count):
+                start = slot.addr + idx * slot.stride - MemoryMap.REGION_START_ADDR
+                prefix = slot.attr if slot.count == 1 else f"{slot.attr}_{idx}"
+                for field in by_label.values():
+                    if not field.is_struct_type:
+                        # buffers and text have no sensible binary encoding here
+                        continue
+                    self.fields.append((f"{prefix}_{field.label}", len(offsets) * 8, field.len * 8))
+                    offsets.extend(range(start + field.addr, start + field.addr + field.len))
+        self.offsets = np.array(offsets, dtype=np.intp)
+        self.size = len(offsets) * 8
+
+    @property
+    def space(self) -> spaces.Box:
+        return spaces.Box(0, 1, shape=(self.size,), dtype=np.uint8)
+
+    def dict_space(self) -> spaces.Dict:
+        return spaces.Dict({
+            key: spaces.Box(0, 1, shape=(nbits,), dtype=np.uint8) for key, _start, nbits in self.fields
+        })
+
+    def encode(self, mem: MemoryMap, out: T.Optional[np.ndarray] = None) -> np.ndarray:
+        bits = np.unpackbits(np.frombuffer(mem.memory, dtype=np.uint8)[self.offsets])
+        if out is None:
+            return bits
+        out[:] = bits
+        return out
+
+    def as_dict(self, flat: np.ndarray) -> T.Dict[str, np.ndarray]:
+        """
+        Views of each field's bits, writing to them writes to `flat`
+        """
+        return {key: flat[start:start + nbits] for key, start, nbits in self.fields}
+
+
+_ENCODER: T.Optional[ObservationEncoder] = None
+
+
+def observation_encoder() -> ObservationEncoder:
+    global _ENCODER
+    if _ENCODER is None:
+        _ENCODER = ObservationEncoder()
+    return _ENCODER
 
-def build_spaces(entity: Entity) -> T.Tuple[str, spaces.Space]:
-    subspaces: T.List[T.Tuple[str, spaces.Space]] = []
-    for field in entity._MAP._FIELDS:
-        if field._type == "buffer" or field.is_text:
-            # ignore these since i don't know what we'd do with it
-            pass
-        #elif field.is_text:
-        #    # use a text field
-        #    subspaces.append((field.label, spaces.Text(256)))
-        elif field.is_struct_type:
-            # assume integer, probably safe to just use 8 or 16-bit representation?
-            # use width * 8
-            subspaces.append((field.label, spaces.MultiBinary(struct.calcsize(field._type) * 8)))
-        else:
-            print(f"Unhandled field type {field.label} - {field._type}")
 
-    return subspaces
+def create_spaces_from_mmap(memory_map: MemoryMap) -> spaces.Dict:
+    return observation_encoder().dict_space()
 
 
 def populate_space_from_mmap(memory_map: MemoryMap) -> T.Dict[str, T.Any]:
-    output = dict()
-    for attrname in dir(memory_map):
-        if isinstance(getattr(memory_map, attrname), Entity):
-            for label, subfield in populate_space(getattr(memory_map, attrname)):
-                # TODO: wow this is so shitty
-                output[f"{attrname}_{label}"] = subfield
-    return output
-
-
-def populate_space(entity: Entity) -> T.Tuple[str, T.Any]:
-    subfields = []
-    for field in entity._MAP._FIELDS:
-        if field._type == "buffer" or field.is_text:
-            # TODO: why doesn't text work with PPO...
-            pass
-        #elif field.is_text:
-        #    subfields.append((field.label, getattr(entity, field.label)))
-        elif field.is_struct_type:
-            fieldsize = struct.calcsize(field._type)
-            padded_array = BitArray(length=fieldsize * 8)
-            value = getattr(entity, field.label)
-            padded_array.reverse()
-            padded_array.overwrite(BitArray(value).reverse())
-            padded_array.reverse()
-            subfields.append((field.label, padded_array))
-    return subfields
+    encoder = observation_encoder()
+    return encoder.as_dict(encoder.encode(memory_map))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,404 @@
+"""
+Stand-in for lua\\socketserver.lua so the client side can be exercised without mGBA
+
+Speaks the same framed protocol as the real server and answers the same commands,
+but serves WRAM out of a local buffer instead of a running game. Every connection
+is its own emulator with its own WRAM. Given a trace, pressing a button moves the
+connection on to the next snapshot that was recorded after that same button, so
+replies follow the actions the client takes.
+
+Replies can be held back to look like a real emulator: a fixed latency plus random
+jitter per reply, and steps taking their frames at a given frame rate. Pipelined
+replies still go out in order. One event loop serves every connection, which is
+plenty for hundreds of them.
+
+There are no frames in between snapshots, so an adaptive step settles one frame
+after the stable frames if nothing it watches changed, and takes the whole cap
+otherwise. Watchpoints are checked after every command rather than every frame,
+and their events go out just ahead of its reply. The history has the state after
+a step on every one of its frames.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import random
+import struct
+import threading
+import typing as T
+
+import numpy as np
+
+from command import BUTTONS
+from command import HISTORY
+from command import SETTLED
+from delta import encode_delta
+from protocol import FrameDecoder
+from protocol import MSG_ERROR
+from protocol import MSG_EVENT
+from protocol import MSG_REPLY
+from protocol import MSG_REQUEST
+from protocol import ProtocolError
+from protocol import pack_event
+from protocol import pack_frame
+from readplan import SPAN
+from traces import Trace
+from traces import load_trace
+
+
+WRAM_SIZE = 8192
+WRAM_BASE = 0xC000
+
+# stand-in savestates are the trace cursor and WRAM, nothing like mGBA's
+STATE_MAGIC = b"SIST"
+STATE_HEADER = struct.Struct(">4sI")
+
+
+class ConnectionState:
+    """
+    What the server remembers per client, mirrors the per socket tables in the Lua
+    plus the emulator behind it
+    """
+
+    def __init__(self, wram: bytes) -> None:
+        self.wram = bytearray(wram)
+        self.cursor = 0
+        self.keys: T.Set[str] = set()
+        self.snapshot: T.Optional[bytes] = None
+        # savestate slots, the Lua keeps them per emulator which here is per connection
+        self.states: T.Dict[bytes, bytes] = {}
+        # frames run so far, only steps run any so this is always as if frame locked
+        self.frame = 0
+        # frames the last step took
+        self.step_frames = 0
+        # (packed spans, stable frames) adaptive steps watch
+        self.watch: T.Optional[T.Tuple[bytes, int]] = None
+        # [address, length, last seen] per watchpoint
+        self.watchpoints: T.List[T.List[T.Any]] = []
+        # packed spans recorded on every frame and the rows of the last frames
+        self.history_spans = b""
+        self.history: T.Optional[T.Deque[bytes]] = None
+        # loop time at which the emulator is done with queued steps, and at which
+        # the last reply goes out
+        self.busy_until = 0.0
+        self.reply_at = 0.0
+
+
+class StandInServer:
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 10018,
+        wram: bytes = None,
+        trace: Trace = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        frame_rate: float = 0.0,
+        seed: int = None,
+    ) -> None:
+        """
+        `latency` and `jitter` are in seconds, every reply is delayed by latency plus
+        a uniform draw from [0, jitter). With a `frame_rate`, steps also take their
+        hold and settle frames at that rate, one step at a time per connection.
+        """
+        self._host = host
+        self._port = port
+        self.trace = trace
+        self._by_action: T.Dict[int, np.ndarray] = {}
+        if trace is not None:
+            wram = trace.snapshots[0].tobytes()
+            self._by_action = {
+                int(action): np.flatnonzero(trace.actions == action) for action in np.unique(trace.actions)
+            }
+        self.wram = bytes(wram if wram is not None else os.urandom(WRAM_SIZE))
+        self.latency = latency
+        self.jitter = jitter
+        self.frame_rate = frame_rate
+        self._random = random.Random(seed)
+        self.connections = 0
+        self._server: asyncio.AbstractServer = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._ready = threading.Event()
+
+    @property
+    def port(self) -> int:
+        """
+        Port actually bound, useful when constructed with port 0
+        """
+        if self._server is None:
+            return self._port
+        return self._server.sockets[0].getsockname()[1]
+
+    def read_spans(self, conn: ConnectionState, packed: bytes) -> bytes:
+        return b"".join(
+            conn.wram[addr - WRAM_BASE:addr - WRAM_BASE + length] for addr, length in SPAN.iter_unpack(packed)
+        )
+
+    def press(self, conn: ConnectionState, button: str) -> None:
+        """
+        Move the connection to the next snapshot recorded after `button`, looping at
+        the end of the trace. Buttons the trace never pressed just move on by one.
+        """
+        conn.keys.add(button)
+        if self.trace is None:
+            return
+        recorded = self._by_action.get(BUTTONS.index(button))
+        if recorded is None:
+            conn.cursor = (conn.cursor + 1) % len(self.trace)
+        else:
+            conn.cursor = int(recorded[np.searchsorted(recorded, conn.cursor, side="right") % len(recorded)])
+        conn.wram[:] = self.trace.snapshots[conn.cursor].tobytes()
+
+    def read_wram(self, conn: ConnectionState, spec: T.Optional[bytes]) -> bytes:
+        """
+        Shape a WRAM read the way ST_readWram does
+        """
+        if spec is None:
+            return bytes(conn.wram)
+        if spec.startswith(b"R"):
+            return self.read_spans(conn, spec[1:])
+        if spec in (b"D", b"K"):
+            reply = encode_delta(conn.snapshot, conn.wram, keyframe=spec == b"K")
+            conn.snapshot = bytes(conn.wram)
+            return reply
+        raise ValueError(f"malformed read spec {spec!r}")
+
+    def check_watchpoints(self, conn: ConnectionState) -> bytes:
+        """
+        Event frames for every watchpoint that changed since it was last checked
+        """
+        events = []
+        for point in conn.watchpoints:
+            addr, length, last = point
+            current = bytes(conn.wram[addr - WRAM_BASE:addr - WRAM_BASE + length])
+            if current != last:
+                events.append(pack_frame(MSG_EVENT, 0, pack_event(conn.frame, addr, last, current)))
+                point[2] = current
+        return b"".join(events)
+
+    def load_state(self, conn: ConnectionState, slot: bytes) -> None:
+        state = conn.states.get(slot)
+        if state is None:
+            raise ValueError(f"no savestate in slot {slot.decode('utf-8', errors='replace')}")
+        magic, cursor = STATE_HEADER.unpack_from(state)
+        if magic != STATE_MAGIC or len(state) != STATE_HEADER.size + WRAM_SIZE:
+            raise ValueError("not a stand-in savestate")
+        conn.cursor = cursor
+        conn.wram[:] = state[STATE_HEADER.size:]
+        conn.keys.clear()
+
+    def handle(self, payload: bytes, conn: ConnectionState) -> bytes:
+        """
+        Execute one command and produce the reply payload
+        """
+        if payload.startswith(b"B:"):
+            button = payload[2:].decode("utf-8")
+            if button not in BUTTONS:
+                return b"NOT OK"
+            self.press(conn, button)
+            return b"OK"
+        if payload.startswith(b"step:"):
+            button, hold, settle, *spec = payload[5:].split(b":", 3)
+            if button.decode("utf-8") not in BUTTONS:
+                raise ValueError(f"unknown button {button}")
+            adaptive = settle.startswith(b"a")
+            if adaptive and conn.watch is None:
+                raise ValueError("adaptive step without a settle_watch")
+            before = self.read_spans(conn, conn.watch[0]) if adaptive else None
+            self.press(conn, button.decode("utf-8"))
+            conn.keys.clear()
+            settle = int(settle[1:] if adaptive else settle)
+            if adaptive and self.read_spans(conn, conn.watch[0]) == before:
+                # like ST_watchSettled: the first settle frame reads the watch set,
+                # then it has to read the same for the stable frames after that
+                settle = min(conn.watch[1] + 1, settle)
+            conn.step_frames = max(int(hold), 1) + settle
+            conn.frame += conn.step_frames
+            if conn.history is not None:
+                conn.history.extend([self.read_spans(conn, conn.history_spans)] * conn.step_frames)
+            reply = self.read_wram(conn, spec[0] if spec else None)
+            return SETTLED.pack(settle) + reply if adaptive else reply
+        if payload.startswith(b"settle_watch:"):
+            stable, sep, packed = payload[13:].partition(b":")
+            if not sep or not packed:
+                raise ValueError("malformed settle_watch arguments")
+            conn.watch = (packed, max(int(stable), 1))
+            return b"OK"
+        if payload.startswith(b"watch:"):
+            conn.watchpoints = [
+                [addr, length, bytes(conn.wram[addr - WRAM_BASE:addr - WRAM_BASE + length])]
+                for addr, length in SPAN.iter_unpack(payload[6:])
+            ]
+            return b"OK"
+        if payload.startswith(b"history:"):
+            frames, sep, packed = payload[8:].partition(b":")
+            if not sep:
+                raise ValueError("malformed history arguments")
+            if int(frames) == 0 or not packed:
+                conn.history = None
+            else:
+                conn.history_spans = packed
+                conn.history = collections.deque(maxlen=int(frames))
+            return b"OK"
+        if payload == b"dump_history":
+            if conn.history is None:
+                raise ValueError("no history recorded on this connection")
+            return HISTORY.pack(conn.frame, len(conn.history)) + b"".join(conn.history)
+        if payload.startswith(b"read_ranges:"):
+            return self.read_spans(conn, payload[12:])
+        if payload.startswith(b"frame_lock:"):
+            if payload[11:] not in (b"0", b"1"):
+                raise ValueError(f"frame_lock takes 0 or 1, got {payload[11:].decode('utf-8', errors='replace')}")
+            return b"OK"
+        if payload == b"frame":
+            return str(conn.frame).encode("utf-8")
+        if payload.startswith(b"save_state:"):
+            conn.states[payload[11:]] = STATE_HEADER.pack(STATE_MAGIC, conn.cursor) + bytes(conn.wram)
+            return b"OK"
+        if payload.startswith(b"load_state:"):
+            slot, *spec = payload[11:].split(b":", 1)
+            self.load_state(conn, slot)
+            return self.read_wram(conn, spec[0] if spec else None)
+        if payload.startswith(b"get_state:"):
+            slot = payload[10:]
+            if slot not in conn.states:
+                raise ValueError(f"no savestate in slot {slot.decode('utf-8', errors='replace')}")
+            return conn.states[slot]
+        if payload.startswith(b"put_state:"):
+            slot, sep, state = payload[10:].partition(b":")
+            if not sep or not state:
+                raise ValueError("put_state needs a savestate after the slot")
+            conn.states[slot] = state
+            return b"OK"
+        if payload in (b"dump_wram_delta", b"dump_wram_delta:key"):
+            return self.read_wram(conn, b"K" if payload.endswith(b":key") else b"D")
+        if payload == b"checksum":
+            return bytes(16)
+        if payload == b"dump_wram":
+            return bytes(conn.wram)
+        if payload == b"memtest":
+            return bytes(conn.wram[0x1000:0x2000])
+        if payload == b"fasttext":
+            conn.wram[0xD355 - WRAM_BASE] = 0
+            return b"OK"
+        if payload in (b"screenshot", b"test"):
+            # nothing to capture or log to
+            return b"OK"
+        if payload in (b"dump_hram", b"dump_sram", b"dump_vram"):
+            raise ValueError(f"{payload.decode('utf-8')} is not available on the stand-in")
+        # "clear" and anything unknown releases the keys, like the Lua
+        conn.keys.clear()
+        return b"OK"
+
+    def reply_time(self, payload: bytes, conn: ConnectionState, now: float) -> float:
+        """
+        Loop time at which the reply to `payload` should be sent, called right
+        after handling it
+        """
+        ready = now
+        if self.frame_rate and payload.startswith(b"step:"):
+            # steps queue behind each other on the emulator, like ST_steps
+            conn.busy_until = max(now, conn.busy_until) + conn.step_frames / self.frame_rate
+            ready = conn.busy_until
+        if self.latency or self.jitter:
+            ready += self.latency + self.jitter * self._random.random()
+        # jitter must not reorder replies on one connection
+        conn.reply_at = max(ready, conn.reply_at)
+        return conn.reply_at
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, frame: bytes) -> None:
+        if not writer.is_closing():
+            writer.write(frame)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        decoder = FrameDecoder()
+        conn = ConnectionState(self.wram)
+        loop = asyncio.get_running_loop()
+        self.connections += 1
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for frame in decoder.feed(data):
+                    if frame.msg_type != MSG_REQUEST:
+                        continue
+                    now = loop.time()
+                    try:
+                        reply = pack_frame(MSG_REPLY, frame.request_id, self.handle(frame.payload, conn))
+                        send_at = self.reply_time(frame.payload, conn, now)
+                    except Exception as exc:
+                        reply = pack_frame(MSG_ERROR, frame.request_id, str(exc).encode("utf-8"))
+                        send_at = self.reply_time(b"", conn, now)
+                    if conn.watchpoints:
+                        reply = self.check_watchpoints(conn) + reply
+                    if send_at <= now:
+                        writer.write(reply)
+                    else:
+                        # a timer per reply rather than a task, cheap enough for many connections
+                        loop.call_at(send_at, self._send, writer, reply)
+                await writer.drain()
+        except (ConnectionError, ProtocolError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._serve_connection, self._host, self._port, backlog=1024)
+        self._ready.set()
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass  # stop() was called
+
+    def start_in_thread(self) -> "StandInServer":
+        """
+        Run the server on a daemon thread, returns once it is accepting connections
+        """
+        thread = threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True)
+        thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=10018)
+    parser.add_argument("--wram", help="file holding an 8192 byte WRAM dump to serve")
+    parser.add_argument("--trace", help="trace recorded with traces.py to play back")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds more, at random")
+    parser.add_argument("--frame-rate", type=float, default=0.0, help="frames per second steps run at, 0 for instant")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    wram = None
+    if args.wram:
+        with open(args.wram, "rb") as wram_file:
+            wram = wram_file.read()
+    trace = load_trace(args.trace) if args.trace else None
+    server = StandInServer(
+        args.host,
+        args.port,
+        wram=wram,
+        trace=trace,
+        latency=args.latency,
+        jitter=args.jitter,
+        frame_rate=args.frame_rate,
+        seed=args.seed,
+    )
+    print(f"Stand-in server listening on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print("Exiting")
@@ -0,0 +1,112 @@
+"""
+Savestates to start episodes from
+
+Loading a savestate takes a couple of milliseconds where getting anywhere in the
+game by pressing buttons takes minutes. A StartStatePool holds named savestates
+with sampling weights. install() copies them into the in memory slots of an
+emulator once, after which a reset is a single load_state round trip that also
+brings back WRAM. Pools are kept on disk as a directory of `<name>.state` files,
+with the weights in `weights.json` next to them.
+"""
+import json
+import os
+import typing as T
+
+import numpy as np
+
+from command import CommandClient
+from command import SLOT_PATTERN
+
+
+# keeps our slots apart from whatever else someone saved on the emulator
+SLOT_PREFIX = "start-"
+WEIGHTS_FILE = "weights.json"
+
+
+class StartStatePool:
+    """
+    Named savestates and how often to start from each
+    """
+
+    def __init__(self) -> None:
+        self.states: T.Dict[str, bytes] = {}
+        self.weights: T.Dict[str, float] = {}
+        self._names: T.List[str] = []
+        self._probabilities: T.Optional[np.ndarray] = None
+
+    def add(self, name: str, state: bytes, weight: float = 1.0) -> None:
+        if not SLOT_PATTERN.fullmatch(name):
+            raise ValueError(f"Start state names are letters, digits, _ and -, got {name!r}")
+        if weight < 0:
+            raise ValueError(f"Weights cannot be negative, got {weight} for {name}")
+        self.states[name] = state
+        self.weights[name] = weight
+        self._probabilities = None
+
+    def capture(self, client: CommandClient, name: str, weight: float = 1.0) -> bytes:
+        """
+        Add the state the emulator behind `client` is in right now
+        """
+        slot = self.slot(name)
+        client.save_state(slot)
+        state = client.get_state(slot)
+        self.add(name, state, weight)
+        return state
+
+    @staticmethod
+    def slot(name: str) -> str:
+        return SLOT_PREFIX + name
+
+    def install(self, client: CommandClient) -> None:
+        """
+        Put every state in a slot on the emulator, ready for load_state
+        """
+        for name, state in self.states.items():
+            client.put_state(self.slot(name), state)
+
+    def sample(self, rng: np.random.Generator) -> str:
+        """
+        Name of a state drawn in proportion to the weights
+        """
+        if self._probabilities is None:
+            if not self.states:
+                raise ValueError("No start states to sample from")
+            self._names = list(self.states)
+            weights = np.array([self.weights[name] for name in self._names], dtype=np.float64)
+            if weights.sum() <= 0:
+                raise ValueError("Start state weights add up to zero")
+            self._probabilities = weights / weights.sum()
+        return self._names[rng.choice(len(self._names), p=self._probabilities)]
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name, state in self.states.items():
+            with open(os.path.join(path, f"{name}.state"), "wb") as state_file:
+                state_file.write(state)
+        with open(os.path.join(path, WEIGHTS_FILE), "w") as weights_file:
+            json.dump(self.weights, weights_file, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "StartStatePool":
+        """
+        Every `<name>.state` in the directory, weighted as in weights.json or 1.0
+        """
+        weights: T.Dict[str, float] = {}
+        weights_path = os.path.join(path, WEIGHTS_FILE)
+        if os.path.exists(weights_path):
+            with open(weights_path) as weights_file:
+                weights = json.load(weights_file)
+        pool = cls()
+        for filename in sorted(os.listdir(path)):
+            name, ext = os.path.splitext(filename)
+            if ext != ".state":
+                continue
+            with open(os.path.join(path, filename), "rb") as state_file:
+                pool.add(name, state_file.read(), weights.get(name, 1.0))
+        return pool
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def __repr__(self) -> str:
+        return f"StartStatePool({len(self)} states, {sum(map(len, self.states.values()))} bytes)"
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# nothing run from the tests may touch the vocabulary shipped in assets/
+os.environ.setdefault("BLUE_VOCAB_DIR", tempfile.mkdtemp(prefix="blue-vocab-"))
+
+from command import BUTTONS  # noqa: E402
+from command import CommandClient  # noqa: E402
+from standin import StandInServer  # noqa: E402
+from standin import WRAM_BASE  # noqa: E402
+from traces import Trace  # noqa: E402
+from traces import WRAM_SIZE  # noqa: E402
+
+
+def counting_trace(steps: int, offset: int) -> Trace:
+    """
+    Trace of A presses where the byte at `offset` counts the snapshots, so pressing
+    A on the stand-in walks through 0, 1, ... and wraps around
+    """
+    snapshots = np.zeros((steps, WRAM_SIZE), dtype=np.uint8)
+    snapshots[:, offset] = np.arange(steps)
+    return Trace(snapshots, np.full(steps, BUTTONS.index("A"), dtype=np.uint8))
+
+
+def serve(server: StandInServer):
+    server.start_in_thread()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+def connect(server: StandInServer):
+    client = CommandClient("localhost", server.port)
+    try:
+        yield client
+    finally:
+        client._disconnect()
+
+
+# byte of WRAM the counting trace counts in, well clear of anything MemoryMap watches
+COUNTER_OFFSET = 0x0100
+COUNTER_ADDR = WRAM_BASE + COUNTER_OFFSET
+
+
+@pytest.fixture
+def counting_server():
+    yield from serve(StandInServer(port=0, trace=counting_trace(4, COUNTER_OFFSET)))
+
+
+@pytest.fixture
+def counting_client(counting_server):
+    yield from connect(counting_server)
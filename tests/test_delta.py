@@ -0,0 +1,110 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from command import AsyncCommandClient
+from command import CommandClient
+from conftest import COUNTER_OFFSET
+from conftest import counting_trace
+from conftest import serve
+from delta import WRAM_SIZE
+from delta import WramMirror
+from delta import encode_delta
+from protocol import CommandError
+from protocol import ProtocolError
+from standin import StandInServer
+
+
+def random_wram(rng: np.random.Generator) -> bytes:
+    return rng.integers(0, 256, size=WRAM_SIZE, dtype=np.uint8).tobytes()
+
+
+def test_mirror_follows_deltas():
+    rng = np.random.default_rng(0)
+    mirror = WramMirror()
+    previous = random_wram(rng)
+    assert mirror.next_is_keyframe()
+    assert mirror.apply(encode_delta(None, previous)) == previous
+    for _ in range(5):
+        current = np.frombuffer(previous, dtype=np.uint8).copy()
+        current[rng.integers(0, WRAM_SIZE, size=3)] += 1
+        current = current.tobytes()
+        assert not mirror.next_is_keyframe()
+        assert mirror.apply(encode_delta(previous, current)) == current
+        previous = current
+
+
+def test_mirror_asks_for_a_keyframe_after_a_bad_delta():
+    rng = np.random.default_rng(1)
+    mirror = WramMirror()
+    wram = random_wram(rng)
+    with pytest.raises(ProtocolError):
+        mirror.apply(encode_delta(wram, wram))
+    assert mirror.next_is_keyframe()
+    mirror.apply(encode_delta(None, wram))
+    with pytest.raises(ProtocolError):
+        mirror.apply(encode_delta(wram, wram)[:-1] + b"\x00\x00")
+    assert mirror.next_is_keyframe()
+
+
+def test_mirror_takes_periodic_keyframes():
+    wram = bytes(WRAM_SIZE)
+    mirror = WramMirror(keyframe_interval=2)
+    assert mirror.next_is_keyframe()
+    mirror.apply(encode_delta(None, wram))
+    for _ in range(2):
+        assert not mirror.next_is_keyframe()
+        mirror.apply(encode_delta(wram, wram))
+    assert mirror.next_is_keyframe()
+
+
+class FailingKeyframes(StandInServer):
+    """
+    Answers keyframe requests with an error once it has taken the snapshot, as if
+    the reply was lost, `failures` times
+    """
+
+    def __init__(self, *args, failures: int = 1, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+
+    def handle(self, payload, conn):
+        reply = super().handle(payload, conn)
+        if payload.endswith(b":key") and self.failures:
+            self.failures -= 1
+            raise ValueError("keyframe lost")
+        return reply
+
+
+@pytest.fixture
+def failing_server():
+    yield from serve(FailingKeyframes(port=0, trace=counting_trace(4, COUNTER_OFFSET)))
+
+
+def test_sync_client_resyncs_after_a_failed_keyframe(failing_server):
+    client = CommandClient("localhost", failing_server.port)
+    try:
+        client.step("A")
+        with pytest.raises(CommandError):
+            client.dump_wram_delta()
+        assert client.dump_wram_delta()[COUNTER_OFFSET] == 1
+        client.step("A")
+        assert client.dump_wram_delta()[COUNTER_OFFSET] == 2
+        assert client.step("A", delta=True)[COUNTER_OFFSET] == 3
+    finally:
+        client._disconnect()
+
+
+def test_async_client_resyncs_after_a_failed_keyframe(failing_server):
+    async def run() -> None:
+        client = await AsyncCommandClient.open("localhost", failing_server.port)
+        try:
+            await client.step("A")
+            with pytest.raises(CommandError):
+                await client.dump_wram_delta()
+            assert (await client.dump_wram_delta())[COUNTER_OFFSET] == 1
+            assert (await client.step("A", delta=True))[COUNTER_OFFSET] == 2
+        finally:
+            await client.close()
+    asyncio.run(run())
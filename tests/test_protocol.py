@@ -0,0 +1,97 @@
+import socket
+
+import pytest
+
+from protocol import EVENT
+from protocol import HEADER
+from protocol import MAX_PAYLOAD
+from protocol import MSG_ERROR
+from protocol import MSG_EVENT
+from protocol import MSG_REPLY
+from protocol import MSG_REQUEST
+from protocol import Frame
+from protocol import FrameDecoder
+from protocol import ProtocolError
+from protocol import WatchEvent
+from protocol import next_request_id
+from protocol import pack_event
+from protocol import pack_frame
+from protocol import parse_event
+from protocol import recv_frame
+from protocol import unpack_header
+
+
+FRAMES = [
+    Frame(MSG_REQUEST, 1, b"dump_wram"),
+    Frame(MSG_REPLY, 1, bytes(range(256)) * 32),
+    Frame(MSG_ERROR, 0xFFFF, b"unknown button"),
+    Frame(MSG_EVENT, 0, pack_event(7, 0xD35E, b"\x01", b"\x02")),
+    Frame(MSG_REPLY, 2, b""),
+]
+
+
+def test_decoder_reassembles_frames_fed_byte_by_byte():
+    stream = b"".join(pack_frame(*frame) for frame in FRAMES)
+    decoder = FrameDecoder()
+    frames = []
+    for idx in range(len(stream)):
+        frames += decoder.feed(stream[idx:idx + 1])
+    assert frames == FRAMES
+
+
+def test_decoder_returns_every_frame_of_a_chunk():
+    stream = b"".join(pack_frame(*frame) for frame in FRAMES)
+    decoder = FrameDecoder()
+    assert decoder.feed(stream[:-1]) == FRAMES[:-1]
+    assert decoder.feed(stream[-1:]) == FRAMES[-1:]
+
+
+def test_recv_frame_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        for frame in FRAMES:
+            left.sendall(pack_frame(*frame))
+        assert [recv_frame(right) for _ in FRAMES] == FRAMES
+
+
+def test_recv_frame_on_closed_socket():
+    left, right = socket.socketpair()
+    with right:
+        left.sendall(pack_frame(MSG_REPLY, 1, b"truncated")[:-1])
+        left.close()
+        with pytest.raises(ConnectionError):
+            recv_frame(right)
+
+
+def test_unpack_header_rejects_garbage():
+    with pytest.raises(ProtocolError):
+        unpack_header(HEADER.pack(0x7F, 1, 0))
+    with pytest.raises(ProtocolError):
+        unpack_header(HEADER.pack(MSG_REPLY, 1, MAX_PAYLOAD + 1))
+
+
+def test_request_ids_skip_zero():
+    assert next_request_id(0) == 1
+    assert next_request_id(0xFFFE) == 0xFFFF
+    assert next_request_id(0xFFFF) == 1
+
+
+def test_event_round_trip():
+    payload = pack_event(1234, 0xD362, b"\x01\x02", b"\x03\x04")
+    assert parse_event(payload) == WatchEvent(1234, 0xD362, b"\x01\x02", b"\x03\x04")
+
+
+def test_parse_event_rejects_bad_lengths():
+    payload = pack_event(1, 0xD362, b"\x01\x02", b"\x03\x04")
+    with pytest.raises(ProtocolError):
+        parse_event(payload[:EVENT.size - 1])
+    with pytest.raises(ProtocolError):
+        parse_event(payload[:-1])
+    with pytest.raises(ProtocolError):
+        parse_event(payload + b"\x00")
+
+
+def test_request_round_trip_through_standin(counting_client):
+    assert counting_client.request(b"frame") == b"0"
+    counting_client.step("A", hold_frames=2, settle_frames=3)
+    assert counting_client.frame_count() == 5
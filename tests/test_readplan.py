@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from conftest import COUNTER_ADDR
+from conftest import COUNTER_OFFSET
+from memmap import MemoryMap
+from readplan import Span
+from readplan import compile_read_plan
+from readplan import merge_ranges
+from standin import WRAM_BASE
+
+
+def test_merge_ranges():
+    ranges = [(30, 40), (0, 10), (10, 12), (5, 8), (14, 20)]
+    assert merge_ranges(ranges) == [Span(0, 12), Span(14, 6), Span(30, 10)]
+    assert merge_ranges(ranges, gap=2) == [Span(0, 20), Span(30, 10)]
+
+
+def test_scatter_puts_bytes_back_where_they_were():
+    plan = compile_read_plan([(WRAM_BASE + 4, WRAM_BASE + 8), (WRAM_BASE + 100, WRAM_BASE + 102)], WRAM_BASE)
+    payload = bytes([1, 2, 3, 4, 5, 6])
+    wram = plan.scatter(payload)
+    assert len(wram) == plan.size
+    assert wram[4:8] == payload[:4]
+    assert wram[100:102] == payload[4:]
+    assert not any(wram[:4]) and not any(wram[8:100]) and not any(wram[102:])
+    assert np.array_equal(np.frombuffer(wram, dtype=np.uint8)[plan.offsets], np.frombuffer(payload, dtype=np.uint8))
+
+
+def test_scatter_leaves_the_rest_of_a_buffer_alone():
+    plan = compile_read_plan([(WRAM_BASE + 1, WRAM_BASE + 3)], WRAM_BASE)
+    buffer = bytearray(b"\xff" * plan.size)
+    assert plan.scatter(b"\x00\x00", buffer) is buffer
+    assert buffer[:4] == b"\xff\x00\x00\xff"
+
+
+def test_scatter_rejects_short_payloads():
+    plan = compile_read_plan([(WRAM_BASE, WRAM_BASE + 4)], WRAM_BASE)
+    with pytest.raises(ValueError):
+        plan.scatter(b"\x00" * 3)
+    with pytest.raises(ValueError):
+        plan.scatter_batch(np.zeros((2, 3), dtype=np.uint8))
+
+
+def test_scatter_batch_matches_scatter():
+    plan = MemoryMap.read_plan()
+    rows = np.random.default_rng(0).integers(0, 256, size=(3, plan.nbytes), dtype=np.uint8)
+    batch = plan.scatter_batch(rows)
+    for row, wram in zip(rows, batch):
+        assert wram.tobytes() == bytes(plan.scatter(row.tobytes()))
+
+
+def test_read_ranges_from_standin(counting_client):
+    plan = compile_read_plan([(COUNTER_ADDR - 2, COUNTER_ADDR + 2)], WRAM_BASE)
+    counting_client.step("A")
+    wram = counting_client.read_ranges(plan)
+    assert wram[COUNTER_OFFSET - 2:COUNTER_OFFSET + 2] == b"\x00\x00\x01\x00"
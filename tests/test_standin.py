@@ -0,0 +1,97 @@
+import pytest
+
+from conftest import COUNTER_ADDR
+from conftest import COUNTER_OFFSET
+from conftest import connect
+from conftest import counting_trace
+from conftest import serve
+from memmap import MemoryMap
+from protocol import CommandError
+from protocol import ProtocolError
+from readplan import compile_read_plan
+from standin import StandInServer
+from standin import WRAM_BASE
+from standin import WRAM_SIZE
+
+
+COUNTER_PLAN = compile_read_plan([(COUNTER_ADDR, COUNTER_ADDR + 1)], WRAM_BASE)
+
+
+@pytest.fixture(params=["still", "moving"])
+def settle_client(request):
+    # the counter only lands in what adaptive steps watch for the moving trace
+    offset = int(MemoryMap.settle_plan().offsets[0]) if request.param == "moving" else COUNTER_OFFSET
+    for server in serve(StandInServer(port=0, trace=counting_trace(4, offset))):
+        for client in connect(server):
+            client.settle_watch(MemoryMap.settle_plan(), stable_frames=3)
+            yield request.param, client
+
+
+def test_adaptive_settle_counts(settle_client):
+    kind, client = settle_client
+    for _ in range(3):
+        wram = client.step("A", hold_frames=2, settle_frames=12, adaptive=True)
+        assert len(wram) == WRAM_SIZE
+        # one frame to read the watch set, then the stable frames, or the whole cap
+        assert client.settle.last == (4 if kind == "still" else 12)
+    assert client.settle.steps == 3
+    assert client.frame_count() == 3 * (2 + client.settle.last)
+
+
+def test_adaptive_step_needs_a_settle_watch(counting_client):
+    with pytest.raises(CommandError):
+        counting_client.step("A", adaptive=True)
+
+
+def test_history_keeps_the_last_frames_oldest_first(counting_client):
+    counting_client.record_history(COUNTER_PLAN, frames=5)
+    for _ in range(4):
+        counting_client.step("A", hold_frames=1, settle_frames=1)
+    history = counting_client.dump_history()
+    assert history.frame == counting_client.frame_count() == 8
+    assert history.frames.tolist() == [4, 5, 6, 7, 8]
+    # two frames per step, the counter reads 1, 2, 3 then wraps to 0
+    assert history.rows[:, 0].tolist() == [2, 3, 3, 0, 0]
+    wram = COUNTER_PLAN.scatter_batch(history.rows)
+    assert wram[:, COUNTER_OFFSET].tolist() == [2, 3, 3, 0, 0]
+
+
+def test_history_is_forgotten_with_the_connection(counting_client):
+    counting_client.record_history(COUNTER_PLAN, frames=5)
+    counting_client.reset()
+    assert counting_client.history_plan is None
+    with pytest.raises(CommandError):
+        counting_client.request(b"dump_history")
+
+
+def test_history_reply_size_is_checked(counting_client):
+    counting_client.record_history(COUNTER_PLAN, frames=2)
+    counting_client.step("A")
+    counting_client.history_plan = compile_read_plan([(COUNTER_ADDR, COUNTER_ADDR + 2)], WRAM_BASE)
+    with pytest.raises(ProtocolError):
+        counting_client.dump_history()
+
+
+def test_watch_events():
+    addr = MemoryMap.event_plan().spans[0].addr
+    for server in serve(StandInServer(port=0, trace=counting_trace(4, addr - WRAM_BASE))):
+        for client in connect(server):
+            client.watch(MemoryMap.event_plan())
+            client.step("A", hold_frames=1, settle_frames=1)
+            client.step("A", hold_frames=1, settle_frames=1)
+            events = client.poll_events()
+            assert [(event.frame, event.addr, event.old, event.new) for event in events] == [
+                (2, addr, b"\x00", b"\x01"),
+                (4, addr, b"\x01", b"\x02"),
+            ]
+            assert client.poll_events() == []
+            # a reconnect watches the same spans again, on a stand-in emulator that
+            # starts over from the beginning of the trace
+            client.reset()
+            client.step("A", hold_frames=1, settle_frames=1)
+            assert [(event.old, event.new) for event in client.poll_events()] == [(b"\x00", b"\x01")]
+
+
+def test_no_events_without_a_watch(counting_client):
+    counting_client.step("A")
+    assert counting_client.poll_events() == []
@@ -0,0 +1,223 @@
+"""
+Tile vocabulary shared by every process on the machine
+
+Observations refer to tiles by compact ids, and every worker has to agree on what
+those ids mean, in this run and the next. Ids are therefore never handed out at
+runtime, where they would depend on which worker happens to see a tile first.
+They come from one of two places:
+
+- a vocabulary built ahead of time from recorded traces with
+  `python tilevocab.py build assets/tiles.vocab trace.npz ...`, most frequent
+  tiles first. It is a small file holding a dense table over all 65536 tile
+  values, which every process memory maps read only, so lookups are a gather from
+  one shared table. Tiles it does not know get the last id, reserved for them.
+- without such a file, a fixed hash of the tile value. Every process computes the
+  same ids, at the price of unrelated tiles sometimes sharing one.
+
+Vocabularies are looked up as `<name>.vocab` in BLUE_VOCAB_DIR, by default the
+assets directory next to this file.
+"""
+import argparse
+import os
+import typing as T
+
+import numpy as np
+
+
+MAGIC = 0x434F5654  # "TVOC"
+TABLE_ENTRIES = 1 << 16
+
+# uint32 magic, size, count, overflowed then the int16 table
+HEADER_WORDS = 4
+HEADER_BYTES = HEADER_WORDS * 4
+FILE_SIZE = HEADER_BYTES + TABLE_ENTRIES * 2
+# table entries that are not ids: never seen, and seen once the vocabulary was full.
+# Overflowed tiles are not pinned to the out of vocabulary id, so a vocabulary
+# rebuilt with room for them can still give them one.
+UNSEEN = -1
+OVERFLOWED = -2
+
+VOCAB_DIR = os.environ.get("BLUE_VOCAB_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+# Knuth's multiplicative hash, the top bits of the product are well mixed
+HASH_MULTIPLIER = 2654435761
+
+
+class TileVocabulary:
+    """
+    Compact ids for 16 bit tile values, from a file built ahead of time or learnt
+    in memory
+
+    A vocabulary in memory gives ids to tiles as it first sees them, which is what
+    `build` wants but only deterministic within one process. One read from a file
+    is read only and gives unknown tiles the out of vocabulary id.
+    """
+
+    def __init__(self, path: T.Optional[str] = None, size: int = 256) -> None:
+        if not 2 <= size <= 256:
+            raise ValueError(f"Vocabulary size must be between 2 and 256, got {size}")
+        self.path = path
+        if path is None:
+            buffer = np.zeros(FILE_SIZE, dtype=np.uint8)
+            self._header = buffer[:HEADER_BYTES].view(np.uint32)
+            self._header[:] = (MAGIC, size, 0, 0)
+            self.table = buffer[HEADER_BYTES:].view(np.int16)
+            self.table[:] = UNSEEN
+        else:
+            if os.path.getsize(path) != FILE_SIZE:
+                raise ValueError(f"{path} is not a tile vocabulary")
+            buffer = np.memmap(path, dtype=np.uint8, mode="r", shape=(FILE_SIZE,))
+            self._header = buffer[:HEADER_BYTES].view(np.uint32)
+            if self._header[0] != MAGIC:
+                raise ValueError(f"{path} is not a tile vocabulary")
+            self.table = buffer[HEADER_BYTES:].view(np.int16)
+        self.size = int(self._header[1])
+        self._warned = False
+
+    @property
+    def learning(self) -> bool:
+        return self.path is None
+
+    @property
+    def oov(self) -> int:
+        """
+        Id shared by every tile the vocabulary has no room for or does not know
+        """
+        return self.size - 1
+
+    @property
+    def count(self) -> int:
+        return int(self._header[2])
+
+    @property
+    def overflowed(self) -> int:
+        """
+        Number of distinct tiles seen after the vocabulary filled up
+        """
+        return int(self._header[3])
+
+    def encode(self, tiles: np.ndarray) -> np.ndarray:
+        ids = self.table[tiles]
+        if self.learning and (ids == UNSEEN).any():
+            self.assign(tiles[ids == UNSEEN])
+            ids = self.table[tiles]
+        ids[ids < 0] = self.oov
+        return ids.astype(np.uint8)
+
+    def assign(self, tiles: T.Iterable[int]) -> None:
+        """
+        Give ids to whichever of `tiles` do not have one yet, lowest tile value first
+        """
+        if not self.learning:
+            raise ValueError(f"{self.path} is read only, rebuild it to add tiles")
+        tiles = np.unique(np.asarray(tiles, dtype=np.uint16))
+        tiles = tiles[self.table[tiles] == UNSEEN]
+        if not len(tiles):
+            return
+        count = self.count
+        fits = min(len(tiles), self.oov - count)
+        self.table[tiles[:fits]] = np.arange(count, count + fits, dtype=np.int16)
+        if fits < len(tiles):
+            self.table[tiles[fits:]] = OVERFLOWED
+            self._header[3] += len(tiles) - fits
+            if not self._warned:
+                print(f"Tile vocabulary full, new tiles get id {self.oov}")
+                self._warned = True
+        self._header[2] = count + fits
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as vocab_file:
+            vocab_file.write(self._header.tobytes() + self.table.tobytes())
+
+    def __repr__(self) -> str:
+        where = self.path or "memory"
+        return f"TileVocabulary({where}, {self.count} of {self.size - 1} ids, {self.overflowed} overflowed)"
+
+
+class HashedVocabulary:
+    """
+    Ids straight from the tile value, for when there is no vocabulary file
+
+    The same everywhere without anything to share, but tiles collide.
+    """
+
+    def __init__(self, size: int = 256) -> None:
+        if not 2 <= size <= 256:
+            raise ValueError(f"Vocabulary size must be between 2 and 256, got {size}")
+        self.size = size
+
+    @property
+    def oov(self) -> int:
+        # nothing is out of vocabulary, but the id stays reserved as with a file
+        return self.size - 1
+
+    def encode(self, tiles: np.ndarray) -> np.ndarray:
+        mixed = (np.asarray(tiles, dtype=np.uint64) * HASH_MULTIPLIER) >> 16 & 0xFFFF
+        return (mixed % self.oov).astype(np.uint8)
+
+    def __repr__(self) -> str:
+        return f"HashedVocabulary({self.size - 1} ids)"
+
+
+Vocabulary = T.Union[TileVocabulary, HashedVocabulary]
+
+_SHARED: T.Dict[str, Vocabulary] = {}
+
+
+def shared_vocabulary(name: str = "tiles", size: int = 256) -> Vocabulary:
+    """
+    The vocabulary stored as `<name>.vocab` in BLUE_VOCAB_DIR, or hashed ids if
+    there is none, opened once per process
+    """
+    if name not in _SHARED:
+        path = os.path.join(VOCAB_DIR, f"{name}.vocab")
+        if os.path.exists(path):
+            _SHARED[name] = TileVocabulary(path)
+        else:
+            print(f"No {path}, hashing tiles to ids")
+            _SHARED[name] = HashedVocabulary(size)
+    return _SHARED[name]
+
+
+def build_vocabulary(path: str, snapshots: T.Iterable[np.ndarray], size: int = 256) -> TileVocabulary:
+    """
+    Write a vocabulary of every tile seen on screen in the snapshots, most frequent
+    first so rare tiles are the ones to end up out of vocabulary
+    """
+    from memmap import MemoryMap  # keep the vocabulary itself free of the memory map
+
+    counts = np.zeros(TABLE_ENTRIES, dtype=np.int64)
+    for batch in snapshots:
+        tiles = MemoryMap.decode_batch(batch)["tile"]["onscreen_tiles"]
+        words = tiles.reshape(len(tiles), -1, 2).astype(np.uint16)
+        counts += np.bincount((words[..., 0] << 8 | words[..., 1]).ravel(), minlength=TABLE_ENTRIES)
+
+    vocab = TileVocabulary(size=size)
+    seen = np.flatnonzero(counts)
+    # stable sort on -count keeps ties in tile value order, so the result is deterministic
+    for tile in seen[np.argsort(-counts[seen], kind="stable")]:
+        vocab.assign([tile])
+    vocab.save(path)
+    return TileVocabulary(path)
+
+
+if __name__ == "__main__":
+    from traces import load_trace
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    build = subparsers.add_parser("build", help="build a vocabulary from recorded traces")
+    build.add_argument("path")
+    build.add_argument("traces", nargs="+")
+    build.add_argument("--size", type=int, default=256)
+    show = subparsers.add_parser("show", help="print what a vocabulary holds")
+    show.add_argument("path")
+    args = parser.parse_args()
+
+    if args.mode == "build":
+        if os.path.exists(args.path):
+            parser.error(f"{args.path} already exists")
+        vocab = build_vocabulary(args.path, (load_trace(path).snapshots for path in args.traces), size=args.size)
+    else:
+        vocab = TileVocabulary(args.path)
+    print(vocab)
@@ -0,0 +1,102 @@
+"""
+Recorded WRAM traces
+
+A trace is the WRAM seen after each step of some run, along with the button that
+was pressed to get there. Traces are what the stand-in server plays back, so the
+transport can be benchmarked on realistic data without a running emulator.
+
+Record one from a live game with `python traces.py record trace.npz --steps 2000`
+"""
+import argparse
+import typing as T
+
+import numpy as np
+
+from command import BUTTONS
+from command import CommandClient
+from memmap import MemoryMap
+
+
+WRAM_SIZE = 8192
+
+
+class Trace(T.NamedTuple):
+    snapshots: np.ndarray  # (N, 8192) uint8
+    actions: np.ndarray  # (N,) uint8, index into BUTTONS of the button pressed before the snapshot
+
+    def __len__(self) -> int:
+        return len(self.snapshots)
+
+
+def save_trace(path: str, trace: Trace) -> None:
+    np.savez_compressed(path, snapshots=trace.snapshots, actions=trace.actions)
+
+
+def load_trace(path: str) -> Trace:
+    with np.load(path) as data:
+        return Trace(data["snapshots"], data["actions"])
+
+
+def record_trace(client: CommandClient, steps: int, seed: int = None) -> Trace:
+    """
+    Press random buttons and keep the WRAM after every step
+    """
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, len(BUTTONS), size=steps, dtype=np.uint8)
+    snapshots = np.empty((steps, WRAM_SIZE), dtype=np.uint8)
+    for idx, action in enumerate(actions):
+        snapshots[idx] = np.frombuffer(client.step(BUTTONS[action]), dtype=np.uint8)
+    return Trace(snapshots, actions)
+
+
+def synthetic_trace(steps: int, seed: int = 0) -> Trace:
+    """
+    Crude imitation of a recorded trace for when there is no emulator around
+
+    Every step touches a few timer bytes, directions usually move the player
+    (position, sprite table and a scrolled tile buffer) and A / B sometimes bring
+    up text. The point is a plausible number of changed bytes per step, not a
+    faithful game.
+    """
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, len(BUTTONS), size=steps, dtype=np.uint8)
+    snapshots = np.empty((steps, WRAM_SIZE), dtype=np.uint8)
+    wram = rng.integers(0, 256, size=WRAM_SIZE, dtype=np.uint8)
+    # outside what adaptive steps watch, or no step would ever look settled
+    timers = rng.choice(np.setdiff1d(np.arange(WRAM_SIZE), MemoryMap.settle_plan().offsets), size=6, replace=False)
+    for idx, action in enumerate(actions):
+        wram[timers] += 1
+        button = BUTTONS[action]
+        if button in "ULDR" and rng.random() < 0.6:
+            wram[0xD361 - 0xC000:0xD363 - 0xC000] += rng.integers(0, 2, size=2, dtype=np.uint8)
+            wram[0xC100 - 0xC000:0xC200 - 0xC000:0x10] += 1
+            wram[0xC204 - 0xC000:0xC300 - 0xC000:0x10] += 1
+            tiles = slice(0xC3A0 - 0xC000, 0xC508 - 0xC000)
+            wram[tiles] = np.roll(wram[tiles], 2 if button in "LR" else 20)
+        elif button in ("A", "B") and rng.random() < 0.3:
+            start = 0xC3A0 - 0xC000 + 20 * 12
+            wram[start:start + 20 * 6] = rng.integers(0x80, 0xBA, size=20 * 6, dtype=np.uint8)
+        snapshots[idx] = wram
+    return Trace(snapshots, actions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    record = subparsers.add_parser("record", help="record a trace from a running emulator")
+    record.add_argument("path")
+    record.add_argument("--steps", type=int, default=1000)
+    record.add_argument("--port", type=int, default=10018)
+    record.add_argument("--seed", type=int)
+    synth = subparsers.add_parser("synthetic", help="write a synthetic trace")
+    synth.add_argument("path")
+    synth.add_argument("--steps", type=int, default=1000)
+    synth.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        trace = record_trace(CommandClient("localhost", args.port), args.steps, seed=args.seed)
+    else:
+        trace = synthetic_trace(args.steps, seed=args.seed)
+    save_trace(args.path, trace)
+    print(f"Wrote {len(trace)} steps to {args.path}")
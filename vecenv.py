@@ -0,0 +1,226 @@
+"""
+Vectorized environment stepping many emulators at once
+
+Every emulator gets an AsyncCommandClient and all of them are driven by one event
+loop running on a background thread. step_async sends every step and returns right
+away, so the learner keeps working while the emulators run the frames; step_wait
+collects the results. No subprocess per environment.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import socket
+import threading
+import typing as T
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvIndices
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvObs
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvStepReturn
+
+from command import AsyncCommandClient
+from command import DEFAULT_HOLD_FRAMES
+from command import DEFAULT_SETTLE_FRAMES
+from framestack import ObservationBuffer
+from memo import MemoCache
+from memmap import MemoryMap
+from pool import EmulatorPool
+from pool import Lease
+from reward import ActionRanges
+from reward import RewardManager
+from spaces import create_reduced_space_from_mmap
+from spaces import populate_reduced_space_from_mmap
+
+
+class BlueVecEnv(VecEnv):
+    """
+    stable-baselines3 VecEnv over N emulators
+
+    Observations, rewards and dones are written into preallocated arrays, since
+    callers (PPO's rollout collection in particular) hold on to the previous
+    observation while the next step runs. Observations are views into a frame stack
+    ring that keeps the previous window intact; rewards and dones come in two sets
+    used alternately. The arrays returned by a step are only valid until the step
+    after.
+    """
+
+    def __init__(
+        self,
+        num_envs: T.Optional[int] = None,
+        ports: T.Optional[T.List[int]] = None,
+        pool: T.Optional[EmulatorPool] = None,
+        host: str = "localhost",
+        hold_frames: int = DEFAULT_HOLD_FRAMES,
+        settle_frames: int = DEFAULT_SETTLE_FRAMES,
+        timeout: float = 1.0,
+        frame_stack: int = 1,
+        cache_size: int = 0,
+        frame_lock: bool = False,
+        adaptive_settle: bool = False,
+    ) -> None:
+        """
+        Either pass ports explicitly, or leases for `num_envs` emulators are taken
+        from the pool (a default one scanning the port ladder if not given).
+        Observations stack the last `frame_stack` frames of every env. Observations
+        and pure rewards of the last `cache_size` distinct states per env are
+        memoized in caches all envs share, off (0) by default. With `frame_lock`
+        every emulator is paused between steps until the env is closed, see
+        CommandClient.set_frame_lock. With `adaptive_settle` steps settle only until
+        MemoryMap.SETTLE_WATCH holds still, `settle_frames` at most, and each env's
+        info has the frames it took under "settle_frames".
+        """
+        self._leases: T.List[Lease] = []
+        # the connections of the leases, shared with the async clients
+        sockets: T.List[T.Optional[socket.socket]] = []
+        if ports is None:
+            pool = pool or EmulatorPool(host)
+            if num_envs is None:
+                num_envs = len([instance for instance in pool.instances if instance.alive])
+            self._leases = [pool.acquire(timeout=timeout) for _ in range(num_envs)]
+            ports = [lease.port for lease in self._leases]
+            sockets = [lease.client._socket for lease in self._leases]
+        if num_envs is not None and num_envs != len(ports):
+            raise ValueError(f"Asked for {num_envs} envs but got {len(ports)} ports")
+        if not ports:
+            raise ValueError("No emulators to step")
+
+        self.hold_frames = hold_frames
+        self.settle_frames = settle_frames
+        self.read_plan = MemoryMap.read_plan()
+
+        # all sockets live on this loop, on its own thread so stepping overlaps the caller
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._clients: T.List[AsyncCommandClient] = self._run_all(
+            AsyncCommandClient.open(host, port, timeout=timeout, sock=sock)
+            for port, sock in itertools.zip_longest(ports, sockets)
+        ).result()
+        self.observation_cache = MemoCache(cache_size * len(ports)) if cache_size else None
+        self.reward_cache = MemoCache(4 * cache_size * len(ports)) if cache_size else None
+        self.frame_lock = frame_lock
+        if frame_lock:
+            self._run_all(client.set_frame_lock(True) for client in self._clients).result()
+        self.adaptive_settle = adaptive_settle
+        if adaptive_settle:
+            settle_plan = MemoryMap.settle_plan()
+            self._run_all(client.settle_watch(settle_plan) for client in self._clients).result()
+        self._reward_managers = [RewardManager(cache=self.reward_cache) for _ in ports]
+        self._mmaps = [MemoryMap() for _ in ports]
+        self._pending = None
+
+        mmap = MemoryMap.hydrate_from_memory(self._run(self._clients[0].read_ranges(self.read_plan)).result())
+        self._observations = ObservationBuffer(
+            create_reduced_space_from_mmap(mmap), frames=frame_stack, num_envs=len(ports)
+        )
+        self.render_mode = None
+        super().__init__(len(ports), self._observations.space, spaces.Discrete(31))
+
+        # two sets of reward and done buffers, flipped every step
+        self._buffers = [self._allocate_buffers() for _ in range(2)]
+        self._current = 0
+
+    def _allocate_buffers(self) -> T.Dict[str, T.Any]:
+        return {
+            "rewards": np.zeros(self.num_envs, dtype=np.float32),
+            "dones": np.zeros(self.num_envs, dtype=bool),
+        }
+
+    def _run(self, coro: T.Coroutine) -> "concurrent.futures.Future":
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _run_all(self, coros: T.Iterable[T.Coroutine]) -> "concurrent.futures.Future":
+        """
+        Run coroutines concurrently on the loop thread
+        """
+        async def gather() -> T.List[T.Any]:
+            return await asyncio.gather(*coros)
+        return self._run(gather())
+
+    async def _reset_one(self, idx: int) -> None:
+        mmap = self._mmaps[idx].update_from_memory(await self._clients[idx].read_ranges(self.read_plan))
+        populate_reduced_space_from_mmap(mmap, out=self._observations.slots(idx), cache=self.observation_cache)
+        self._observations.fill(idx)
+
+    async def _step_one(self, buffers: T.Dict[str, T.Any], infos: T.List[dict], idx: int, action: int) -> None:
+        button = ActionRanges.get_button(action)
+        client = self._clients[idx]
+        memory = await client.step(
+            button, self.hold_frames, self.settle_frames, plan=self.read_plan, adaptive=self.adaptive_settle
+        )
+        if self.adaptive_settle:
+            infos[idx]["settle_frames"] = client.settle.last
+        mmap = self._mmaps[idx].update_from_memory(memory)
+        populate_reduced_space_from_mmap(mmap, out=self._observations.slots(idx), cache=self.observation_cache)
+        buffers["rewards"][idx] = self._reward_managers[idx].calculate_reward(mmap, action)
+        # the game never ends, so neither do episodes
+        buffers["dones"][idx] = False
+
+    def _flip(self) -> T.Dict[str, T.Any]:
+        self._current ^= 1
+        return self._buffers[self._current]
+
+    def reset(self) -> VecEnvObs:
+        self._observations.advance()
+        self._run_all(self._reset_one(idx) for idx in range(self.num_envs)).result()
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        return self._observations.view()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        buffers = self._flip()
+        self._observations.advance()
+        infos = [{} for _ in range(self.num_envs)]
+        steps = (self._step_one(buffers, infos, idx, int(action)) for idx, action in enumerate(actions))
+        self._pending = (buffers, infos, self._run_all(steps))
+
+    def step_wait(self) -> VecEnvStepReturn:
+        buffers, infos, future = self._pending
+        self._pending = None
+        future.result()
+        return self._observations.view(), buffers["rewards"], buffers["dones"], infos
+
+    def cache_stats(self) -> T.Dict[str, T.Dict[str, float]]:
+        """
+        Hits and misses of the observation and reward caches
+        """
+        caches = {"observation": self.observation_cache, "reward": self.reward_cache}
+        return {name: cache.stats() for name, cache in caches.items() if cache is not None}
+
+    def close(self) -> None:
+        if self._pending is not None:
+            self._pending[2].result()
+            self._pending = None
+        if self.frame_lock:
+            # leased connections stay open, so the emulators would stay paused
+            self._run_all(client.set_frame_lock(False) for client in self._clients).result()
+        self._run_all(client.close() for client in self._clients).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        for lease in self._leases:
+            lease.release()
+        self._leases = []
+
+    # There are no per-environment gym.Env objects behind this, so the attribute
+    # and method passthroughs act on the vectorized env itself.
+
+    def _indices(self, indices: VecEnvIndices) -> T.List[int]:
+        if indices is None:
+            return list(range(self.num_envs))
+        if isinstance(indices, int):
+            return [indices]
+        return list(indices)
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> T.List[T.Any]:
+        return [getattr(self, attr_name) for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name: str, value: T.Any, indices: VecEnvIndices = None) -> None:
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> T.List[T.Any]:
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: T.Type, indices: VecEnvIndices = None) -> T.List[bool]:
+        return [False for _ in self._indices(indices)]